@@ -3,26 +3,59 @@
 # This file configures the Django admin interface for your models.
 # ======================================================================
 
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
 from django.utils.html import format_html
-from .models import UserProfile, Entry, RewardItem, RedeemedPoints, Device, DeviceLog
+from .models import UserProfile, Entry, RewardItem, RedeemedPoints, Device, DeviceLog, DeviceSensorSample, DeviceLogRollup, DetectionEvent, SiteStats, SequenceCounter
+from . import ledger, school_ids
 import uuid
 
 # Register your models here so they appear in the admin interface
 
+class UserProfileAdminForm(forms.ModelForm):
+    # The balance the form was rendered with, so save_model can tell whether it moved since
+    original_total_points = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['original_total_points'].initial = self.instance.total_points
+
+
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
-    list_display = ('user', 'school_id', 'user_type', 'total_points')
+    form = UserProfileAdminForm
+    list_display = ('user', 'school_id', 'user_type', 'total_points', 'total_bottles')
     search_fields = ('user__username', 'user__email', 'school_id', 'qr_code_data')
     list_filter = ('user_type', 'total_points')
     # school_id is FULLY EDITABLE - not in readonly_fields
-    fields = ('user', 'school_id', 'user_type', 'id_generation_helper', 'total_points', 'qr_code_data')
-    readonly_fields = ('id_generation_helper',)
+    fields = ('user', 'school_id', 'user_type', 'id_generation_helper', 'total_points', 'original_total_points', 'total_bottles', 'points_earned', 'points_redeemed', 'qr_code_data')
+    readonly_fields = ('id_generation_helper', 'total_bottles', 'points_earned', 'points_redeemed')
+    
+    def save_model(self, request, obj, form, change):
+        # The balance goes through core.ledger (compare-and-set, SiteStats, leaderboard);
+        # a full save would write the form's copy over any points credited meanwhile
+        new_points = obj.total_points
+        if not change:
+            obj.total_points = 0
+            super().save_model(request, obj, form, change)
+            if new_points:
+                ledger.set_points(obj, 0, new_points)
+            return
+        obj.save_details()
+        original_points = form.cleaned_data.get('original_total_points')
+        if original_points is None:
+            original_points = new_points
+        if new_points != original_points and not ledger.set_points(obj, original_points, new_points):
+            self.message_user(
+                request,
+                f'Points for {obj.user.username} changed while you were editing; balance was not updated.',
+                level=messages.WARNING,
+            )
     
     def id_generation_helper(self, obj):
         """Display helper text for ID generation"""
         if obj.user_type == 'student':
-            suggested_id = UserProfile.generate_school_id()
+            suggested_id = school_ids.peek('student')
             return format_html(
                 '<div style="background: #e7f3ff; padding: 10px; border-radius: 5px;">'
                 '<strong>📋 Student ID Format:</strong> C22-0369<br>'
@@ -33,7 +66,7 @@ class UserProfileAdmin(admin.ModelAdmin):
                 suggested_id
             )
         elif obj.user_type == 'teacher':
-            suggested_id = UserProfile.generate_faculty_id()
+            suggested_id = school_ids.peek('teacher')
             return format_html(
                 '<div style="background: #fff3e7; padding: 10px; border-radius: 5px;">'
                 '<strong>📋 Faculty ID Format:</strong> SMCIC-001-0001<br>'
@@ -61,7 +94,7 @@ class EntryAdmin(admin.ModelAdmin):
 
 @admin.register(RewardItem)
 class RewardItemAdmin(admin.ModelAdmin):
-    list_display = ('reward_name', 'points_required', 'image')
+    list_display = ('reward_name', 'points_required', 'times_redeemed', 'image')
     list_filter = ('points_required',)
     search_fields = ('reward_name',)
 
@@ -75,14 +108,24 @@ class RedeemedPointsAdmin(admin.ModelAdmin):
 @admin.register(Device)
 class DeviceAdmin(admin.ModelAdmin):
     list_display = ('device_name', 'device_id', 'location', 'status', 'total_bottles_processed', 'last_heartbeat')
-    list_filter = ('status', 'created_at', 'last_heartbeat')
+    list_filter = ('status', 'log_heartbeats', 'created_at', 'last_heartbeat')
     search_fields = ('device_name', 'device_id', 'location')
-    readonly_fields = ('api_key', 'total_bottles_processed', 'last_heartbeat', 'created_at', 'updated_at')
+    readonly_fields = ('api_key', 'total_bottles_processed', 'last_heartbeat', 'last_sensor_data', 'created_at', 'updated_at')
+    actions = ['regenerate_api_keys']
     
     def save_model(self, request, obj, form, change):
         if not change:  # If creating a new device
             obj.api_key = str(uuid.uuid4())
+        # Saving fires post_save, which drops the device from the API key cache
         super().save_model(request, obj, form, change)
+    
+    @admin.action(description="Regenerate API key for selected devices")
+    def regenerate_api_keys(self, request, queryset):
+        # Save each device individually so the API key cache is invalidated
+        for device in queryset:
+            device.api_key = str(uuid.uuid4())
+            device.save(update_fields=['api_key', 'updated_at'])
+        self.message_user(request, f"Regenerated API keys for {queryset.count()} device(s).")
 
 @admin.register(DeviceLog)
 class DeviceLogAdmin(admin.ModelAdmin):
@@ -94,3 +137,55 @@ class DeviceLogAdmin(admin.ModelAdmin):
     
     def has_add_permission(self, request):
         return False  # Logs are created automatically, not manually
+
+@admin.register(DeviceSensorSample)
+class DeviceSensorSampleAdmin(admin.ModelAdmin):
+    list_display = ('device', 'bucket_start', 'sample_count', 'last_values')
+    list_filter = ('device', 'bucket_start')
+    readonly_fields = ('device', 'bucket_start', 'sample_count', 'min_values', 'max_values', 'last_values', 'updated_at')
+    date_hierarchy = 'bucket_start'
+    
+    def has_add_permission(self, request):
+        return False  # Samples are written by device heartbeats
+
+@admin.register(DeviceLogRollup)
+class DeviceLogRollupAdmin(admin.ModelAdmin):
+    list_display = ('device', 'hour', 'log_type', 'sort_result', 'count')
+    list_filter = ('log_type', 'sort_result', 'device')
+    date_hierarchy = 'hour'
+    
+    def has_add_permission(self, request):
+        return False  # Rollups are written by the prune_device_logs command
+
+@admin.register(DetectionEvent)
+class DetectionEventAdmin(admin.ModelAdmin):
+    list_display = ('device', 'event_id', 'status_code', 'created_at')
+    list_filter = ('device',)
+    search_fields = ('event_id',)
+    readonly_fields = ('device', 'event_id', 'status_code', 'response', 'created_at')
+    date_hierarchy = 'created_at'
+    
+    def has_add_permission(self, request):
+        return False  # Recorded by the detection API; pruned by prune_device_logs
+
+@admin.register(SiteStats)
+class SiteStatsAdmin(admin.ModelAdmin):
+    list_display = ('total_bottles', 'total_points_earned', 'total_points_redeemed', 'devices_online', 'devices_total', 'updated_at')
+    
+    def has_add_permission(self, request):
+        return False  # Maintained automatically; use `manage.py rebuild_site_stats` to recompute
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SequenceCounter)
+class SequenceCounterAdmin(admin.ModelAdmin):
+    list_display = ('name', 'value', 'updated_at')
+    readonly_fields = ('name', 'value', 'updated_at')
+    
+    def has_add_permission(self, request):
+        return False  # Created on first use by core.sequences
+    
+    def has_change_permission(self, request, obj=None):
+        return False  # Lowering a counter would hand out duplicate numbers
@@ -0,0 +1,133 @@
+# ======================================================================
+# core/barcodes.py
+# Code128 rendering with a content-addressed cache. The image depends
+# only on the barcode data, the output format and the writer options,
+# so those are hashed into a key; rendered bytes are kept in a bounded
+# per-worker LRU and, if BARCODE_CACHE_DIR is set, in files on disk
+# shared by all workers. The key doubles as the HTTP ETag.
+# ======================================================================
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+from django.conf import settings
+
+# Bump when rendering changes in a way the options don't capture (invalidates all keys)
+RENDER_VERSION = 1
+BARCODE_CACHE_SIZE = getattr(settings, 'BARCODE_CACHE_SIZE', 512)
+BARCODE_CACHE_DIR = getattr(settings, 'BARCODE_CACHE_DIR', '')
+BARCODE_MAX_AGE = getattr(settings, 'BARCODE_MAX_AGE', 3600)
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+# Options for the student's scannable barcode (generate_qr_code_view)
+DISPLAY_OPTIONS = {
+    'module_width': 0.3,
+    'module_height': 15.0,
+    'quiet_zone': 6.5,
+    'font_size': 12,
+    'text_distance': 5.0,
+    'write_text': True,
+}
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # key -> (data bytes, rendered_at)
+_counters = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+
+
+def barcode_data(school_id):
+    """Hyphens are dropped; Code128 scans more reliably without them"""
+    return school_id.replace('-', '')
+
+
+def cache_key(data, fmt='png', options=None):
+    payload = json.dumps([RENDER_VERSION, fmt, data, options or {}], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def render(data, fmt='png', options=None):
+    """Render a Code128 barcode to PNG or SVG bytes (uncached)"""
+    import barcode
+    from barcode.writer import ImageWriter, SVGWriter
+
+    writer = ImageWriter() if fmt == 'png' else SVGWriter()
+    code128 = barcode.get_barcode_class('code128')
+    buffer = BytesIO()
+    code128(data, writer=writer).write(buffer, options=options or {})
+    return buffer.getvalue()
+
+
+def _disk_path(key, fmt):
+    return os.path.join(BARCODE_CACHE_DIR, key[:2], f'{key}.{fmt}')
+
+
+def _read_disk(key, fmt):
+    if not BARCODE_CACHE_DIR:
+        return None
+    path = _disk_path(key, fmt)
+    try:
+        with open(path, 'rb') as f:
+            return f.read(), os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _write_disk(key, fmt, content):
+    if not BARCODE_CACHE_DIR:
+        return
+    path = _disk_path(key, fmt)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so other workers never read a half-written file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+    except OSError:
+        pass  # the disk tier is best effort
+
+
+def get_barcode(data, fmt='png', options=None):
+    """Return (key, bytes, rendered_at) for a barcode, rendering it only on a cache miss"""
+    key = cache_key(data, fmt, options)
+    with _lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            _counters['hits'] += 1
+            return key, cached[0], cached[1]
+
+    cached = _read_disk(key, fmt)
+    if cached is not None:
+        counter = 'disk_hits'
+    else:
+        counter = 'misses'
+        cached = (render(data, fmt, options), time.time())
+        _write_disk(key, fmt, cached[0])
+
+    with _lock:
+        _counters[counter] += 1
+        _cache[key] = cached
+        _cache.move_to_end(key)
+        while len(_cache) > BARCODE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return key, cached[0], cached[1]
+
+
+def clear():
+    with _lock:
+        _cache.clear()
+
+
+def stats():
+    with _lock:
+        return dict(_counters, entries=len(_cache), size=BARCODE_CACHE_SIZE, disk=bool(BARCODE_CACHE_DIR))
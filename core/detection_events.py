@@ -0,0 +1,104 @@
+# ======================================================================
+# core/detection_events.py
+# Idempotent bottle detections. A device may send an `event_id` with a
+# detection; the first request with that ID is processed and its
+# response stored in DetectionEvent (unique per device + event ID) in
+# the same transaction as the points. A retry of the same event gets
+# the stored response back without touching the ledger, so firmware can
+# retry on timeout without double-crediting anyone. Recent responses are
+# also kept in a bounded per-worker cache, so most retries are answered
+# without a query. Old rows are deleted by prune_device_logs.
+# ======================================================================
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import DetectionEvent
+
+# How long a response stays in the per-worker replay cache (seconds), and how many are kept
+DETECTION_REPLAY_TTL = getattr(settings, 'DETECTION_REPLAY_TTL', 600)
+DETECTION_REPLAY_CACHE_SIZE = getattr(settings, 'DETECTION_REPLAY_CACHE_SIZE', 10000)
+MAX_EVENT_ID_LENGTH = DetectionEvent._meta.get_field('event_id').max_length
+
+_lock = threading.Lock()
+_recent = OrderedDict()  # (device pk, event_id) -> (status, response, expires_at), oldest first
+
+
+def clean_event_id(value):
+    """The event ID as a string, or None if absent; ValueError if it can't be one"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        raise ValueError('event_id must be a string or integer.')
+    value = str(value).strip()
+    if not value or len(value) > MAX_EVENT_ID_LENGTH:
+        raise ValueError(f'event_id must be 1-{MAX_EVENT_ID_LENGTH} characters.')
+    return value
+
+
+def cached(device_pk, event_id):
+    """(status, response) from this worker's replay cache, or None"""
+    with _lock:
+        hit = _recent.get((device_pk, event_id))
+        if hit is None:
+            return None
+        if hit[2] <= time.monotonic():
+            del _recent[(device_pk, event_id)]
+            return None
+        return hit[0], hit[1]
+
+
+def remember(device_pk, event_id, status, response):
+    with _lock:
+        _recent[(device_pk, event_id)] = (status, response, time.monotonic() + DETECTION_REPLAY_TTL)
+        _recent.move_to_end((device_pk, event_id))
+        while len(_recent) > DETECTION_REPLAY_CACHE_SIZE:
+            _recent.popitem(last=False)
+
+
+def _claim(device, event_id):
+    """Insert the event row; None if this device already reported the event"""
+    try:
+        with transaction.atomic():
+            return DetectionEvent.objects.create(device=device, event_id=event_id)
+    except IntegrityError:
+        return None
+
+
+def run_once(device, event_id, process):
+    """
+    Call process() -> (response dict, status) at most once per (device, event_id).
+    Returns (response, status, replayed). process() runs in the same transaction
+    as the event row, so if it raises, nothing is recorded and a retry runs it again.
+    """
+    hit = cached(device.pk, event_id)
+    if hit is not None:
+        return hit[1], hit[0], True
+
+    # On PostgreSQL a concurrent duplicate waits here for the first request to commit
+    with transaction.atomic():
+        event = _claim(device, event_id)
+        if event is not None:
+            response, status = process()
+            event.response = response
+            event.status_code = status
+            event.save(update_fields=['response', 'status_code'])
+
+    if event is None:
+        status, response = DetectionEvent.objects.filter(
+            device=device, event_id=event_id
+        ).values_list('status_code', 'response').get()
+        remember(device.pk, event_id, status, response)
+        return response, status, True
+
+    remember(device.pk, event_id, status, response)
+    return response, status, False
+
+
+def clear():
+    with _lock:
+        _recent.clear()
@@ -0,0 +1,113 @@
+# ======================================================================
+# core/device_cache.py
+# Per-worker cache of device API keys used by authenticate_device.
+# Every heartbeat/detection/verify call authenticates, so we keep the
+# key -> Device mapping in memory instead of querying it each time.
+# ======================================================================
+
+import copy
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import Device
+
+# How long a valid key stays cached, and how long an unknown key is remembered
+DEVICE_KEY_CACHE_TTL = getattr(settings, 'DEVICE_KEY_CACHE_TTL', 60)
+DEVICE_KEY_NEGATIVE_TTL = getattr(settings, 'DEVICE_KEY_NEGATIVE_TTL', 10)
+# Cap on remembered bad keys so a client spraying random keys can't grow memory
+MAX_NEGATIVE_ENTRIES = 1000
+
+_lock = threading.Lock()
+_devices = {}       # api_key -> (device, expires_at)
+_keys_by_pk = {}    # device pk -> api_key, used to invalidate on save/delete
+_bad_keys = {}      # api_key -> expires_at
+_counters = {'hits': 0, 'misses': 0, 'negative_hits': 0, 'invalidations': 0}
+# Bumped on every invalidation so a lookup racing with a save doesn't cache a stale row
+_generation = 0
+
+
+def get_device(api_key):
+    """
+    Return the Device owning api_key, or None.
+    A copy is returned so callers can't mutate the shared cached instance.
+    """
+    now = time.monotonic()
+    with _lock:
+        cached = _devices.get(api_key)
+        if cached and cached[1] > now:
+            _counters['hits'] += 1
+            return copy.copy(cached[0])
+        bad_until = _bad_keys.get(api_key)
+        if bad_until and bad_until > now:
+            _counters['negative_hits'] += 1
+            return None
+        _counters['misses'] += 1
+        generation = _generation
+
+    try:
+        device = Device.objects.get(api_key=api_key)
+    except Device.DoesNotExist:
+        with _lock:
+            if generation != _generation:
+                return None
+            if len(_bad_keys) >= MAX_NEGATIVE_ENTRIES:
+                _bad_keys.clear()
+            _bad_keys[api_key] = now + DEVICE_KEY_NEGATIVE_TTL
+        return None
+
+    with _lock:
+        if generation == _generation:
+            _devices[api_key] = (device, now + DEVICE_KEY_CACHE_TTL)
+            _keys_by_pk[device.pk] = api_key
+    return copy.copy(device)
+
+
+async def aget_device(api_key):
+    """get_device() for async views; a cache hit never leaves the event loop"""
+    with _lock:
+        cached = _devices.get(api_key)
+        if cached and cached[1] > time.monotonic():
+            _counters['hits'] += 1
+            return copy.copy(cached[0])
+    return await sync_to_async(get_device)(api_key)
+
+
+def invalidate_device(device):
+    """Drop any cached entry for this device, including its previous API key."""
+    global _generation
+    with _lock:
+        _generation += 1
+        old_key = _keys_by_pk.pop(device.pk, None)
+        if old_key:
+            _devices.pop(old_key, None)
+        if device.api_key:
+            _devices.pop(device.api_key, None)
+            # A freshly assigned key may have been remembered as bad
+            _bad_keys.pop(device.api_key, None)
+        _counters['invalidations'] += 1
+
+
+def clear():
+    """Empty the cache (counters are kept)."""
+    global _generation
+    with _lock:
+        _generation += 1
+        _devices.clear()
+        _keys_by_pk.clear()
+        _bad_keys.clear()
+
+
+def stats():
+    """Return hit/miss counters and current cache size for this worker."""
+    with _lock:
+        lookups = _counters['hits'] + _counters['negative_hits'] + _counters['misses']
+        return {
+            **_counters,
+            'cached_devices': len(_devices),
+            'cached_bad_keys': len(_bad_keys),
+            'hit_rate': round((_counters['hits'] + _counters['negative_hits']) / lookups * 100, 1) if lookups else 0,
+            'ttl': DEVICE_KEY_CACHE_TTL,
+        }
@@ -0,0 +1,237 @@
+# ======================================================================
+# core/enrollment.py
+# Bulk student/faculty import from CSV. Rows are validated up front
+# (one query per batch of usernames/IDs, never per row), missing IDs are
+# allocated in one block per prefix, passwords are hashed in a process
+# pool, and User/UserProfile/ScanKey rows are written with bulk_create
+# in a single transaction - no per-user signals or profile re-saves.
+# ======================================================================
+
+import csv
+import io
+import uuid
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from .models import UserProfile, ScanKey
+from . import id_suggestions, leaderboard, passwords, school_ids
+
+COLUMNS = ('username', 'first_name', 'last_name', 'email', 'school_id', 'user_type', 'password')
+USER_TYPES = ('student', 'teacher')
+LOOKUP_BATCH = 900  # stays under SQLite's bound-parameter limit
+IMPORT_WORKERS = passwords.HASH_WORKERS
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = []        # cleaned rows that passed validation
+        self.errors = []      # (line, column, message)
+        self.created = 0
+        self.allocated_ids = 0
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def error_report(self):
+        """The errors as CSV text (line,column,message)"""
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(['line', 'column', 'message'])
+        writer.writerows(self.errors)
+        return out.getvalue()
+
+
+def _existing(model_field, values):
+    """Which of values already exist, in batches"""
+    model, field = model_field
+    values = list(values)
+    found = set()
+    for start in range(0, len(values), LOOKUP_BATCH):
+        batch = values[start:start + LOOKUP_BATCH]
+        found.update(model.objects.filter(**{f'{field}__in': batch}).values_list(field, flat=True))
+    return found
+
+
+def validate(csv_file):
+    """Parse and check a CSV (text file object). Returns an ImportResult; nothing is written."""
+    result = ImportResult()
+    reader = csv.DictReader(csv_file)
+    header = [name.strip().lower() for name in (reader.fieldnames or [])]
+    unknown = set(header) - set(COLUMNS)
+    if unknown:
+        result.errors.append((1, ', '.join(sorted(unknown)), f"Unknown column(s); expected some of: {', '.join(COLUMNS)}"))
+        return result
+    if not {'first_name', 'last_name'} <= set(header):
+        result.errors.append((1, '', 'The first_name and last_name columns are required'))
+        return result
+    reader.fieldnames = header
+
+    seen_usernames = {}
+    seen_ids = {}
+    for line, raw in enumerate(reader, start=2):
+        row = {column: (raw.get(column) or '').strip() for column in COLUMNS}
+        row['line'] = line
+        row['user_type'] = (row['user_type'] or 'student').lower()
+        row['school_id'] = row['school_id'].upper()
+        errors = []
+        if not row['first_name'] or not row['last_name']:
+            errors.append(('first_name/last_name', 'First and last name are required'))
+        if row['user_type'] not in USER_TYPES:
+            errors.append(('user_type', f"Must be one of: {', '.join(USER_TYPES)}"))
+        if row['email']:
+            try:
+                validate_email(row['email'])
+            except ValidationError:
+                errors.append(('email', 'Not a valid email address'))
+        if not row['username'] and row['school_id']:
+            row['username'] = row['school_id'].replace('-', '')  # same default as create_test_user
+        if row['username']:
+            try:
+                User.username_validator(row['username'])
+            except ValidationError:
+                errors.append(('username', 'Letters, digits and @/./+/-/_ only'))
+            if row['username'].lower() in seen_usernames:
+                errors.append(('username', f"Duplicate of line {seen_usernames[row['username'].lower()]}"))
+            seen_usernames.setdefault(row['username'].lower(), line)
+        if row['school_id']:
+            if row['school_id'] in seen_ids:
+                errors.append(('school_id', f"Duplicate of line {seen_ids[row['school_id']]}"))
+            seen_ids.setdefault(row['school_id'], line)
+
+        for column, message in errors:
+            result.errors.append((line, column, message))
+        if not errors:
+            result.rows.append(row)
+
+    # Clashes with existing accounts: a few batched queries for the whole file
+    taken_usernames = {name.lower() for name in _existing((User, 'username'), [row['username'] for row in result.rows if row['username']])}
+    taken_ids = _existing((UserProfile, 'school_id'), [row['school_id'] for row in result.rows if row['school_id']])
+    clean = []
+    for row in result.rows:
+        if row['username'] and row['username'].lower() in taken_usernames:
+            result.errors.append((row['line'], 'username', f"User {row['username']} already exists"))
+        elif row['school_id'] in taken_ids:
+            result.errors.append((row['line'], 'school_id', f"ID {row['school_id']} is already assigned"))
+        else:
+            clean.append(row)
+    result.rows = clean
+    result.errors.sort()
+    return result
+
+
+def run_import(result, default_password='', workers=IMPORT_WORKERS, batch_size=1000):
+    """
+    Create the validated rows of an ImportResult. Rows with their own password
+    get their own hash (in the pool). Rows without one share a single hash of
+    default_password (it is the same known secret for all of them anyway), or
+    get an unusable password if there is no default. If a username made from an
+    allocated ID is already taken, or another import takes a username or ID
+    first, the clash is added to result.errors and nothing is written.
+    """
+    rows = result.rows
+    if not rows:
+        return result
+
+    # IDs for rows without one, a whole block per prefix
+    for user_type in USER_TYPES:
+        missing = [row for row in rows if not row['school_id'] and row['user_type'] == user_type]
+        if missing:
+            for row, school_id in zip(missing, school_ids.allocate(user_type, len(missing))):
+                row['school_id'] = school_id
+                if not row['username']:
+                    row['username'] = school_id.replace('-', '')
+                    row['username_from_id'] = True
+            result.allocated_ids += len(missing)
+
+    # Usernames made from the allocated IDs weren't known when the file was validated
+    derived = [row for row in rows if row.get('username_from_id')]
+    if derived:
+        taken = {name.lower() for name in _existing((User, 'username'), [row['username'] for row in derived])}
+        in_batch = {row['username'].lower(): row['line'] for row in rows if not row.get('username_from_id')}
+        for row in derived:
+            name = row['username'].lower()
+            if name in taken:
+                message = f"User {row['username']} (from the allocated ID {row['school_id']}) already exists; give this row a username"
+            elif name in in_batch:
+                message = f"Username {row['username']} (from the allocated ID {row['school_id']}) is also used on line {in_batch[name]}"
+            else:
+                in_batch[name] = row['line']
+                continue
+            result.errors.append((row['line'], 'username', message))
+        if result.errors:
+            result.errors.sort()
+            return result
+
+    own = [row for row in rows if row['password']]
+    for row, hashed in zip(own, passwords.hash_passwords([row['password'] for row in own], workers)):
+        row['password_hash'] = hashed
+    shared_hash = make_password(default_password if default_password else None)
+    for row in rows:
+        row.setdefault('password_hash', shared_hash)
+
+    try:
+        with transaction.atomic():
+            users = _write_rows(rows, batch_size)
+    except IntegrityError:
+        # Another import or an admin took one of these usernames or IDs since validation
+        _report_clashes(result, rows)
+        return result
+    id_suggestions.invalidate()
+    leaderboard.invalidate()
+    result.created = len(users)
+    return result
+
+
+def _write_rows(rows, batch_size):
+    users = User.objects.bulk_create([
+        User(
+            username=row['username'],
+            first_name=row['first_name'],
+            last_name=row['last_name'],
+            email=row['email'],
+            password=row['password_hash'],
+            is_staff=row['user_type'] == 'teacher',
+        )
+        for row in rows
+    ], batch_size=batch_size)
+    profiles = UserProfile.objects.bulk_create([
+        UserProfile(
+            user=user,
+            school_id=row['school_id'],
+            user_type=row['user_type'],
+            qr_code_data=f"SMC-USER-{user.username}-{str(uuid.uuid4())[:8]}",
+        )
+        for user, row in zip(users, rows)
+    ], batch_size=batch_size)
+    ScanKey.objects.bulk_create([
+        ScanKey(user_profile=profile, key=key, source=source, priority=priority)
+        for profile in profiles
+        for key, (source, priority) in profile.scan_key_candidates().items()
+    ], batch_size=batch_size)
+    return users
+
+
+def _report_clashes(result, rows):
+    taken_usernames = {name.lower() for name in _existing((User, 'username'), [row['username'] for row in rows])}
+    taken_ids = _existing((UserProfile, 'school_id'), [row['school_id'] for row in rows])
+    for row in rows:
+        if row['username'].lower() in taken_usernames:
+            result.errors.append((row['line'], 'username', f"User {row['username']} was created by someone else during the import"))
+        elif row['school_id'] in taken_ids:
+            result.errors.append((row['line'], 'school_id', f"ID {row['school_id']} was assigned by someone else during the import"))
+    if not result.errors:
+        result.errors.append((1, '', 'The import conflicted with another change to the users; try again'))
+    result.errors.sort()
+
+
+def import_csv(csv_file, dry_run=False, default_password='', workers=IMPORT_WORKERS):
+    """Validate, and unless dry_run or anything failed validation, import. Returns the ImportResult."""
+    result = validate(csv_file)
+    if dry_run or not result.ok:
+        return result
+    return run_import(result, default_password, workers)
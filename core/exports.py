@@ -0,0 +1,124 @@
+# ======================================================================
+# core/exports.py
+# Streaming CSV / NDJSON exports of entries, redemptions and device logs.
+# Rows are read in keyset chunks on (created_at, id) (see core/listing.py)
+# as plain tuples and encoded one chunk at a time, so memory stays flat
+# and no query or transaction stays open while a slow client downloads.
+# Used by the console export view and the export_data command.
+# ======================================================================
+
+import csv
+import json
+import zlib
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Entry, RedeemedPoints, DeviceLog
+from . import listing
+
+EXPORT_CHUNK_SIZE = 2000
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# kind -> (model, filters it accepts, [(column name, ORM lookup)])
+# The first two columns must be id and created_at (the keyset)
+EXPORTS = {
+    'entries': (Entry, listing.ENTRY_FILTERS, [
+        ('id', 'id'),
+        ('created_at', 'created_at'),
+        ('username', 'user_profile__user__username'),
+        ('school_id', 'user_profile__school_id'),
+        ('bottles', 'no_bottle'),
+        ('points', 'points'),
+    ]),
+    'redemptions': (RedeemedPoints, listing.REDEMPTION_FILTERS, [
+        ('id', 'id'),
+        ('created_at', 'created_at'),
+        ('receipt_number', 'receipt_number'),
+        ('username', 'user_profile__user__username'),
+        ('school_id', 'user_profile__school_id'),
+        ('reward', 'reward_item__reward_name'),
+        ('points', 'redeemed_points'),
+    ]),
+    'device-logs': (DeviceLog, listing.DEVICE_LOG_FILTERS, [
+        ('id', 'id'),
+        ('created_at', 'created_at'),
+        ('device_id', 'device__device_id'),
+        ('log_type', 'log_type'),
+        ('sort_result', 'sort_result'),
+        ('message', 'message'),
+        ('sensor_data', 'sensor_data'),
+    ]),
+}
+
+
+def iter_rows(kind, filters, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of row tuples, newest first, one keyset chunk at a time"""
+    model, _, columns = EXPORTS[kind]
+    queryset = listing.apply_filters(model.objects.all(), filters)
+    lookups = [lookup for _, lookup in columns]
+    last = None
+    while True:
+        chunk = queryset if last is None else listing.older_than(queryset, last[1], last[0])
+        rows = list(chunk.order_by('-created_at', '-id').values_list(*lookups)[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1]
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(',', ':'))
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(kind, filters, chunk_size=EXPORT_CHUNK_SIZE):
+    _, _, columns = EXPORTS[kind]
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in columns])
+    for rows in iter_rows(kind, filters, chunk_size):
+        yield ''.join(writer.writerow([_csv_value(value) for value in row]) for row in rows)
+
+
+def iter_ndjson(kind, filters, chunk_size=EXPORT_CHUNK_SIZE):
+    _, _, columns = EXPORTS[kind]
+    names = [name for name, _ in columns]
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for rows in iter_rows(kind, filters, chunk_size):
+        yield ''.join(encoder.encode(dict(zip(names, row))) + '\n' for row in rows)
+
+
+def iter_export(kind, filters, fmt='csv', compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the encoded export as bytes, gzip-compressed if asked"""
+    chunks = iter_csv(kind, filters, chunk_size) if fmt == 'csv' else iter_ndjson(kind, filters, chunk_size)
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode()
+        return
+    gzip = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        data = gzip.compress(chunk.encode())
+        if data:
+            yield data
+    yield gzip.flush()
+
+
+def filename(kind, fmt, compress):
+    return f"ecodrop-{kind}.{fmt}{'.gz' if compress else ''}"
@@ -0,0 +1,145 @@
+# ======================================================================
+# core/id_suggestions.py
+# "Did you mean" suggestions for scans that don't match any user.
+# Keeps a per-worker index over school IDs so a misread barcode costs a
+# few dictionary lookups instead of loading the whole roster.
+# ======================================================================
+
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import UserProfile, ScanKey
+
+# Rebuild the index at least this often even without local invalidation,
+# so profile changes made by other workers show up eventually
+SUGGESTION_INDEX_TTL = getattr(settings, 'SUGGESTION_INDEX_TTL', 300)
+MAX_SUGGESTIONS = 5
+
+
+class SuggestionIndex:
+    """
+    Prefix + single-edit (SymSpell style) index over normalized school IDs.
+    Lookups only touch the keys that share a prefix or a one-character
+    deletion with the query, so cost does not grow with the roster.
+    """
+
+    def __init__(self, school_ids):
+        self.display = {}   # normalized key -> school_id as stored
+        for school_id in school_ids:
+            key = ScanKey.normalize(school_id)
+            if key:
+                self.display.setdefault(key, school_id)
+        self.sorted_keys = sorted(self.display)
+        self.deletions = {}  # key with one char removed -> {original keys}
+        for key in self.sorted_keys:
+            for variant in _deletions(key):
+                self.deletions.setdefault(variant, set()).add(key)
+
+    def __len__(self):
+        return len(self.sorted_keys)
+
+    def suggest(self, code, limit=MAX_SUGGESTIONS):
+        query = ScanKey.normalize(code)
+        if not query:
+            return []
+
+        candidates = set()
+        # Query is missing a character, or has a substituted/swapped one
+        candidates.update(self.deletions.get(query, ()))
+        for variant in _deletions(query):
+            # Query has one extra character
+            if variant in self.display:
+                candidates.add(variant)
+            candidates.update(self.deletions.get(variant, ()))
+
+        # Neighbours in sort order share the longest prefix with the query
+        position = bisect.bisect_left(self.sorted_keys, query)
+        candidates.update(self.sorted_keys[max(0, position - limit):position + limit])
+
+        # Drop candidates that are nothing like the scan (e.g. prefix neighbours of garbage)
+        max_distance = max(2, len(query) // 3)
+        scored = [(_edit_distance(query, key), key) for key in candidates]
+        ranked = sorted(item for item in scored if item[0] <= max_distance)
+        return [self.display[key] for _, key in ranked[:limit]]
+
+
+def _deletions(key):
+    return {key[:i] + key[i + 1:] for i in range(len(key))}
+
+
+def _edit_distance(a, b):
+    """Plain Levenshtein distance; only ever run on a handful of short IDs"""
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        previous = current
+    return previous[-1]
+
+
+_lock = threading.Lock()
+_build_lock = threading.Lock()  # one rebuild at a time; other misses wait for its result
+_index = None
+_built_at = 0.0
+# Bumped by invalidate(), so a rebuild that overlapped a change is not kept
+_generation = 0
+
+
+def _current():
+    if _index is not None and time.monotonic() - _built_at < SUGGESTION_INDEX_TTL:
+        return _index
+    return None
+
+
+def get_index():
+    """Return the current index, rebuilding it (one query) if stale or invalidated"""
+    global _index, _built_at
+    with _lock:
+        index = _current()
+    if index is not None:
+        return index
+    with _build_lock:
+        with _lock:
+            # Rebuilt by another thread while we waited
+            index = _current()
+            generation = _generation
+        if index is not None:
+            return index
+        school_ids = UserProfile.objects.exclude(school_id__isnull=True).exclude(school_id='').values_list('school_id', flat=True)
+        index = SuggestionIndex(school_ids.iterator())
+        with _lock:
+            if _generation == generation:
+                _index = index
+                _built_at = time.monotonic()
+    return index
+
+
+def suggest(code, limit=MAX_SUGGESTIONS):
+    """Return up to `limit` school IDs closest to an unmatched scan"""
+    return get_index().suggest(code, limit)
+
+
+def _bump():
+    global _index, _generation
+    with _lock:
+        _index = None
+        _generation += 1
+
+
+def invalidate():
+    """
+    Force a rebuild on the next failed scan (called when a profile changes).
+    Done again once the current transaction commits, so an index rebuilt
+    from the rows as they were before the commit is thrown away too.
+    """
+    _bump()
+    transaction.on_commit(_bump)
@@ -0,0 +1,194 @@
+# ======================================================================
+# core/leaderboard.py
+# Points leaderboards (students, teachers, everyone) kept in memory per
+# worker as sorted lists of (-points, profile pk). Top-N is a slice and
+# "your rank" is one bisect, so neither sorts the profile table. core.ledger
+# pushes each committed balance change into the boards; changes made by
+# other workers show up when the boards are rebuilt (LEADERBOARD_TTL).
+# Adding, deleting or re-typing a profile invalidates this worker's boards.
+# ======================================================================
+
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import UserProfile
+
+LEADERBOARD_TTL = getattr(settings, 'LEADERBOARD_TTL', 60)
+BOARDS = ('student', 'teacher', 'all')
+
+
+class Board:
+    """One ranking. Ties share a rank (1, 2, 2, 4); equal scores are listed by profile pk."""
+
+    def __init__(self, rows=()):
+        self.points = dict(rows)  # profile pk -> points
+        self.keys = sorted((-points, pk) for pk, points in self.points.items())
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, pk):
+        return pk in self.points
+
+    def set(self, pk, points):
+        old = self.points.get(pk)
+        if old == points:
+            return
+        if old is not None:
+            del self.keys[bisect.bisect_left(self.keys, (-old, pk))]
+        bisect.insort(self.keys, (-points, pk))
+        self.points[pk] = points
+
+    def remove(self, pk):
+        old = self.points.pop(pk, None)
+        if old is not None:
+            del self.keys[bisect.bisect_left(self.keys, (-old, pk))]
+
+    def rank(self, pk):
+        """1-based rank, or None if pk is not on this board"""
+        points = self.points.get(pk)
+        if points is None:
+            return None
+        # (-points,) sorts before every (-points, pk), so this counts the strictly higher scores
+        return bisect.bisect_left(self.keys, (-points,)) + 1
+
+    def top(self, limit):
+        return [(pk, -negated) for negated, pk in self.keys[:limit]]
+
+
+def boards_for(is_staff, user_type):
+    """Which boards a profile belongs on (students are non-staff users, as on the dashboards)"""
+    names = ['all']
+    if not is_staff:
+        names.append('student')
+    if user_type == 'teacher':
+        names.append('teacher')
+    return names
+
+
+_lock = threading.Lock()
+_build_lock = threading.Lock()  # one rebuild at a time; other readers wait for its result
+_boards = None
+_built_at = 0.0
+# Bumped by invalidate(), so a rebuild that overlapped a membership change is not kept
+_generation = 0
+# Balances recorded while a rebuild runs, replayed onto the new boards; None when idle
+_pending = None
+
+
+def _build():
+    rows = {name: [] for name in BOARDS}
+    profiles = UserProfile.objects.values_list('pk', 'total_points', 'user__is_staff', 'user_type')
+    for pk, points, is_staff, user_type in profiles.iterator():
+        for name in boards_for(is_staff, user_type):
+            rows[name].append((pk, points))
+    return {name: Board(rows[name]) for name in BOARDS}
+
+
+def _current():
+    if _boards is not None and time.monotonic() - _built_at < LEADERBOARD_TTL:
+        return _boards
+    return None
+
+
+def _apply(boards, balances):
+    for ranking in boards.values():
+        for pk, points in balances.items():
+            if pk in ranking:
+                ranking.set(pk, points)
+
+
+def get_boards():
+    """Return the current boards, rebuilding them (one query) if stale or invalidated"""
+    global _boards, _built_at, _pending
+    with _lock:
+        boards = _current()
+    if boards is not None:
+        return boards
+    with _build_lock:
+        with _lock:
+            # Rebuilt by another thread while we waited
+            boards = _current()
+            generation = _generation
+            _pending = {}
+        if boards is not None:
+            return boards
+        try:
+            boards = _build()
+        except BaseException:
+            with _lock:
+                _pending = None
+            raise
+        with _lock:
+            # Changes committed while the query ran may not be in its rows
+            _apply(boards, _pending)
+            _pending = None
+            if _generation == generation:
+                _boards = boards
+                _built_at = time.monotonic()
+    return boards
+
+
+def top(board='all', limit=10):
+    """The top `limit` profiles (with user loaded) on a board, each with a .rank attribute"""
+    boards = get_boards()
+    with _lock:
+        ranked = [(pk, boards[board].rank(pk)) for pk, _ in boards[board].top(limit)]
+    profiles = UserProfile.objects.select_related('user').in_bulk([pk for pk, _ in ranked])
+    leaders = []
+    for pk, rank in ranked:
+        profile = profiles.get(pk)
+        if profile is not None:  # deleted since the last rebuild
+            profile.rank = rank
+            leaders.append(profile)
+    return leaders
+
+
+def rank(profile, board='all'):
+    """(rank, board size) for a profile, or (None, board size) if it isn't on that board"""
+    boards = get_boards()
+    member = board in boards_for(profile.user.is_staff, profile.user_type)
+    with _lock:
+        missing = member and profile.pk not in boards[board]
+    if missing:
+        # Created or re-typed since the last rebuild. The balance comes from the
+        # database: the request's copy may predate a change by another request.
+        points = UserProfile.objects.filter(pk=profile.pk).values_list('total_points', flat=True).first()
+        member = points is not None
+    with _lock:
+        ranking = boards[board]
+        if missing and member and profile.pk not in ranking:
+            ranking.set(profile.pk, points)
+        elif not member:
+            ranking.remove(profile.pk)
+        return ranking.rank(profile.pk), len(ranking)
+
+
+def record_balances(balances):
+    """New balances {profile pk: points} after a committed change (called by core.ledger)"""
+    with _lock:
+        if _pending is not None:
+            _pending.update(balances)
+        if _boards is not None:
+            _apply(_boards, balances)
+
+
+def _bump():
+    global _boards, _generation
+    with _lock:
+        _boards = None
+        _generation += 1
+
+
+def invalidate():
+    """
+    Rebuild on the next read (called when profiles are added, removed or change
+    board). Done again once the current transaction commits, so boards rebuilt
+    from the rows as they were before the commit are thrown away too.
+    """
+    _bump()
+    transaction.on_commit(_bump)
@@ -0,0 +1,139 @@
+# ======================================================================
+# core/ledger.py
+# All changes to UserProfile.total_points go through here.
+# Balances are changed with single conditional UPDATE statements
+# (total_points = total_points + n) inside the same transaction as the
+# Entry / RedeemedPoints row, so concurrent scans and redemptions can't
+# lose updates and a failed insert never leaves the balance changed.
+# Committed balance changes are also pushed into core.leaderboard.
+# ======================================================================
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import UserProfile, Entry, RedeemedPoints, RewardItem
+from . import leaderboard, stats
+
+
+def record_deposits(entries):
+    """
+    Insert unsaved Entry objects and credit their points, one UPDATE per profile.
+    Returns {profile pk: new balance}.
+    """
+    points_by_profile = {}
+    bottles_by_profile = {}
+    for entry in entries:
+        points_by_profile[entry.user_profile_id] = points_by_profile.get(entry.user_profile_id, 0) + entry.points
+        bottles_by_profile[entry.user_profile_id] = bottles_by_profile.get(entry.user_profile_id, 0) + entry.no_bottle
+
+    with transaction.atomic():
+        Entry.objects.bulk_create(entries)
+        for profile_pk, points in points_by_profile.items():
+            UserProfile.objects.filter(pk=profile_pk).update(
+                total_points=F('total_points') + points,
+                points_earned=F('points_earned') + points,
+                total_bottles=F('total_bottles') + bottles_by_profile[profile_pk]
+            )
+        stats.record_deposits(
+            entries=len(entries),
+            bottles=sum(entry.no_bottle for entry in entries),
+            points=sum(points_by_profile.values())
+        )
+        balances = dict(UserProfile.objects.filter(pk__in=points_by_profile).values_list('pk', 'total_points'))
+        transaction.on_commit(lambda: leaderboard.record_balances(balances))
+        return balances
+
+
+def award_points(profile, bottles, points):
+    """Record a single deposit. Returns (entry, new balance) and refreshes profile.total_points."""
+    entry = Entry(user_profile=profile, no_bottle=bottles, points=points)
+    balances = record_deposits([entry])
+    profile.total_points = balances[profile.pk]
+    profile.total_bottles += bottles
+    profile.points_earned += points
+    return entry, profile.total_points
+
+
+def redeem_reward(profile, reward):
+    """
+    Deduct reward.points_required only if the balance covers it, and create the
+    redemption in the same transaction. Returns the RedeemedPoints row, or None
+    if the user can't afford it.
+    """
+    cost = reward.points_required
+    with transaction.atomic():
+        deducted = UserProfile.objects.filter(pk=profile.pk, total_points__gte=cost).update(
+            total_points=F('total_points') - cost,
+            points_redeemed=F('points_redeemed') + cost
+        )
+        if not deducted:
+            return None
+        redemption = RedeemedPoints.objects.create(
+            user_profile=profile,
+            reward_item=reward,
+            redeemed_points=cost
+        )
+        RewardItem.objects.filter(pk=reward.pk).update(
+            times_redeemed=F('times_redeemed') + 1,
+            points_redeemed=F('points_redeemed') + cost
+        )
+        stats.record_redemption(cost)
+        # Read back under the row lock: concurrent deposits may have moved the balance
+        balance, redeemed = UserProfile.objects.filter(pk=profile.pk).values_list('total_points', 'points_redeemed').get()
+        transaction.on_commit(lambda: leaderboard.record_balances({profile.pk: balance}))
+    profile.total_points = balance
+    profile.points_redeemed = redeemed
+    return redemption
+
+
+def set_points(profile, expected, new_points):
+    """
+    Compare-and-set used by manual admin edits: only overwrite the balance if it
+    still equals what the admin was looking at. Returns True if it was applied.
+    """
+    new_points = max(0, new_points)
+    with transaction.atomic():
+        updated = UserProfile.objects.filter(pk=profile.pk, total_points=expected).update(total_points=new_points)
+        if updated:
+            stats.record_balance_adjustment(new_points - expected)
+            transaction.on_commit(lambda: leaderboard.record_balances({profile.pk: new_points}))
+    if updated:
+        profile.total_points = new_points
+    return bool(updated)
+
+
+def reconcile_lifetime_counters(dry_run=False, report=None):
+    """
+    Recompute total_bottles / points_earned / points_redeemed from the Entry and
+    RedeemedPoints rows and fix the profiles that drifted. Returns the number of
+    profiles that were (or, with dry_run, would be) changed.
+    """
+    deposits = {
+        row['user_profile_id']: row
+        for row in Entry.objects.values('user_profile_id').annotate(bottles=Sum('no_bottle'), points=Sum('points'))
+    }
+    redeemed = dict(
+        RedeemedPoints.objects.values('user_profile_id').annotate(points=Sum('redeemed_points')).values_list('user_profile_id', 'points')
+    )
+
+    mismatched = []
+    profiles = UserProfile.objects.select_related('user').only(
+        'id', 'user__username', 'total_bottles', 'points_earned', 'points_redeemed'
+    )
+    for profile in profiles.iterator(chunk_size=2000):
+        expected = {
+            'total_bottles': (deposits.get(profile.pk) or {}).get('bottles') or 0,
+            'points_earned': (deposits.get(profile.pk) or {}).get('points') or 0,
+            'points_redeemed': redeemed.get(profile.pk) or 0,
+        }
+        actual = {field: getattr(profile, field) for field in expected}
+        if actual != expected:
+            if report:
+                report(profile.user.username, actual, expected)
+            for field, value in expected.items():
+                setattr(profile, field, value)
+            mismatched.append(profile)
+
+    if not dry_run:
+        UserProfile.objects.bulk_update(mismatched, ['total_bottles', 'points_earned', 'points_redeemed'], batch_size=500)
+    return len(mismatched)
@@ -0,0 +1,191 @@
+# ======================================================================
+# core/listing.py
+# Keyset (cursor) pagination and server-side filters for the console
+# transaction, redemption and device-log lists. Pages are ordered by
+# (created_at, id) descending, and a cursor is the (created_at, id) of the
+# last row shown, so page 10,000 costs one index range scan, the same as
+# page 1 (no OFFSET).
+# ======================================================================
+
+import base64
+from datetime import datetime, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.http import urlencode
+
+from .models import Device, DeviceLog, ScanKey
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Filters each list accepts (GET parameter names)
+ENTRY_FILTERS = ('user', 'date_from', 'date_to')
+REDEMPTION_FILTERS = ('user', 'date_from', 'date_to')
+DEVICE_LOG_FILTERS = ('device', 'log_type', 'sort_result', 'date_from', 'date_to')
+
+
+def encode_cursor(obj):
+    raw = f"{obj.created_at.isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    """Return (created_at, id) from a cursor string, or None if it's missing or malformed"""
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def parse_filters(params, allowed):
+    """Clean the allowed filter values out of a QueryDict; blank or invalid values are dropped"""
+    filters = {}
+    for name in allowed:
+        value = (params.get(name) or '').strip()
+        if not value:
+            continue
+        if name in ('date_from', 'date_to'):
+            if parse_date(value) is None:
+                continue
+        elif name == 'log_type' and value not in dict(DeviceLog.LOG_TYPE_CHOICES):
+            continue
+        elif name == 'sort_result' and value not in dict(DeviceLog.SORT_RESULT_CHOICES):
+            continue
+        filters[name] = value
+    return filters
+
+
+def _start_of_day(value):
+    day = parse_date(value)
+    return timezone.make_aware(datetime(day.year, day.month, day.day))
+
+
+def apply_filters(queryset, filters):
+    """
+    Apply parse_filters() output to an Entry, RedeemedPoints or DeviceLog queryset.
+    user/device are resolved to a single pk first, so the filter hits the
+    (user_profile, created_at) / (device, created_at) indexes instead of a join.
+    """
+    if 'user' in filters:
+        profile, _ = ScanKey.resolve(filters['user'])
+        if profile is None:
+            return queryset.none()
+        queryset = queryset.filter(user_profile=profile)
+    if 'device' in filters:
+        value = filters['device']
+        device = Device.objects.filter(device_id=value).only('pk').first()
+        if device is None and value.isdigit():
+            device = Device.objects.filter(pk=value).only('pk').first()
+        if device is None:
+            return queryset.none()
+        queryset = queryset.filter(device=device)
+    if 'log_type' in filters:
+        queryset = queryset.filter(log_type=filters['log_type'])
+    if 'sort_result' in filters:
+        queryset = queryset.filter(sort_result=filters['sort_result'])
+    if 'date_from' in filters:
+        queryset = queryset.filter(created_at__gte=_start_of_day(filters['date_from']))
+    if 'date_to' in filters:
+        # Inclusive of the whole day
+        queryset = queryset.filter(created_at__lt=_start_of_day(filters['date_to']) + timedelta(days=1))
+    return queryset
+
+
+class Page:
+    """One page of results plus the cursors for the neighbouring pages"""
+
+    def __init__(self, items, next_cursor, prev_cursor, page_size, query):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.page_size = page_size
+        self.query = query
+
+    @property
+    def query_string(self):
+        return urlencode(self.query)
+
+    @property
+    def next_query(self):
+        return urlencode({**self.query, 'after': self.next_cursor}) if self.next_cursor else ''
+
+    @property
+    def prev_query(self):
+        return urlencode({**self.query, 'before': self.prev_cursor}) if self.prev_cursor else ''
+
+
+def page_size_from(params):
+    try:
+        size = int(params.get('per_page') or PAGE_SIZE)
+    except ValueError:
+        size = PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def older_than(queryset, created_at, pk):
+    """Rows that come after (created_at, pk) in newest-first order"""
+    return (
+        queryset.filter(created_at__lte=created_at)
+        .filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    )
+
+
+def keyset_page(queryset, after=None, before=None, page_size=PAGE_SIZE, query=None):
+    """
+    Return a Page of queryset ordered newest first by (created_at, id).
+    `after` continues to older rows, `before` goes back to newer ones.
+    The extra created_at__lte / __gte bound gives the database an index range
+    to seek to; the OR only breaks ties between rows with the same timestamp.
+    """
+    query = {key: value for key, value in (query or {}).items() if value}
+    if page_size != PAGE_SIZE:
+        query['per_page'] = page_size
+    after = decode_cursor(after)
+    before = decode_cursor(before) if after is None else None
+
+    if before is not None:
+        created_at, pk = before
+        rows = list(
+            queryset.filter(created_at__gte=created_at)
+            .filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+            .order_by('created_at', 'id')[:page_size + 1]
+        )
+        if len(rows) <= page_size:
+            # Back at the newest rows: show a full first page instead of a short one
+            return keyset_page(queryset, page_size=page_size, query=query)
+        items = list(reversed(rows[:page_size]))
+        has_newer = has_older = True
+    else:
+        if after is not None:
+            queryset = older_than(queryset, *after)
+        rows = list(queryset.order_by('-created_at', '-id')[:page_size + 1])
+        has_older = len(rows) > page_size
+        items = rows[:page_size]
+        has_newer = after is not None
+
+    return Page(
+        items=items,
+        next_cursor=encode_cursor(items[-1]) if items and has_older else None,
+        prev_cursor=encode_cursor(items[0]) if items and has_newer else None,
+        page_size=page_size,
+        query=query,
+    )
+
+
+def paginate_request(request, queryset, allowed_filters):
+    """Filter and paginate a queryset from the request's GET parameters. Returns (page, filters)."""
+    filters = parse_filters(request.GET, allowed_filters)
+    page = keyset_page(
+        apply_filters(queryset, filters),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        page_size=page_size_from(request.GET),
+        query=filters,
+    )
+    return page, filters
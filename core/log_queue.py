@@ -0,0 +1,274 @@
+# ======================================================================
+# core/log_queue.py
+# Write-behind queue for DeviceLog rows. The device endpoints append
+# their log records to a local SQLite file (WAL, fsync on commit, so a
+# record is on disk before the device gets its response) instead of
+# inserting into the main database while the firmware waits. A drain
+# loop claims queued records in batches and bulk-inserts them; claims
+# left behind by a crashed drainer are picked up again after
+# DEVICE_LOG_QUEUE_LEASE seconds, so delivery is at-least-once. Records
+# the database rejects are set aside in a `failed` table instead of
+# blocking the queue; while the database itself is down or locked they
+# stay queued. Points and Entry rows are never queued.
+# ======================================================================
+
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Device, DeviceLog
+
+DEVICE_LOG_QUEUE = getattr(settings, 'DEVICE_LOG_QUEUE', False)
+DEVICE_LOG_QUEUE_PATH = str(getattr(settings, 'DEVICE_LOG_QUEUE_PATH', 'device_log_queue.sqlite3'))
+# Drain from a thread in each web worker; off = run `manage.py drain_device_logs` instead
+DEVICE_LOG_QUEUE_THREAD = getattr(settings, 'DEVICE_LOG_QUEUE_THREAD', True)
+DEVICE_LOG_QUEUE_BATCH = getattr(settings, 'DEVICE_LOG_QUEUE_BATCH', 500)
+DEVICE_LOG_QUEUE_INTERVAL = getattr(settings, 'DEVICE_LOG_QUEUE_INTERVAL', 1.0)
+DEVICE_LOG_QUEUE_LEASE = getattr(settings, 'DEVICE_LOG_QUEUE_LEASE', 300)
+
+# Errors that mean the record itself is bad, so retrying won't help. Anything else
+# (OperationalError, InterfaceError: database locked or gone) leaves it queued.
+REJECTED = (DataError, IntegrityError, KeyError, TypeError, ValueError)
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS queue ('
+    ' id INTEGER PRIMARY KEY AUTOINCREMENT, record TEXT NOT NULL, claimed_by TEXT, claimed_at REAL)',
+    'CREATE TABLE IF NOT EXISTS failed ('
+    ' id INTEGER PRIMARY KEY, record TEXT NOT NULL, error TEXT NOT NULL, failed_at REAL NOT NULL)',
+)
+
+_local = threading.local()
+
+
+def _connect():
+    """This thread's connection to the queue file (sqlite3 connections can't be shared between threads)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid():
+        conn = sqlite3.connect(DEVICE_LOG_QUEUE_PATH, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # FULL: every commit is fsynced, so a queued record survives a crash or power cut
+        conn.execute('PRAGMA synchronous=FULL')
+        for statement in SCHEMA:
+            conn.execute(statement)
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+
+def _write(conn, statements):
+    """Run (sql, params) pairs in one write transaction"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for sql, params in statements:
+            conn.execute(sql, params)
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def record_for(device, log_type, message='', sort_result=None, sensor_data=None):
+    return {
+        'device_id': device.pk,
+        'log_type': log_type,
+        'sort_result': sort_result,
+        'sensor_data': sensor_data,
+        'message': message,
+        'created_at': timezone.now().isoformat(),
+    }
+
+
+def enqueue(records):
+    """Durably append log records (dicts from record_for) to the queue"""
+    _write(_connect(), [('INSERT INTO queue (record) VALUES (?)', (json.dumps(record),)) for record in records])
+    if DEVICE_LOG_QUEUE_THREAD:
+        start_drain_thread()
+
+
+def log(device, log_type, message='', sort_result=None, sensor_data=None):
+    """Record a DeviceLog row: queued when DEVICE_LOG_QUEUE is on, otherwise inserted now"""
+    if not DEVICE_LOG_QUEUE:
+        return DeviceLog.objects.create(
+            device=device, log_type=log_type, message=message, sort_result=sort_result, sensor_data=sensor_data
+        )
+    enqueue([record_for(device, log_type, message, sort_result, sensor_data)])
+
+
+async def alog(device, log_type, message='', sort_result=None, sensor_data=None):
+    """log() for async views; the fsync happens off the event loop"""
+    if not DEVICE_LOG_QUEUE:
+        return await DeviceLog.objects.acreate(
+            device=device, log_type=log_type, message=message, sort_result=sort_result, sensor_data=sensor_data
+        )
+    await sync_to_async(enqueue, thread_sensitive=False)([record_for(device, log_type, message, sort_result, sensor_data)])
+
+
+def log_many(logs):
+    """Queue (or bulk insert) unsaved DeviceLog instances"""
+    if not DEVICE_LOG_QUEUE:
+        return DeviceLog.objects.bulk_create(logs)
+    if logs:
+        enqueue([
+            record_for(entry.device, entry.log_type, entry.message, entry.sort_result, entry.sensor_data)
+            for entry in logs
+        ])
+
+
+def _claim(conn, limit):
+    token = uuid.uuid4().hex
+    now = time.time()
+    _write(conn, [(
+        'UPDATE queue SET claimed_by = ?, claimed_at = ? WHERE id IN ('
+        ' SELECT id FROM queue WHERE claimed_by IS NULL OR claimed_at < ? ORDER BY id LIMIT ?)',
+        (token, now, now - DEVICE_LOG_QUEUE_LEASE, limit),
+    )])
+    rows = conn.execute('SELECT id, record FROM queue WHERE claimed_by = ? ORDER BY id', (token,)).fetchall()
+    return token, rows
+
+
+def _to_log(record):
+    return DeviceLog(
+        device_id=record['device_id'],
+        log_type=record['log_type'],
+        sort_result=record['sort_result'],
+        sensor_data=record['sensor_data'],
+        message=record['message'],
+        created_at=parse_datetime(record['created_at']),
+    )
+
+
+def _release(conn, token, done=()):
+    """Hand a claim back, dropping the records already inserted, so the rest are retried"""
+    statements = [('DELETE FROM queue WHERE id = ?', (row_id,)) for row_id in done]
+    statements.append(('UPDATE queue SET claimed_by = NULL, claimed_at = NULL WHERE claimed_by = ?', (token,)))
+    _write(conn, statements)
+
+
+def drain_batch(limit=DEVICE_LOG_QUEUE_BATCH):
+    """
+    Claim up to `limit` queued records and insert them. Returns
+    (inserted, dropped, failed); dropped are logs of devices deleted since.
+    Records the database rejects are set aside; if the database itself is
+    failing (locked, unreachable), the claim is released and the error raised.
+    """
+    conn = _connect()
+    token, rows = _claim(conn, limit)
+    if not rows:
+        return 0, 0, 0
+
+    records = [(row_id, json.loads(record)) for row_id, record in rows]
+    failures = []
+    done = []
+    try:
+        existing = set(Device.objects.filter(
+            pk__in={record['device_id'] for _, record in records}
+        ).values_list('pk', flat=True))
+        kept = [(row_id, record) for row_id, record in records if record['device_id'] in existing]
+        try:
+            with transaction.atomic():
+                DeviceLog.objects.bulk_create([_to_log(record) for _, record in kept])
+        except REJECTED:
+            # One bad record (e.g. an over-long sort_result) shouldn't hold up the rest
+            for row_id, record in kept:
+                try:
+                    with transaction.atomic():
+                        _to_log(record).save()
+                except REJECTED as e:
+                    failures.append((row_id, e))
+                else:
+                    done.append(row_id)
+    except Exception:
+        _release(conn, token, done)
+        raise
+
+    statements = [
+        ('INSERT INTO failed (id, record, error, failed_at) SELECT id, record, ?, ? FROM queue WHERE id = ?',
+         (str(error)[:500], time.time(), row_id))
+        for row_id, error in failures
+    ]
+    statements.append(('DELETE FROM queue WHERE claimed_by = ?', (token,)))
+    _write(conn, statements)
+    return len(kept) - len(failures), len(records) - len(kept), len(failures)
+
+
+def drain(limit=DEVICE_LOG_QUEUE_BATCH, max_batches=None):
+    """Drain until the queue is empty (or max_batches). Returns (inserted, dropped, failed) totals."""
+    totals = [0, 0, 0]
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        counts = drain_batch(limit)
+        if not any(counts):
+            break
+        totals = [total + count for total, count in zip(totals, counts)]
+        batches += 1
+    return tuple(totals)
+
+
+def status():
+    conn = _connect()
+    pending, claimed = conn.execute(
+        'SELECT COUNT(*), COUNT(claimed_by) FROM queue'
+    ).fetchone()
+    failed = conn.execute('SELECT COUNT(*) FROM failed').fetchone()[0]
+    return {'pending': pending, 'claimed': claimed, 'failed': failed, 'path': DEVICE_LOG_QUEUE_PATH}
+
+
+def failed_records(limit=20):
+    rows = _connect().execute('SELECT id, record, error, failed_at FROM failed ORDER BY id LIMIT ?', (limit,))
+    return [{'id': row_id, 'record': json.loads(record), 'error': error, 'failed_at': failed_at}
+            for row_id, record, error, failed_at in rows]
+
+
+def retry_failed():
+    """Put set-aside records back on the queue. Returns how many."""
+    conn = _connect()
+    count = conn.execute('SELECT COUNT(*) FROM failed').fetchone()[0]
+    _write(conn, [
+        ('INSERT INTO queue (record) SELECT record FROM failed ORDER BY id', ()),
+        ('DELETE FROM failed', ()),
+    ])
+    return count
+
+
+_drain_lock = threading.Lock()
+_drain_pid = None
+
+
+def _drain_forever():
+    while True:
+        time.sleep(DEVICE_LOG_QUEUE_INTERVAL)
+        close_old_connections()
+        try:
+            drain()
+        except Exception as e:  # keep the thread alive; the records stay queued
+            print(f"ERROR draining device log queue: {e}")
+
+
+def _drain_at_exit():
+    try:
+        drain()
+    except Exception:
+        pass
+
+
+def start_drain_thread():
+    """Start this process's drain thread once (again after a fork)"""
+    global _drain_pid
+    if _drain_pid == os.getpid():
+        return
+    with _drain_lock:
+        if _drain_pid == os.getpid():
+            return
+        threading.Thread(target=_drain_forever, name='device-log-drain', daemon=True).start()
+        if _drain_pid is None:
+            atexit.register(_drain_at_exit)
+        _drain_pid = os.getpid()
@@ -0,0 +1,190 @@
+import asyncio
+import contextlib
+import io
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import ThreadSensitiveContext
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncRequestFactory, RequestFactory
+from core import stats as site_stats
+from core import views
+from core.models import Device
+
+DEVICE_ID = 'BENCH-ASYNC'
+USER_PREFIX = 'bench-async-'
+
+
+def summarize(latencies, failures, elapsed):
+    latencies = sorted(latencies)
+    count = len(latencies)
+
+    def percentile(fraction):
+        return latencies[min(count - 1, int(fraction * count))] if count else 0
+
+    return {
+        'requests': count,
+        'per_second': count / elapsed if elapsed else 0,
+        'p50': percentile(0.50),
+        'p99': percentile(0.99),
+        'failures': failures,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the sync and async device API views under the same load: C virtual devices each '
+        'send verify + detection requests. The sync views are served by a fixed pool of worker threads '
+        '(like gunicorn --threads), the async views by one event loop (like an ASGI worker). '
+        '--db-latency adds a delay to every query to stand in for a database across the network, '
+        'which is where async pays off. Use PostgreSQL for meaningful numbers (SQLite serializes writers).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=50, help='Concurrent virtual devices (default: 50)')
+        parser.add_argument('--rounds', type=int, default=10, help='verify + detection rounds per device (default: 10)')
+        parser.add_argument('--threads', type=int, default=4, help='Worker threads serving the sync views (default: 4)')
+        parser.add_argument('--db-latency', type=float, default=2.0, help='Milliseconds added to every query (default: 2)')
+        parser.add_argument('--variant', choices=['both', 'sync', 'async'], default='both')
+
+    def handle(self, *args, **options):
+        if options['devices'] < 1 or options['rounds'] < 1 or options['threads'] < 1:
+            raise CommandError('--devices, --rounds and --threads must be positive.')
+
+        api_key, codes = self.setup(options['devices'])
+        delay = options['db_latency'] / 1000
+
+        def slow_query(execute, sql, params, many, context):
+            time.sleep(delay)
+            return execute(sql, params, many, context)
+
+        def add_latency(connection, **kwargs):
+            if slow_query not in connection.execute_wrappers:
+                connection.execute_wrappers.append(slow_query)
+
+        if delay:
+            connection_created.connect(add_latency)
+            for conn in connections.all():
+                add_latency(conn)
+
+        self.stdout.write(
+            f"{options['devices']} devices x {options['rounds']} rounds (verify + detection), "
+            f"+{options['db_latency']:g} ms per query, {options['threads']} sync worker thread(s)"
+        )
+        results = {}
+        try:
+            for variant, run in (('sync', self.run_sync), ('async', self.run_async)):
+                if options['variant'] not in ('both', variant):
+                    continue
+                # The device views print debug lines for every scan; keep them out of the report
+                with contextlib.redirect_stdout(io.StringIO()):
+                    results[variant] = run(api_key, codes, options)
+                self.report(variant, results[variant])
+        finally:
+            if delay:
+                connection_created.disconnect(add_latency)
+            self.cleanup()
+
+        if len(results) == 2 and results['sync']['per_second']:
+            speedup = results['async']['per_second'] / results['sync']['per_second']
+            self.stdout.write(self.style.SUCCESS(f'Async throughput: {speedup:.2f}x sync'))
+
+    def report(self, label, result):
+        self.stdout.write(
+            f"  {label:<6} {result['requests']:>6} requests  {result['per_second']:>8.1f} req/s  "
+            f"p50 {result['p50']:>7.1f} ms  p99 {result['p99']:>7.1f} ms  failures {result['failures']}"
+        )
+
+    def requests_for(self, factory, api_key, code):
+        headers = {'Authorization': f'Bearer {api_key}'}
+        detection = json.dumps({'sort_result': 'plastic', 'user_id': code, 'sensor_data': {'width_ms': 420}})
+        return (
+            lambda: factory.get('/api/user/verify/', {'code': code}, headers=headers),
+            lambda: factory.post('/api/device/detection/', detection, content_type='application/json', headers=headers),
+        )
+
+    @staticmethod
+    def failed(response):
+        return response.status_code >= 400 or json.loads(response.content).get('status') == 'error'
+
+    def run_sync(self, api_key, codes, options):
+        factory = RequestFactory()
+        latencies, failures = [], [0]
+        lock = threading.Lock()
+        pool = ThreadPoolExecutor(max_workers=options['threads'])
+
+        def serve(view, request):
+            try:
+                return view(request)
+            finally:
+                connection.close()
+
+        def device(code):
+            verify, detection = self.requests_for(factory, api_key, code)
+            for _ in range(options['rounds']):
+                for view, build in ((views.api_user_verify, verify), (views.api_bottle_detection, detection)):
+                    started = time.perf_counter()
+                    response = pool.submit(serve, view, build()).result()
+                    elapsed = (time.perf_counter() - started) * 1000
+                    with lock:
+                        latencies.append(elapsed)
+                        failures[0] += self.failed(response)
+
+        started = time.perf_counter()
+        clients = [threading.Thread(target=device, args=(code,)) for code in codes]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        pool.shutdown()
+        return summarize(latencies, failures[0], elapsed)
+
+    def run_async(self, api_key, codes, options):
+        factory = AsyncRequestFactory()
+        latencies, failures = [], [0]
+
+        async def device(code):
+            verify, detection = self.requests_for(factory, api_key, code)
+            for _ in range(options['rounds']):
+                for view, build in ((views.api_user_verify_async, verify), (views.api_bottle_detection_async, detection)):
+                    started = time.perf_counter()
+                    # As the ASGI handler does: each request gets its own thread for sync ORM work
+                    async with ThreadSensitiveContext():
+                        response = await view(build())
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    failures[0] += self.failed(response)
+
+        async def run_all():
+            await asyncio.gather(*(device(code) for code in codes))
+
+        started = time.perf_counter()
+        asyncio.run(run_all())
+        elapsed = time.perf_counter() - started
+        return summarize(latencies, failures[0], elapsed)
+
+    def setup(self, count):
+        device, _ = Device.objects.get_or_create(
+            device_id=DEVICE_ID,
+            defaults={'device_name': 'Async Benchmark', 'location': 'Benchmark', 'api_key': str(uuid.uuid4()), 'status': 'online'},
+        )
+        codes = []
+        for index in range(1, count + 1):
+            user, created = User.objects.get_or_create(username=f'{USER_PREFIX}{index:04d}')
+            if created or not user.profile.school_id:
+                user.profile.school_id = f'BA-{index:04d}'
+                user.profile.save_details()
+            codes.append(user.profile.school_id)
+        return device.api_key, codes
+
+    def cleanup(self):
+        Device.objects.filter(device_id=DEVICE_ID).delete()
+        User.objects.filter(username__startswith=USER_PREFIX).delete()
+        # The running site totals still include the benchmark's deposits
+        site_stats.rebuild()
@@ -0,0 +1,73 @@
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+from core import barcodes, id_cards
+
+
+def render_card_uncached(full_name, school_id):
+    """The card pipeline as it was before the caches: fonts, header and barcode rebuilt every call"""
+    import barcode
+    from barcode.writer import ImageWriter
+    from PIL import Image, ImageDraw, ImageFont
+
+    width, height = id_cards.CARD_WIDTH, id_cards.CARD_HEIGHT
+    card = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(card)
+    draw.rectangle([(0, 0), (width, 150)], fill='#1e40af')
+    try:
+        title_font = ImageFont.truetype("arial.ttf", 40)
+        name_font = ImageFont.truetype("arial.ttf", 50)
+        info_font = ImageFont.truetype("arial.ttf", 30)
+    except OSError:
+        title_font = ImageFont.load_default()
+        name_font = ImageFont.load_default()
+        info_font = ImageFont.load_default()
+    draw.text((width//2, 50), "St. Michael's College", fill='white', font=title_font, anchor='mm')
+    draw.text((width//2, 100), "Iligan City", fill='white', font=info_font, anchor='mm')
+    draw.text((width//2, 250), full_name, fill='#1e40af', font=name_font, anchor='mm')
+    draw.text((width//2, 320), f"ID: {school_id}", fill='black', font=info_font, anchor='mm')
+
+    code128 = barcode.get_barcode_class('code128')
+    barcode_buffer = BytesIO()
+    code128(barcodes.barcode_data(school_id), writer=ImageWriter()).write(barcode_buffer, options=id_cards.CARD_BARCODE_OPTIONS)
+    barcode_buffer.seek(0)
+    card.paste(Image.open(barcode_buffer).resize((600, 120)), ((width - 600) // 2, 400))
+    return card
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark ID card rendering (cards per second), rebuilding everything per card vs. the cached base card and fonts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=200, help='Cards to render per variant (default: 200)')
+
+    def handle(self, *args, **options):
+        cards = [(f'STUDENT NUMBER {i}', f'C22-{i:04d}') for i in range(options['cards'])]
+
+        # Both pipelines must still draw the same card
+        sample = cards[0]
+        same = render_card_uncached(*sample).tobytes() == id_cards.render_card_image(*sample).tobytes()
+        self.stdout.write(f"Output identical: {'yes' if same else 'NO'}")
+
+        def encode_uncached(full_name, school_id):
+            buffer = BytesIO()
+            render_card_uncached(full_name, school_id).save(buffer, format='PNG')
+            return buffer.getvalue()
+
+        variants = [
+            ('before: draw', render_card_uncached),
+            ('after: draw', id_cards.render_card_image),
+            ('before: draw + PNG', encode_uncached),
+            ('after: draw + PNG', id_cards.render_card),
+        ]
+        results = {}
+        for label, render in variants:
+            started = time.perf_counter()
+            for full_name, school_id in cards:
+                render(full_name, school_id)
+            results[label] = len(cards) / (time.perf_counter() - started)
+            self.stdout.write(f'  {label:<22} {results[label]:>8.1f} cards/s')
+
+        speedup = results['after: draw + PNG'] / results['before: draw + PNG']
+        self.stdout.write(self.style.SUCCESS(f'End-to-end speedup: {speedup:.2f}x (per process; bulk jobs multiply this by worker count)'))
@@ -0,0 +1,200 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.signals import post_delete
+from django.utils import timezone
+from core.models import UserProfile, Entry, RewardItem, RedeemedPoints, Device, DeviceLog
+from core import ledger, listing, signals, stats
+
+BENCH_PREFIX = 'bench-'
+
+# Per-row SiteStats decrements, switched off while the benchmark data is deleted
+# (stats are rebuilt afterwards); without receivers the cascades are bulk deletes
+DELETE_COUNTERS = (
+    (signals.remove_entry_stats, Entry),
+    (signals.remove_redemption_stats, RedeemedPoints),
+    (signals.remove_profile_stats, UserProfile),
+)
+
+class RollbackBenchmark(Exception):
+    """Raised to undo the temporary index drops"""
+
+class Command(BaseCommand):
+    help = (
+        'Seed data at scale and report query plans and timings for the hot queries in '
+        'core/views.py, with and without the indexes declared in Meta.indexes. '
+        'The "without" pass drops the indexes inside a transaction that is rolled back; '
+        'that locks the tables while it runs, so use a staging copy, not production.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Create this many benchmark entries/device logs first (e.g. 200000)')
+        parser.add_argument('--users', type=int, default=2000, help='Benchmark users to spread seeded rows over (default: 2000)')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per query; the median is reported (default: 20)')
+        parser.add_argument('--no-compare', action='store_true', help='Skip the pass without indexes')
+        parser.add_argument('--explain', action='store_true', help='Print the full query plan for each query')
+        parser.add_argument('--cleanup', action='store_true', help='Delete all benchmark data and exit')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            for receiver, model in DELETE_COUNTERS:
+                post_delete.disconnect(receiver, sender=model)
+            try:
+                deleted, _ = User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+                Device.objects.filter(device_id__startswith=BENCH_PREFIX).delete()
+                RewardItem.objects.filter(reward_name__startswith=BENCH_PREFIX).delete()
+            finally:
+                for receiver, model in DELETE_COUNTERS:
+                    post_delete.connect(receiver, sender=model)
+            self.resync()
+            self.stdout.write(self.style.SUCCESS(f'Removed benchmark data ({deleted} rows incl. cascades).'))
+            return
+
+        if options['seed']:
+            self.seed(options['seed'], options['users'])
+
+        profile = UserProfile.objects.filter(user__username__startswith=BENCH_PREFIX).first() or UserProfile.objects.first()
+        device = Device.objects.filter(device_id__startswith=BENCH_PREFIX).first() or Device.objects.first()
+        if profile is None or device is None:
+            self.stdout.write(self.style.ERROR('No data to benchmark. Run with --seed N first.'))
+            return
+
+        self.stdout.write(f'Database: {connection.vendor}, entries: {Entry.objects.count()}, device logs: {DeviceLog.objects.count()}')
+        queries = self.hot_queries(profile, device)
+
+        with_indexes = self.run(queries, options, 'with indexes')
+        if options['no_compare']:
+            return
+
+        without_indexes = {}
+        try:
+            with transaction.atomic():
+                self.drop_indexes()
+                without_indexes = self.run(queries, options, 'without indexes')
+                raise RollbackBenchmark
+        except RollbackBenchmark:
+            pass
+
+        self.stdout.write('\nSummary (median ms):')
+        self.stdout.write(f"  {'query':<40} {'no index':>10} {'indexed':>10} {'speedup':>8}")
+        for name in with_indexes:
+            before = without_indexes.get(name)
+            after = with_indexes[name]
+            speedup = f'{before / after:.1f}x' if before and after else '-'
+            self.stdout.write(f"  {name:<40} {before or 0:>10.2f} {after:>10.2f} {speedup:>8}")
+
+    def hot_queries(self, profile, device):
+        """The query shapes core/views.py runs on dashboard, profile and console pages"""
+        now = timezone.now()
+        week_ago = now - timedelta(days=7)
+        three_days_ago = now - timedelta(days=3)
+        count = lambda queryset: queryset.count()
+        # A cursor half way down the transactions list, to compare deep keyset pages with OFFSET
+        depth = Entry.objects.count() // 2
+        middle = Entry.objects.order_by('-created_at', '-id')[depth:depth + 1].first()
+        cursor = (middle.created_at, middle.pk) if middle else (now, 0)
+        return [
+            ('user recent entries', lambda: Entry.objects.filter(user_profile=profile).order_by('-created_at')[:10], list),
+            ('entries in last 7 days (count)', lambda: Entry.objects.filter(created_at__gte=week_ago), count),
+            ('latest transactions', lambda: Entry.objects.order_by('-created_at')[:200], list),
+            ('transactions deep page (keyset)', lambda: listing.older_than(Entry.objects.all(), *cursor).order_by('-created_at', '-id')[:listing.PAGE_SIZE], list),
+            ('transactions deep page (OFFSET)', lambda: Entry.objects.order_by('-created_at', '-id')[depth:depth + listing.PAGE_SIZE], list),
+            ('user valid redemptions', lambda: RedeemedPoints.objects.filter(user_profile=profile, created_at__gte=three_days_ago).order_by('created_at'), list),
+            ('latest redemptions', lambda: RedeemedPoints.objects.order_by('-created_at')[:100], list),
+            ('sorted bottles per device since', lambda: DeviceLog.objects.filter(log_type='bottle_sorted', created_at__gte=week_ago).values('device_id').annotate(total=Count('id')), list),
+            ('latest device logs', lambda: DeviceLog.objects.order_by('-created_at')[:200], list),
+            ('top recyclers', lambda: UserProfile.objects.order_by('-total_points')[:10], list),
+        ]
+
+    def run(self, queries, options, label):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n== {label} =='))
+        timings = {}
+        for name, build, evaluate in queries:
+            plan = self.explain(build(), label)
+            samples = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                evaluate(build())
+                samples.append((time.perf_counter() - started) * 1000)
+            timings[name] = statistics.median(samples)
+            self.stdout.write(f'{name}: {timings[name]:.2f} ms (median of {len(samples)})')
+            plan_lines = plan.splitlines()
+            for line in (plan_lines if options['explain'] else plan_lines[:2]):
+                self.stdout.write(f'    {line}')
+        return timings
+
+    def explain(self, queryset, label):
+        # sqlite3 caches prepared statements by SQL text and a cached EXPLAIN keeps
+        # reporting the old plan after DROP INDEX, so tag the SQL with the pass label
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql} -- {label}', params)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+    def drop_indexes(self):
+        # Plain DROP INDEX works on both PostgreSQL and SQLite and is undone by the rollback
+        with connection.cursor() as cursor:
+            for model in (UserProfile, Entry, RedeemedPoints, DeviceLog):
+                for index in model._meta.indexes:
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+
+    def seed(self, rows, user_count):
+        self.stdout.write(f'Seeding {user_count} users, {rows} entries, {rows} device logs, {rows // 10} redemptions...')
+        started = time.perf_counter()
+        rng = random.Random(42)
+        now = timezone.now()
+        offset = User.objects.filter(username__startswith=BENCH_PREFIX).count()
+
+        users = User.objects.bulk_create(
+            [User(username=f'{BENCH_PREFIX}{offset + i}') for i in range(user_count)],
+            batch_size=1000,
+        )
+        profiles = UserProfile.objects.bulk_create(
+            [UserProfile(user=user, total_points=rng.randint(0, 5000), qr_code_data=f'{BENCH_PREFIX}{user.username}') for user in users],
+            batch_size=1000,
+        )
+        device = Device.objects.create(
+            device_id=f'{BENCH_PREFIX}{offset}', device_name='Benchmark device',
+            location='Benchmark', api_key=f'{BENCH_PREFIX}{offset}-{rng.random()}',
+        )
+        reward = RewardItem.objects.create(reward_name=f'{BENCH_PREFIX}reward', points_required=50)
+
+        def when():
+            return now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+
+        batch = 5000
+        for start in range(0, rows, batch):
+            size = min(batch, rows - start)
+            entries = Entry.objects.bulk_create([
+                Entry(user_profile=rng.choice(profiles), no_bottle=1, points=10) for _ in range(size)
+            ])
+            logs = DeviceLog.objects.bulk_create([
+                DeviceLog(device=device, log_type=rng.choice(['bottle_detected', 'bottle_sorted', 'heartbeat', 'error']))
+                for _ in range(size)
+            ])
+            redemptions = RedeemedPoints.objects.bulk_create([
+                RedeemedPoints(user_profile=rng.choice(profiles), reward_item=reward, redeemed_points=50,
+                               receipt_number=f'{BENCH_PREFIX}{offset}-{start + i}')
+                for i in range(size // 10)
+            ])
+            # created_at is auto_now_add, so spread the rows over the past year afterwards
+            for model, objs in ((Entry, entries), (DeviceLog, logs), (RedeemedPoints, redemptions)):
+                for obj in objs:
+                    obj.created_at = when()
+                model.objects.bulk_update(objs, ['created_at'], batch_size=1000)
+            self.stdout.write(f'  {start + size}/{rows}')
+
+        # The bulk inserts bypass core.ledger, so bring the counters in line with the rows
+        self.resync()
+        self.stdout.write(self.style.SUCCESS(f'Seeded in {time.perf_counter() - started:.1f}s'))
+
+    def resync(self):
+        """Recompute SiteStats and the per-user lifetime counters from the tables"""
+        stats.rebuild()
+        ledger.reconcile_lifetime_counters()
@@ -0,0 +1,74 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import InterfaceError, OperationalError, close_old_connections
+from core import log_queue
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk-insert queued device logs from the write-behind queue file into the database. '
+        'Runs until stopped (for deployments with DEVICE_LOG_QUEUE_THREAD=False), or once with --once. '
+        'Several drainers can run against the same file; each batch is claimed before it is inserted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain what is queued now, then exit')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=log_queue.DEVICE_LOG_QUEUE_BATCH,
+            help=f'Records inserted per batch (default: {log_queue.DEVICE_LOG_QUEUE_BATCH})',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=log_queue.DEVICE_LOG_QUEUE_INTERVAL,
+            help=f'Seconds to wait when the queue is empty (default: {log_queue.DEVICE_LOG_QUEUE_INTERVAL:g})',
+        )
+        parser.add_argument('--status', action='store_true', help='Show queued and failed counts (and failed records), then exit')
+        parser.add_argument('--retry-failed', action='store_true', help='Put records the database rejected back on the queue, then exit')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            status = log_queue.status()
+            self.stdout.write(
+                f"{status['path']}: {status['pending']} queued ({status['claimed']} claimed), {status['failed']} failed"
+            )
+            for failure in log_queue.failed_records():
+                self.stdout.write(self.style.WARNING(f"  #{failure['id']} {failure['error']}: {failure['record']}"))
+            return
+
+        if options['retry_failed']:
+            count = log_queue.retry_failed()
+            self.stdout.write(self.style.SUCCESS(f'{count} failed record(s) queued again.'))
+            return
+
+        if options['once']:
+            self.report(*log_queue.drain(options['batch_size']))
+            return
+
+        self.stdout.write(f"Draining {log_queue.DEVICE_LOG_QUEUE_PATH} (Ctrl+C to stop)...")
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    inserted, dropped, failed = log_queue.drain(options['batch_size'])
+                except (OperationalError, InterfaceError) as e:
+                    # The records stay queued; try again on the next pass
+                    self.stdout.write(self.style.WARNING(f'Database unavailable, retrying: {e}'))
+                else:
+                    if inserted or dropped or failed:
+                        self.report(inserted, dropped, failed)
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.report(*log_queue.drain(options['batch_size']))
+
+    def report(self, inserted, dropped, failed):
+        message = f'{inserted} log(s) inserted'
+        if dropped:
+            message += f', {dropped} dropped (device deleted)'
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{message}, {failed} set aside as failed (see --status)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,55 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from core import id_cards
+from core.models import UserProfile
+
+class Command(BaseCommand):
+    help = (
+        'Render ID cards for many users in parallel (one process per CPU core by default) '
+        'and write them to a ZIP, optionally with print-ready A4 sheets. Reports cards per second.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='id_cards.zip', help='ZIP file to write (default: id_cards.zip)')
+        parser.add_argument('--role', choices=[value for value, _ in UserProfile.USER_TYPE_CHOICES] + ['all'], default='student',
+                            help='Which users to include (default: student)')
+        parser.add_argument('--id-prefix', help='Only users whose Student/Faculty ID starts with this (e.g. C22-)')
+        parser.add_argument('--users', nargs='+', help='Only these usernames')
+        parser.add_argument('--include-missing-id', action='store_true', help='Also make cards for users without an ID (printed as NO-ID)')
+        parser.add_argument('--workers', type=int, default=id_cards.ID_CARD_WORKERS,
+                            help=f'Worker processes; 1 renders in this process (default: {id_cards.ID_CARD_WORKERS})')
+        parser.add_argument('--sheets', action='store_true', help='Also lay the cards out on A4 sheets (10 per page)')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(profile__isnull=False)
+        if options['role'] != 'all':
+            users = users.filter(profile__user_type=options['role'])
+        if options['id_prefix']:
+            users = users.filter(profile__school_id__istartswith=options['id_prefix'])
+        if options['users']:
+            users = users.filter(username__in=options['users'])
+        if not options['include_missing_id']:
+            users = users.exclude(profile__school_id__isnull=True).exclude(profile__school_id='')
+
+        cards = id_cards.cards_for(users)
+        if not cards:
+            raise CommandError('No users match these filters.')
+        workers = max(1, options['workers'])
+        self.stdout.write(f'Rendering {len(cards)} card(s) with {workers} worker(s)...')
+
+        every = max(1, len(cards) // 20)
+
+        def progress(done, total, rate):
+            if done % every == 0 or done == total:
+                self.stdout.write(f'  {done}/{total} ({rate:.1f} cards/s)')
+
+        started = time.perf_counter()
+        with open(options['output'], 'wb') as f:
+            for chunk in id_cards.iter_zip(cards, workers=workers, sheets=options['sheets'], progress=progress):
+                f.write(chunk)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(cards)} card(s) to {options['output']} in {elapsed:.1f}s ({len(cards) / elapsed:.1f} cards/s)"
+        ))
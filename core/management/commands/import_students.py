@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from core import enrollment
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk-enroll students (and faculty) from a CSV with columns '
+        'first_name,last_name and optionally username,email,school_id,user_type,password. '
+        'Missing IDs are allocated automatically. Nothing is written if any row is invalid.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='CSV file to import (UTF-8, header row required)')
+        parser.add_argument('--dry-run', action='store_true', help='Only validate the file and report errors')
+        parser.add_argument('--default-password', default='',
+                            help='Password for rows without one (default: none, those accounts cannot log in until reset)')
+        parser.add_argument('--workers', type=int, default=enrollment.IMPORT_WORKERS,
+                            help=f'Processes for password hashing; 1 hashes in this process (default: {enrollment.IMPORT_WORKERS})')
+        parser.add_argument('--errors', help='Write the per-row error report to this CSV file')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            with open(options['csv_file'], newline='', encoding='utf-8-sig') as f:
+                result = enrollment.validate(f)
+        except OSError as e:
+            raise CommandError(f'Cannot read {options["csv_file"]}: {e}')
+        self.stdout.write(f'Validated {len(result.rows) + len({line for line, _, _ in result.errors})} row(s) '
+                          f'in {time.perf_counter() - started:.1f}s: {len(result.rows)} ok, {len(result.errors)} error(s)')
+
+        if result.errors:
+            self.fail(result, options['errors'])
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Dry run: {len(result.rows)} row(s) would be imported.'))
+            return
+
+        enrollment.run_import(result, options['default_password'], max(1, options['workers']))
+        if result.errors:
+            self.fail(result, options['errors'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.created} user(s) ({result.allocated_ids} ID(s) allocated) '
+            f'in {elapsed:.1f}s ({result.created / elapsed:.0f} users/s)'
+        ))
+
+    def fail(self, result, report_path):
+        for line, column, message in result.errors[:20]:
+            self.stdout.write(self.style.ERROR(f'  line {line} [{column}]: {message}'))
+        if len(result.errors) > 20:
+            self.stdout.write(f'  ... and {len(result.errors) - 20} more')
+        if report_path:
+            with open(report_path, 'w', newline='', encoding='utf-8') as f:
+                f.write(result.error_report())
+            self.stdout.write(f"Error report written to {report_path}")
+        raise CommandError('Nothing imported; fix the errors above and run again.')
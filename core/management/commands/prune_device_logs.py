@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from core import retention
+
+class Command(BaseCommand):
+    help = (
+        'Roll raw DeviceLog rows older than the retention window into hourly '
+        'per-device summaries, then delete them in small chunks. Safe to run '
+        'repeatedly (e.g. from cron or a scheduled job).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=retention.DEVICE_LOG_RETENTION_DAYS,
+            help=f'Keep raw logs for this many days (default: {retention.DEVICE_LOG_RETENTION_DAYS})',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=retention.PRUNE_CHUNK_SIZE,
+            help=f'Rows summarized and deleted per transaction (default: {retention.PRUNE_CHUNK_SIZE})',
+        )
+        parser.add_argument(
+            '--max-chunks',
+            type=int,
+            default=None,
+            help='Stop after this many chunks (useful to spread a large backlog over several runs)',
+        )
+        parser.add_argument(
+            '--sample-days',
+            type=int,
+            default=retention.SENSOR_SAMPLE_RETENTION_DAYS,
+            help=f'Keep down-sampled heartbeat sensor history for this many days (default: {retention.SENSOR_SAMPLE_RETENTION_DAYS})',
+        )
+        parser.add_argument(
+            '--event-days',
+            type=int,
+            default=retention.DETECTION_EVENT_RETENTION_DAYS,
+            help=f'Keep detection event IDs (retry dedupe) for this many days (default: {retention.DETECTION_EVENT_RETENTION_DAYS})',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Rolling up device logs older than {options['days']} days...")
+        removed = retention.prune_device_logs(
+            older_than_days=options['days'],
+            chunk_size=options['chunk_size'],
+            max_chunks=options['max_chunks'],
+            progress=lambda total: self.stdout.write(f'  {total} raw logs summarized and removed'),
+        )
+        samples = retention.prune_sensor_samples(options['sample_days'])
+        events = retention.prune_detection_events(options['event_days'], options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Done. {removed} raw log(s) rolled up, {samples} old sensor sample(s) '
+            f'and {events} old detection event(s) deleted.'
+        ))
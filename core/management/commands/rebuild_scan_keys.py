@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from core.models import rebuild_scan_keys
+
+class Command(BaseCommand):
+    help = 'Backfill/rebuild the normalized ScanKey index used by the device verify API'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of profiles rebuilt per transaction (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        total_profiles, total_keys = rebuild_scan_keys(
+            batch_size=options['batch_size'],
+            progress=lambda count: self.stdout.write(f'Indexed {count} profiles...'),
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt {total_keys} scan keys for {total_profiles} profiles.')
+        )
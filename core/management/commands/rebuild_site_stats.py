@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from core import stats
+
+class Command(BaseCommand):
+    help = 'Recompute the admin dashboard totals (SiteStats) and per-reward redemption counters from scratch'
+
+    def handle(self, *args, **options):
+        site_stats = stats.rebuild()
+        self.stdout.write(f'Entries: {site_stats.total_entries} ({site_stats.total_bottles} bottles, {site_stats.total_points_earned} points)')
+        self.stdout.write(f'Redemptions: {site_stats.total_redemptions} ({site_stats.total_points_redeemed} points)')
+        self.stdout.write(f'Points outstanding: {site_stats.points_outstanding}')
+        self.stdout.write(
+            f'Devices: {site_stats.devices_total} (online {site_stats.devices_online}, offline {site_stats.devices_offline}, '
+            f'maintenance {site_stats.devices_maintenance}, error {site_stats.devices_error})'
+        )
+        self.stdout.write(self.style.SUCCESS('Site stats rebuilt.'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from core import ledger
+
+class Command(BaseCommand):
+    help = (
+        "Recompute each profile's lifetime counters (total_bottles, points_earned, "
+        "points_redeemed) from Entry/RedeemedPoints and fix any that drifted "
+        "(e.g. after deleting entries by hand)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report mismatches, do not write anything',
+        )
+
+    def handle(self, *args, **options):
+        mismatched = ledger.reconcile_lifetime_counters(
+            dry_run=options['dry_run'],
+            report=lambda username, actual, expected: self.stdout.write(f'{username}: {actual} -> {expected}'),
+        )
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{mismatched} profile(s) out of sync (dry run, nothing written).'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'Reconciled {mismatched} profile(s).'))
@@ -0,0 +1,296 @@
+import contextlib
+import io
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+from urllib.parse import urlencode
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from core.models import Device, UserProfile
+from core import stats as site_stats
+
+DEVICE_PREFIX = 'LOADTEST-'
+USER_PREFIX = 'loadtest-'
+ENDPOINTS = {
+    'verify': '/api/user/verify/',
+    'detection': '/api/device/detection/',
+    'heartbeat': '/api/device/heartbeat/',
+    'error': '/api/device/error/',
+}
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies = []  # ms
+        self.queries = []
+        self.failures = 0  # HTTP status >= 400, "status": "error", or no response
+        self.failure_messages = Counter()
+
+    def summary(self, elapsed):
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+
+        def percentile(fraction):
+            return latencies[min(count - 1, int(fraction * count))] if count else 0
+
+        return {
+            'requests': count,
+            'per_second': round(count / elapsed, 1) if elapsed else 0,
+            'p50_ms': round(percentile(0.50), 1),
+            'p99_ms': round(percentile(0.99), 1),
+            'max_ms': round(latencies[-1], 1) if count else 0,
+            'queries': round(sum(self.queries) / len(self.queries), 1) if self.queries else None,
+            'error_rate': round(self.failures / count * 100, 2) if count else 0,
+        }
+
+
+class TestClientTransport:
+    """Requests through Django's test client, in this process; also counts queries per request"""
+
+    def __init__(self):
+        self.client = Client(HTTP_HOST='localhost', raise_request_exception=False)
+
+    def send(self, method, path, api_key, params=None, body=None):
+        queries = []
+
+        def count(execute, sql, sql_params, many, context):
+            queries.append(sql)
+            return execute(sql, sql_params, many, context)
+
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {api_key}'}
+        with connection.execute_wrapper(count):
+            if method == 'GET':
+                response = self.client.get(path, params or {}, **headers)
+            else:
+                response = self.client.post(path, json.dumps(body), content_type='application/json', **headers)
+        try:
+            payload = json.loads(response.content)
+        except ValueError:
+            payload = {}
+        return response.status_code, payload, len(queries)
+
+    def close(self):
+        connection.close()
+
+
+class HttpTransport:
+    """Real HTTP requests to a running server, like the device firmware makes"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def send(self, method, path, api_key, params=None, body=None):
+        url = self.base_url + path
+        if params:
+            url += '?' + urlencode(params)
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(url, data=data, method=method, headers={
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json',
+            'User-Agent': 'EcoDrop-Arduino/1.0 (load test)',
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                status, content = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, content = e.code, e.read()
+        except OSError:
+            return 0, {}, None
+        try:
+            payload = json.loads(content)
+        except ValueError:
+            payload = {}
+        return status, payload, None
+
+    def close(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test: N virtual EcoDrop devices speak the firmware protocol (verify GET, detection POST, '
+        'heartbeat every 30 s, occasional error reports) for a fixed time, then throughput, p50/p99 '
+        'latency, queries per request and error rate are reported per endpoint. Runs in-process through '
+        "Django's test client by default, or against a running server with --url. Use PostgreSQL for "
+        'meaningful numbers (SQLite serializes writers).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=10, help='Virtual devices, one thread each (default: 10)')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run (default: 30)')
+        parser.add_argument('--url', help='Base URL of a running server (e.g. http://127.0.0.1:8000); default is the in-process test client')
+        parser.add_argument('--users', type=int, default=200, help='Load-test students to create and scan (default: 200)')
+        parser.add_argument('--unknown-rate', type=float, default=0.05, help='Share of scans with an unregistered code (default: 0.05)')
+        parser.add_argument('--invalid-rate', type=float, default=0.2, help="Share of bottles sorted as 'invalid' (default: 0.2)")
+        parser.add_argument('--error-rate', type=float, default=0.01, help='Chance per bottle that the device also reports an error (default: 0.01)')
+        parser.add_argument('--no-verify-rate', type=float, default=0.0, help='Share of bottles dropped without scanning a user first (default: 0)')
+        parser.add_argument('--heartbeat-interval', type=float, default=30, help='Seconds between heartbeats per device (default: 30, as the firmware)')
+        parser.add_argument('--think-time', type=float, default=0, help='Seconds a device waits between bottles (default: 0, as fast as possible)')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed, for repeatable runs (default: 1)')
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file')
+        parser.add_argument('--keep', action='store_true', help="Don't delete the load-test devices and users afterwards")
+
+    def handle(self, *args, **options):
+        if options['devices'] < 1 or options['duration'] <= 0:
+            raise CommandError('--devices and --duration must be positive.')
+
+        devices = self.setup_devices(options['devices'])
+        codes = self.setup_users(options['users'])
+        stats = {name: EndpointStats() for name in ENDPOINTS}
+        stats_lock = threading.Lock()
+        stop_at = time.perf_counter() + options['duration']
+        target = options['url'] or 'in-process test client'
+
+        def run_device(index, api_key):
+            rng = random.Random(options['seed'] * 1000 + index)
+            transport = HttpTransport(options['url']) if options['url'] else TestClientTransport()
+
+            def call(name, method, params=None, body=None, expect_error=False):
+                started = time.perf_counter()
+                status, payload, queries = transport.send(method, ENDPOINTS[name], api_key, params, body)
+                elapsed = (time.perf_counter() - started) * 1000
+                with stats_lock:
+                    endpoint = stats[name]
+                    endpoint.latencies.append(elapsed)
+                    if queries is not None:
+                        endpoint.queries.append(queries)
+                    # An unregistered code is supposed to come back as "not found"
+                    if not status or status >= 400 or (payload.get('status') == 'error' and not expect_error):
+                        endpoint.failures += 1
+                        endpoint.failure_messages[f"{status or 'no response'}: {str(payload.get('message', ''))[:80]}"] += 1
+                return payload
+
+            last_heartbeat = None
+            try:
+                while time.perf_counter() < stop_at:
+                    now = time.perf_counter()
+                    if last_heartbeat is None or now - last_heartbeat >= options['heartbeat_interval']:
+                        call('heartbeat', 'POST', body={
+                            'status': 'online',
+                            'sensor_data': {'cap': rng.randint(0, 1), 'ultrasonic': 1, 'distance_cm': round(rng.uniform(4, 30), 1)},
+                        })
+                        last_heartbeat = now
+
+                    code = None
+                    if rng.random() >= options['no_verify_rate']:
+                        unknown = rng.random() < options['unknown_rate'] or not codes
+                        code = f'UNKNOWN-{rng.randint(0, 99999)}' if unknown else rng.choice(codes)
+                        call('verify', 'GET', params={'code': code}, expect_error=unknown)
+
+                    plastic = rng.random() >= options['invalid_rate']
+                    body = {
+                        'sort_result': 'plastic' if plastic else 'invalid',
+                        'sensor_data': {
+                            'width_ms': rng.randint(200, 900),
+                            'cap_stable': rng.randint(0, 1),
+                            'ultrasonic_stable': 1,
+                            'distance_cm': round(rng.uniform(4, 30), 1),
+                        },
+                    }
+                    if code:
+                        body['user_id'] = code
+                    call('detection', 'POST', body=body)
+
+                    if rng.random() < options['error_rate']:
+                        call('error', 'POST', body={'error_message': 'Simulated sorter jam', 'error_code': 'E_LOADTEST'})
+
+                    if options['think_time']:
+                        time.sleep(options['think_time'])
+            finally:
+                transport.close()
+
+        self.stdout.write(
+            f"Running {len(devices)} device(s) x {options['duration']:g}s against {target} "
+            f"({len(codes)} users, seed {options['seed']})..."
+        )
+        threads = [threading.Thread(target=run_device, args=(index, api_key)) for index, api_key in enumerate(devices)]
+        started = time.perf_counter()
+        # The device views print debug lines for every scan; keep them out of the report
+        quiet = contextlib.redirect_stdout(io.StringIO()) if not options['url'] else contextlib.nullcontext()
+        with quiet:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - started
+
+        results = {name: endpoint.summary(elapsed) for name, endpoint in stats.items()}
+        total = sum(result['requests'] for result in results.values())
+        self.stdout.write(f"\n{'endpoint':<11}{'requests':>10}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'queries':>9}{'errors %':>10}")
+        for name, result in results.items():
+            queries = '-' if result['queries'] is None else result['queries']
+            self.stdout.write(
+                f"{name:<11}{result['requests']:>10}{result['per_second']:>9}{result['p50_ms']:>9}"
+                f"{result['p99_ms']:>9}{result['max_ms']:>9}{queries:>9}{result['error_rate']:>10}"
+            )
+        for name, endpoint in stats.items():
+            for message, count in endpoint.failure_messages.most_common(3):
+                self.stdout.write(self.style.WARNING(f'  {name} failed {count}x with {message}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} requests in {elapsed:.1f}s: {total / elapsed:.1f} req/s across {len(devices)} device(s)'
+        ))
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({
+                    'target': target,
+                    'devices': len(devices),
+                    'duration': round(elapsed, 2),
+                    'options': {key: options[key] for key in (
+                        'users', 'unknown_rate', 'invalid_rate', 'error_rate', 'no_verify_rate',
+                        'heartbeat_interval', 'think_time', 'seed',
+                    )},
+                    'endpoints': results,
+                }, f, indent=2)
+            self.stdout.write(f"Results written to {options['json_path']}")
+
+        if not options['keep']:
+            self.cleanup()
+
+    def setup_devices(self, count):
+        keys = []
+        for index in range(1, count + 1):
+            device, _ = Device.objects.get_or_create(
+                device_id=f'{DEVICE_PREFIX}{index:03d}',
+                defaults={
+                    'device_name': f'Load Test Device {index}',
+                    'location': 'Load test',
+                    'api_key': str(uuid.uuid4()),
+                    'status': 'online',
+                },
+            )
+            keys.append(device.api_key)
+        return keys
+
+    def setup_users(self, count):
+        existing = set(User.objects.filter(username__startswith=USER_PREFIX).values_list('username', flat=True))
+        for index in range(1, count + 1):
+            username = f'{USER_PREFIX}{index:04d}'
+            if username in existing:
+                continue
+            user = User.objects.create_user(username=username, first_name='Load', last_name=f'Test {index}')
+            profile = user.profile
+            profile.school_id = f'LT-{index:04d}'
+            profile.save_details()
+        return list(UserProfile.objects.filter(
+            user__username__startswith=USER_PREFIX, school_id__isnull=False
+        ).values_list('school_id', flat=True)[:count])
+
+    def cleanup(self):
+        devices = Device.objects.filter(device_id__startswith=DEVICE_PREFIX)
+        users = User.objects.filter(username__startswith=USER_PREFIX)
+        device_count, user_count = devices.count(), users.count()
+        # Cascades to their logs, entries and scan keys
+        devices.delete()
+        users.delete()
+        # The running site totals still include the load test's deposits
+        site_stats.rebuild()
+        self.stdout.write(f'Removed {device_count} load-test device(s) and {user_count} user(s) (use --keep to leave them).')
@@ -0,0 +1,122 @@
+import random
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, models, OperationalError
+from core.models import UserProfile, Entry, RewardItem, RedeemedPoints
+from core import ledger, stats
+
+STRESS_USERNAME = 'stress-points-user'
+STRESS_REWARD = 'Stress Test Reward'
+
+class Command(BaseCommand):
+    help = (
+        'Concurrency stress test for point balances: many threads award and redeem '
+        'points on one profile at once, then the balance is checked against the ledger. '
+        'Run it against PostgreSQL for meaningful numbers (SQLite serializes writers).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent workers (default: 8)')
+        parser.add_argument('--operations', type=int, default=200, help='Operations per worker (default: 200)')
+        parser.add_argument('--reward-cost', type=int, default=30, help='Points per redemption (default: 30)')
+        parser.add_argument(
+            '--naive',
+            action='store_true',
+            help='Use the old read-modify-write + save() pattern instead, to show the drift it causes',
+        )
+        parser.add_argument('--keep', action='store_true', help="Don't delete the stress user and reward afterwards")
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        operations = options['operations']
+
+        user, _ = User.objects.get_or_create(username=STRESS_USERNAME)
+        profile = user.profile
+        UserProfile.objects.filter(pk=profile.pk).update(total_points=0)
+        Entry.objects.filter(user_profile=profile).delete()
+        RedeemedPoints.objects.filter(user_profile=profile).delete()
+        reward, _ = RewardItem.objects.get_or_create(
+            reward_name=STRESS_REWARD,
+            defaults={'points_required': options['reward_cost']},
+        )
+
+        counters = {'awards': 0, 'redemptions': 0, 'declined': 0, 'errors': 0}
+        counters_lock = threading.Lock()
+        operation = self.naive_operation if options['naive'] else self.ledger_operation
+
+        def worker(seed):
+            rng = random.Random(seed)
+            # Each thread gets its own connection; close it when done
+            try:
+                for _ in range(operations):
+                    try:
+                        outcome = operation(profile.pk, reward, rng)
+                    except OperationalError:
+                        outcome = 'errors'
+                    with counters_lock:
+                        counters[outcome] += 1
+            finally:
+                connection.close()
+
+        self.stdout.write(
+            f"Running {threads} x {operations} operations "
+            f"({'naive read-modify-write' if options['naive'] else 'atomic ledger'})..."
+        )
+        started = time.perf_counter()
+        workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        balance = UserProfile.objects.get(pk=profile.pk).total_points
+        earned = Entry.objects.filter(user_profile=profile).aggregate(total=models.Sum('points'))['total'] or 0
+        spent = RedeemedPoints.objects.filter(user_profile=profile).aggregate(total=models.Sum('redeemed_points'))['total'] or 0
+        drift = balance - (earned - spent)
+        committed = counters['awards'] + counters['redemptions'] + counters['declined']
+
+        self.stdout.write(f"Awards: {counters['awards']}, redemptions: {counters['redemptions']}, "
+                          f"declined (insufficient points): {counters['declined']}, errors: {counters['errors']}")
+        self.stdout.write(f"Elapsed: {elapsed:.2f}s, throughput: {committed / elapsed:.1f} transactions/s")
+        self.stdout.write(f"Balance: {balance}, ledger (earned - redeemed): {earned - spent}")
+        if drift == 0:
+            self.stdout.write(self.style.SUCCESS('Drift: 0 - balance matches the ledger'))
+        else:
+            self.stdout.write(self.style.ERROR(f'Drift: {drift:+d} points lost/created by concurrent updates'))
+
+        if not options['keep']:
+            user.delete()
+            reward.delete()
+        # The reset above and --naive write balances outside core.ledger, and the deletes
+        # fire the SiteStats decrements for rows that were never counted: recount
+        stats.rebuild()
+        if options['keep']:
+            ledger.reconcile_lifetime_counters()
+
+    @staticmethod
+    def ledger_operation(profile_pk, reward, rng):
+        profile = UserProfile.objects.get(pk=profile_pk)
+        if rng.random() < 0.6:
+            ledger.award_points(profile, bottles=1, points=10)
+            return 'awards'
+        return 'redemptions' if ledger.redeem_reward(profile, reward) else 'declined'
+
+    @staticmethod
+    def naive_operation(profile_pk, reward, rng):
+        # The pattern the views used before core.ledger: read, modify in Python, save()
+        profile = UserProfile.objects.get(pk=profile_pk)
+        if rng.random() < 0.6:
+            profile.total_points += 10
+            profile.save()
+            Entry.objects.create(user_profile=profile, no_bottle=1, points=10)
+            return 'awards'
+        if profile.total_points < reward.points_required:
+            return 'declined'
+        profile.total_points -= reward.points_required
+        profile.save()
+        RedeemedPoints.objects.create(user_profile=profile, reward_item=reward, redeemed_points=reward.points_required)
+        return 'redemptions'
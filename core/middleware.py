@@ -0,0 +1,37 @@
+# ======================================================================
+# core/middleware.py
+# WhiteNoise's middleware is sync-only, and one sync-only middleware makes
+# Django run the rest of the stack in a worker thread per request under
+# ASGI - which defeats the async device API. This subclass handles both
+# modes: static files are served exactly as before, everything else is
+# passed straight on (awaited when the stack is async).
+# ======================================================================
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            # Builds a FileResponse around an open file; cheap, but it does touch the disk
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
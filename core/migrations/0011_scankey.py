@@ -0,0 +1,64 @@
+# Generated by Django 5.0.6 on 2026-10-17 03:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def normalize(code):
+    # Frozen copy of ScanKey.normalize as of this migration
+    if not code:
+        return ''
+    return code.strip().upper().replace('-', '').replace(' ', '')
+
+
+def build_scan_keys(apps, schema_editor):
+    """Index every existing profile, so scans keep resolving right after the upgrade"""
+    UserProfile = apps.get_model('core', 'UserProfile')
+    ScanKey = apps.get_model('core', 'ScanKey')
+    profiles = UserProfile.objects.select_related('user').order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(profiles.filter(pk__gt=last_pk)[:1000])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        keys = []
+        for profile in batch:
+            # One key per spelling; the highest-priority source wins a shared key
+            seen = set()
+            sources = (
+                ('school_id', 0, profile.school_id),
+                ('username', 1, profile.user.username),
+                ('qr_code_data', 2, profile.qr_code_data),
+            )
+            for source, priority, value in sources:
+                key = normalize(value)
+                if key and key not in seen:
+                    seen.add(key)
+                    keys.append(ScanKey(user_profile=profile, key=key, source=source, priority=priority))
+        ScanKey.objects.bulk_create(keys)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_alter_userprofile_school_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(db_index=True, max_length=150)),
+                ('source', models.CharField(choices=[('school_id', 'School ID'), ('username', 'Username'), ('qr_code_data', 'Legacy QR Code')], max_length=20)),
+                ('priority', models.PositiveSmallIntegerField(default=0)),
+                ('user_profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scan_keys', to='core.userprofile')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='scankey',
+            constraint=models.UniqueConstraint(fields=('key', 'user_profile'), name='unique_scan_key_per_profile'),
+        ),
+        migrations.RunPython(build_scan_keys, migrations.RunPython.noop),
+    ]
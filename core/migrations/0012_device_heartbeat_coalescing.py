@@ -0,0 +1,41 @@
+# Generated by Django 5.0.6 on 2026-10-17 03:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_scankey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='last_sensor_data',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='log_heartbeats',
+            field=models.BooleanField(default=False, help_text='Debug: keep a log entry for every heartbeat'),
+        ),
+        migrations.CreateModel(
+            name='DeviceSensorSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('sample_count', models.PositiveIntegerField(default=0)),
+                ('min_values', models.JSONField(blank=True, default=dict)),
+                ('max_values', models.JSONField(blank=True, default=dict)),
+                ('last_values', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sensor_samples', to='core.device')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='devicesensorsample',
+            constraint=models.UniqueConstraint(fields=('device', 'bucket_start'), name='unique_sensor_sample_bucket'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-17 03:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_device_heartbeat_coalescing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceLogRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('log_type', models.CharField(choices=[('bottle_detected', 'Bottle Detected'), ('bottle_sorted', 'Bottle Sorted'), ('error', 'Error'), ('maintenance', 'Maintenance'), ('heartbeat', 'Heartbeat')], max_length=20)),
+                ('sort_result', models.CharField(blank=True, choices=[('plastic', 'Plastic (Valid)'), ('invalid', 'Invalid (Not Plastic)'), ('error', 'Error')], default='', max_length=10)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_rollups', to='core.device')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='devicelogrollup',
+            constraint=models.UniqueConstraint(fields=('device', 'hour', 'log_type', 'sort_result'), name='unique_device_log_rollup'),
+        ),
+    ]
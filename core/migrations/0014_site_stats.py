@@ -0,0 +1,44 @@
+# Generated by Django 5.0.6 on 2026-10-17 03:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_devicelogrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_entries', models.BigIntegerField(default=0)),
+                ('total_bottles', models.BigIntegerField(default=0)),
+                ('total_points_earned', models.BigIntegerField(default=0)),
+                ('total_redemptions', models.BigIntegerField(default=0)),
+                ('total_points_redeemed', models.BigIntegerField(default=0)),
+                ('points_outstanding', models.BigIntegerField(default=0)),
+                ('devices_total', models.IntegerField(default=0)),
+                ('devices_online', models.IntegerField(default=0)),
+                ('devices_offline', models.IntegerField(default=0)),
+                ('devices_maintenance', models.IntegerField(default=0)),
+                ('devices_error', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Site stats',
+            },
+        ),
+        migrations.AddField(
+            model_name='rewarditem',
+            name='points_redeemed',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='rewarditem',
+            name='times_redeemed',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
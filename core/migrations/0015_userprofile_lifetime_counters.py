@@ -0,0 +1,51 @@
+# Generated by Django 5.0.6 on 2026-10-17 03:07
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_counters(apps, schema_editor):
+    """Fill the new counters from existing entries and redemptions"""
+    UserProfile = apps.get_model('core', 'UserProfile')
+    Entry = apps.get_model('core', 'Entry')
+    RedeemedPoints = apps.get_model('core', 'RedeemedPoints')
+    deposits = {
+        row['user_profile_id']: row
+        for row in Entry.objects.values('user_profile_id').annotate(bottles=Sum('no_bottle'), points=Sum('points'))
+    }
+    redeemed = dict(
+        RedeemedPoints.objects.values('user_profile_id').annotate(points=Sum('redeemed_points')).values_list('user_profile_id', 'points')
+    )
+    profiles = []
+    for profile in UserProfile.objects.filter(pk__in=set(deposits) | set(redeemed)).only('id').iterator(chunk_size=2000):
+        profile.total_bottles = deposits.get(profile.pk, {}).get('bottles') or 0
+        profile.points_earned = deposits.get(profile.pk, {}).get('points') or 0
+        profile.points_redeemed = redeemed.get(profile.pk) or 0
+        profiles.append(profile)
+    UserProfile.objects.bulk_update(profiles, ['total_bottles', 'points_earned', 'points_redeemed'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_site_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='points_earned',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='points_redeemed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='total_bottles',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
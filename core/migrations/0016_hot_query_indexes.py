@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-17 03:07
+
+from django.db import migrations, models
+
+from core.migration_operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0015_userprofile_lifetime_counters'),
+    ]
+
+    # The created_at list and range queries are indexed by 0017's (-created_at, -id)
+    # indexes, so no created_at-only index is built here just to be replaced
+    operations = [
+        AddIndexConcurrently(
+            model_name='entry',
+            index=models.Index(fields=['user_profile', '-created_at'], name='entry_profile_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='redeemedpoints',
+            index=models.Index(fields=['user_profile', 'created_at'], name='redeemed_profile_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='userprofile',
+            index=models.Index(fields=['-total_points'], name='profile_points_idx'),
+        ),
+    ]
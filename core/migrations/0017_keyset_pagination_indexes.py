@@ -0,0 +1,35 @@
+# Generated by Django 5.0.6 on 2026-10-17 05:12
+
+from django.db import migrations, models
+
+from core.migration_operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0016_hot_query_indexes'),
+    ]
+
+    # (-created_at, -id) serves the keyset pages and plain created_at ranges alike
+    operations = [
+        AddIndexConcurrently(
+            model_name='devicelog',
+            index=models.Index(fields=['device', '-created_at', '-id'], name='devicelog_dev_created_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='devicelog',
+            index=models.Index(fields=['-created_at', '-id'], name='devicelog_created_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='entry',
+            index=models.Index(fields=['-created_at', '-id'], name='entry_created_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='redeemedpoints',
+            index=models.Index(fields=['-created_at', '-id'], name='redeemed_created_id_idx'),
+        ),
+    ]
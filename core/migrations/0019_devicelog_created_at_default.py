@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-17 03:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_sequencecounter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='devicelog',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-17 03:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_devicelog_created_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetectionEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=64)),
+                ('status_code', models.PositiveSmallIntegerField(default=200)),
+                ('response', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='detection_events', to='core.device')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='detectionevent_created_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='detectionevent',
+            constraint=models.UniqueConstraint(fields=('device', 'event_id'), name='unique_device_detection_event'),
+        ),
+    ]
@@ -7,7 +7,7 @@
 
 from django.db import models
 from django.contrib.auth.models import User
-from datetime import datetime
+from django.utils import timezone
 
 # Extends Django's built-in User model to include points
 class UserProfile(models.Model):
@@ -19,6 +19,10 @@ class UserProfile(models.Model):
     
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     total_points = models.PositiveIntegerField(default=0)
+    # Lifetime counters, updated together with total_points by core.ledger
+    total_bottles = models.PositiveIntegerField(default=0)
+    points_earned = models.PositiveIntegerField(default=0)
+    points_redeemed = models.PositiveIntegerField(default=0)
     # School ID Number - Works for ALL user types (students, teachers, admins)
     # Format: C22-0369 for students (C=class, 22=year, 0369=student number)
     # Format: SMCIC-***-**** for faculty/teachers
@@ -35,6 +39,12 @@ class UserProfile(models.Model):
     # User type field to distinguish between student, teacher, and admin
     user_type = models.CharField(max_length=10, choices=USER_TYPE_CHOICES, default='student')
 
+    class Meta:
+        indexes = [
+            # Leaderboards: order_by('-total_points')
+            models.Index(fields=['-total_points'], name='profile_points_idx'),
+        ]
+
     def __str__(self):
         return self.user.username
     
@@ -44,26 +54,10 @@ class UserProfile(models.Model):
         Generate a student ID in format: C22-0369
         C = class, 22 = year, 0369 = sequential number
         This is OPTIONAL - admins can manually enter any ID
+        Allocated from a per-year counter (core/school_ids.py), so it is never handed out twice
         """
-        if year is None:
-            year = datetime.now().year % 100  # Get last 2 digits of year
-        
-        # Get the last student ID for this year
-        last_student = UserProfile.objects.filter(
-            user_type='student',
-            school_id__startswith=f'C{year:02d}-'
-        ).order_by('-school_id').first()
-        
-        if last_student and last_student.school_id:
-            try:
-                last_number = int(last_student.school_id.split('-')[1])
-                next_number = last_number + 1
-            except (IndexError, ValueError):
-                next_number = 1
-        else:
-            next_number = 1
-        
-        return f'C{year:02d}-{next_number:04d}'
+        from .school_ids import allocate_one
+        return allocate_one('student', year)
     
     @staticmethod
     def generate_faculty_id():
@@ -71,27 +65,8 @@ class UserProfile(models.Model):
         Generate a faculty ID in format: SMCIC-001-0001
         This is OPTIONAL - admins can manually enter any ID
         """
-        # Get the last faculty ID
-        last_faculty = UserProfile.objects.filter(
-            user_type='teacher',
-            school_id__startswith='SMCIC-'
-        ).order_by('-school_id').first()
-        
-        if last_faculty and last_faculty.school_id:
-            try:
-                parts = last_faculty.school_id.split('-')
-                if len(parts) >= 3:
-                    dept_num = int(parts[1])
-                    seq_num = int(parts[2])
-                    seq_num += 1
-                    if seq_num > 9999:
-                        dept_num += 1
-                        seq_num = 1
-                    return f'SMCIC-{dept_num:03d}-{seq_num:04d}'
-            except (IndexError, ValueError):
-                pass
-        
-        return 'SMCIC-001-0001'
+        from .school_ids import allocate_one
+        return allocate_one('teacher')
     
     def save(self, *args, **kwargs):
         """
@@ -111,6 +86,133 @@ class UserProfile(models.Model):
                 pass  # Leave empty - admin will fill it manually
         
         super().save(*args, **kwargs)
+        self.sync_scan_keys()
+    
+    # Only ever changed through core.ledger
+    LEDGER_FIELDS = ('total_points', 'total_bottles', 'points_earned', 'points_redeemed')
+    
+    def save_details(self):
+        """
+        Save everything except the balance and lifetime counters, so a stale
+        in-memory value can never overwrite what core.ledger has written.
+        """
+        fields = [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.name not in self.LEDGER_FIELDS
+        ]
+        self.save(update_fields=fields)
+    
+    def scan_key_candidates(self):
+        """
+        Return {normalized key: (source, priority)} for every spelling a device
+        may scan for this user. Lower priority wins if two users share a key,
+        matching the old lookup order: school ID, then username, then QR data.
+        """
+        candidates = {}
+        sources = (
+            ('school_id', 0, self.school_id),
+            ('username', 1, self.user.username),
+            ('qr_code_data', 2, self.qr_code_data),
+        )
+        for source, priority, value in sources:
+            key = ScanKey.normalize(value)
+            if key and key not in candidates:
+                candidates[key] = (source, priority)
+        return candidates
+    
+    def sync_scan_keys(self):
+        """Bring this profile's ScanKey rows in line with its current identifiers"""
+        wanted = self.scan_key_candidates()
+        existing = {
+            key.key: (key.source, key.priority)
+            for key in ScanKey.objects.filter(user_profile=self)
+        }
+        if existing == wanted:
+            return
+        ScanKey.objects.filter(user_profile=self).delete()
+        ScanKey.objects.bulk_create([
+            ScanKey(user_profile=self, key=key, source=source, priority=priority)
+            for key, (source, priority) in wanted.items()
+        ])
+        # Identifiers changed, so the "did you mean" index is out of date
+        from .id_suggestions import invalidate
+        invalidate()
+
+# Normalized identifiers (school ID, username, legacy QR data) a device may scan.
+# Lets api_user_verify resolve any accepted spelling with one indexed query.
+class ScanKey(models.Model):
+    SOURCE_CHOICES = [
+        ('school_id', 'School ID'),
+        ('username', 'Username'),
+        ('qr_code_data', 'Legacy QR Code'),
+    ]
+    
+    key = models.CharField(max_length=150, db_index=True)
+    user_profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='scan_keys')
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    priority = models.PositiveSmallIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'user_profile'], name='unique_scan_key_per_profile'),
+        ]
+    
+    def __str__(self):
+        return f"{self.key} -> {self.user_profile}"
+    
+    @staticmethod
+    def normalize(code):
+        """Canonical scan form: trimmed, upper-cased, without hyphens or spaces (C22-0369 -> C220369)"""
+        if not code:
+            return ''
+        return code.strip().upper().replace('-', '').replace(' ', '')
+    
+    @classmethod
+    def resolve(cls, code):
+        """Return (profile, source) for a scanned code, or (None, None)"""
+        key = cls.normalize(code)
+        if not key:
+            return None, None
+        match = cls.objects.select_related('user_profile__user').filter(key=key).order_by('priority').first()
+        if match is None:
+            return None, None
+        return match.user_profile, match.source
+    
+    @classmethod
+    def resolve_many(cls, codes):
+        """Return {code: profile} for every code that matches, using a single query"""
+        keys = {code: cls.normalize(code) for code in codes if cls.normalize(code)}
+        best = {}
+        matches = cls.objects.select_related('user_profile__user').filter(
+            key__in=set(keys.values())
+        ).order_by('-priority')
+        for match in matches:
+            best[match.key] = match.user_profile  # lowest priority is written last and wins
+        return {code: best[key] for code, key in keys.items() if key in best}
+
+def rebuild_scan_keys(batch_size=1000, progress=None):
+    """Rebuild the ScanKey rows of every profile, one transaction per batch. Returns (profiles, keys)."""
+    from django.db import transaction
+    profiles = UserProfile.objects.select_related('user').order_by('pk')
+    total_profiles = total_keys = last_pk = 0
+    while True:
+        batch = list(profiles.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        keys = [
+            ScanKey(user_profile=profile, key=key, source=source, priority=priority)
+            for profile in batch
+            for key, (source, priority) in profile.scan_key_candidates().items()
+        ]
+        with transaction.atomic():
+            ScanKey.objects.filter(user_profile__in=batch).delete()
+            ScanKey.objects.bulk_create(keys)
+        total_profiles += len(batch)
+        total_keys += len(keys)
+        if progress:
+            progress(total_profiles)
+    return total_profiles, total_keys
 
 # A record of a bottle deposit transaction
 class Entry(models.Model):
@@ -119,6 +221,14 @@ class Entry(models.Model):
     points = models.PositiveIntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # A user's recent deposits: filter(user_profile=...).order_by('-created_at')
+            models.Index(fields=['user_profile', '-created_at'], name='entry_profile_created_idx'),
+            # Recent activity counts and the keyset-paginated transactions list
+            models.Index(fields=['-created_at', '-id'], name='entry_created_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user_profile.user.username} - {self.points} points"
 
@@ -130,10 +240,24 @@ class RewardItem(models.Model):
     # quantity = models.PositiveIntegerField(default=100)
     # is_active = models.BooleanField(default=True)
     image = models.ImageField(upload_to='rewards/', null=True, blank=True) # Image for reward icon
+    # Redemption counters, incremented by core.ledger (used by the admin dashboard)
+    times_redeemed = models.PositiveIntegerField(default=0, editable=False)
+    points_redeemed = models.PositiveBigIntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = ('times_redeemed', 'points_redeemed')
 
     def __str__(self):
         return self.reward_name
 
+    def save(self, *args, **kwargs):
+        # Don't let an edit form overwrite counters that redemptions are incrementing
+        if not self._state.adding and not kwargs.get('update_fields') and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
 # A record of when a user redeems their points for a reward
 class RedeemedPoints(models.Model):
     user_profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE)
@@ -142,23 +266,33 @@ class RedeemedPoints(models.Model):
     receipt_number = models.CharField(max_length=30, unique=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # A user's valid redemptions: filter(user_profile=..., created_at__gte=...)
+            models.Index(fields=['user_profile', 'created_at'], name='redeemed_profile_created_idx'),
+            # Recent redemption counts and the keyset-paginated redemption history
+            models.Index(fields=['-created_at', '-id'], name='redeemed_created_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user_profile.user.username} redeemed {self.reward_item.reward_name}"
     
     def generate_receipt_number(self):
-        """Generate unique receipt number like SMCEcoDrop-2025-10232145"""
-        import random
+        """
+        Generate unique receipt number like SMCEcoDrop-2025-10232145000123:
+        the redemption minute (MMDDHHMI) followed by a 6-digit sequence number
+        from core.sequences, so no existence checks are needed. The sequence is
+        global, so two receipts in the same minute can only clash after a
+        million redemptions; the unique constraint still backs that up.
+        """
         from django.utils import timezone
+        from .sequences import receipt_numbers
         
         now = timezone.now()
         year = now.strftime('%Y')
         date_time = now.strftime('%m%d%H%M')  # MMDDHHMI format
-        
-        while True:
-            random_num = random.randint(10, 99)
-            receipt_num = f"SMCEcoDrop-{year}-{date_time}{random_num}"
-            if not RedeemedPoints.objects.filter(receipt_number=receipt_num).exists():
-                return receipt_num
+        sequence = receipt_numbers.next() % 1000000
+        return f"SMCEcoDrop-{year}-{date_time}{sequence:06d}"
     
     def save(self, *args, **kwargs):
         if not self.receipt_number:
@@ -193,12 +327,34 @@ class Device(models.Model):
     status = models.CharField(max_length=20, choices=DEVICE_STATUS_CHOICES, default='offline')
     last_heartbeat = models.DateTimeField(null=True, blank=True)
     total_bottles_processed = models.PositiveIntegerField(default=0)
+    # Latest sensor snapshot from the last heartbeat (updated in place, no log row)
+    last_sensor_data = models.JSONField(null=True, blank=True)
+    # Debug mode: also store a DeviceLog row for every heartbeat
+    log_heartbeats = models.BooleanField(default=False, help_text="Debug: keep a log entry for every heartbeat")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.device_name} ({self.device_id})"
 
+# Down-sampled heartbeat sensor history: one row per device per time bucket
+class DeviceSensorSample(models.Model):
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='sensor_samples')
+    bucket_start = models.DateTimeField()
+    sample_count = models.PositiveIntegerField(default=0)
+    min_values = models.JSONField(default=dict, blank=True)   # numeric readings only
+    max_values = models.JSONField(default=dict, blank=True)   # numeric readings only
+    last_values = models.JSONField(default=dict, blank=True)  # latest snapshot in the bucket
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'bucket_start'], name='unique_sensor_sample_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.device.device_name} sensors at {self.bucket_start}"
+
 # Device activity logs
 class DeviceLog(models.Model):
     LOG_TYPE_CHOICES = [
@@ -220,7 +376,93 @@ class DeviceLog(models.Model):
     sort_result = models.CharField(max_length=10, choices=SORT_RESULT_CHOICES, null=True, blank=True)
     sensor_data = models.JSONField(null=True, blank=True)  # Store IR/CAP sensor readings
     message = models.TextField(blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: rows drained from core/log_queue.py keep the time they were logged
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # One device's log pages in the console
+            models.Index(fields=['device', '-created_at', '-id'], name='devicelog_dev_created_id_idx'),
+            # Latest logs across all devices (keyset pages), dashboard counts since a date,
+            # and retention scans on old rows
+            models.Index(fields=['-created_at', '-id'], name='devicelog_created_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.device.device_name} - {self.log_type} at {self.created_at}"
+
+# Hourly per-device summary of DeviceLog rows that have aged out of retention
+class DeviceLogRollup(models.Model):
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='log_rollups')
+    hour = models.DateTimeField()
+    log_type = models.CharField(max_length=20, choices=DeviceLog.LOG_TYPE_CHOICES)
+    # '' instead of NULL so the unique constraint also covers logs without a result
+    sort_result = models.CharField(max_length=10, choices=DeviceLog.SORT_RESULT_CHOICES, blank=True, default='')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['device', 'hour', 'log_type', 'sort_result'],
+                name='unique_device_log_rollup'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.device.device_name} - {self.log_type} x{self.count} at {self.hour}"
+
+# Detection events a device has already reported, by the event ID it sent,
+# with the response it got; a retried POST is answered from here instead of
+# being credited again (see core/detection_events.py). Pruned after a few days.
+class DetectionEvent(models.Model):
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='detection_events')
+    event_id = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(default=200)
+    response = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'event_id'], name='unique_device_detection_event'),
+        ]
+        indexes = [
+            # Retention deletes by age
+            models.Index(fields=['created_at'], name='detectionevent_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.device.device_name} event {self.event_id}"
+
+# Running totals for the admin dashboard, kept up to date as entries,
+# redemptions and device status changes are written (see core/stats.py).
+# Single row (pk=1); `python manage.py rebuild_site_stats` recomputes it.
+class SiteStats(models.Model):
+    total_entries = models.BigIntegerField(default=0)
+    total_bottles = models.BigIntegerField(default=0)
+    total_points_earned = models.BigIntegerField(default=0)
+    total_redemptions = models.BigIntegerField(default=0)
+    total_points_redeemed = models.BigIntegerField(default=0)
+    # Sum of every UserProfile.total_points
+    points_outstanding = models.BigIntegerField(default=0)
+    devices_total = models.IntegerField(default=0)
+    devices_online = models.IntegerField(default=0)
+    devices_offline = models.IntegerField(default=0)
+    devices_maintenance = models.IntegerField(default=0)
+    devices_error = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Site stats"
+
+    def __str__(self):
+        return f"Site stats (updated {self.updated_at})"
+
+# Named counters handed out in blocks by core/sequences.py (receipt numbers,
+# school IDs). `value` is the last number reserved by any process.
+class SequenceCounter(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    value = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
@@ -0,0 +1,34 @@
+# ======================================================================
+# core/passwords.py
+# Password hashing for bulk jobs. PBKDF2 is deliberately slow (hundreds
+# of milliseconds a hash), so thousands of new accounts are hashed in a
+# pool of worker processes. Kept free of model imports so spawned
+# workers can load it without setting up the app registry.
+# ======================================================================
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+HASH_WORKERS = getattr(settings, 'IMPORT_WORKERS', None) or os.cpu_count() or 1
+HASHES_PER_CHUNK = 50
+
+
+def _hash_chunk(passwords):
+    """Worker entry point"""
+    return [make_password(password) for password in passwords]
+
+
+def hash_passwords(passwords, workers=HASH_WORKERS, chunk_size=HASHES_PER_CHUNK):
+    """Hash a list of passwords across a process pool, preserving order"""
+    passwords = list(passwords)
+    if workers <= 1 or len(passwords) <= chunk_size:
+        return _hash_chunk(passwords)
+    chunks = [passwords[start:start + chunk_size] for start in range(0, len(passwords), chunk_size)]
+    # spawn, not fork: forking a threaded web worker can deadlock the child
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        return [hashed for chunk in pool.map(_hash_chunk, chunks) for hashed in chunk]
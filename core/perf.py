@@ -0,0 +1,268 @@
+# ======================================================================
+# core/perf.py
+# Per-route request timing. PerfMiddleware wraps the database connection
+# for the length of each request and records wall time, query count and
+# time spent in the database, per URL name, into fixed-bucket histograms
+# (memory stays bounded however many requests are served). The same SQL
+# run many times with different parameters in one request is flagged as
+# a likely N+1, and SELECTs slower than PERF_EXPLAIN_MS can have their
+# query plan captured. Works for sync and async (ASGI) requests alike:
+# the current request's recorder travels in a context variable, which
+# also reaches the threads the async ORM runs queries in. Figures are
+# per worker process.
+# ======================================================================
+
+import bisect
+import contextvars
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+PERF_MONITORING = getattr(settings, 'PERF_MONITORING', True)
+# Same SQL (ignoring parameters) this many times in one request is reported as N+1
+PERF_N_PLUS_ONE_THRESHOLD = getattr(settings, 'PERF_N_PLUS_ONE_THRESHOLD', 5)
+# Capture EXPLAIN output for SELECTs slower than this many ms (0 = off)
+PERF_EXPLAIN_MS = getattr(settings, 'PERF_EXPLAIN_MS', 0)
+
+# Upper bounds (ms) of the histogram buckets, roughly 1-2-5 spaced; the last bucket is open-ended
+BUCKETS_MS = (1, 2, 5, 10, 20, 35, 50, 75, 100, 150, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000, 30000)
+MAX_ROUTES = 200
+MAX_SUSPECTS_PER_ROUTE = 10
+MAX_SLOW_QUERIES = 25
+
+
+class Histogram:
+    """Counts per fixed latency bucket; percentiles are the bucket's upper bound (capped at the max seen)"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(BUCKETS_MS, value)] += 1
+        self.total += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction):
+        if not self.total:
+            return 0
+        wanted = fraction * self.total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted:
+                bound = BUCKETS_MS[index] if index < len(BUCKETS_MS) else self.max
+                return round(min(bound, self.max), 1)
+        return round(self.max, 1)
+
+    @property
+    def mean(self):
+        return self.sum / self.total if self.total else 0
+
+
+class RouteStats:
+    def __init__(self):
+        self.wall = Histogram()
+        self.db = Histogram()
+        self.queries = 0
+        self.max_queries = 0
+        self.suspects = {}  # sql -> (times in one request, example params, seen_at)
+
+    def summary(self, route):
+        requests = self.wall.total
+        return {
+            'route': route,
+            'requests': requests,
+            'p50': self.wall.percentile(0.50),
+            'p95': self.wall.percentile(0.95),
+            'p99': self.wall.percentile(0.99),
+            'max': round(self.wall.max, 1),
+            'db_mean': round(self.db.mean, 1),
+            'db_p95': self.db.percentile(0.95),
+            'queries_mean': round(self.queries / requests, 1) if requests else 0,
+            'max_queries': self.max_queries,
+            'suspects': sorted(
+                ({'sql': sql, 'count': count, 'example': example} for sql, (count, example, _) in self.suspects.items()),
+                key=lambda suspect: -suspect['count']
+            ),
+        }
+
+
+_lock = threading.Lock()
+_routes = {}
+_slow_queries = deque(maxlen=MAX_SLOW_QUERIES)
+_started_at = time.time()
+_current = contextvars.ContextVar('perf_recorder', default=None)
+
+
+class QueryRecorder:
+    """Times every query of one request (called through _record_query)"""
+
+    def __init__(self):
+        self.count = 0
+        self.db_ms = 0.0
+        self.by_sql = {}    # sql -> number of executions
+        self.examples = {}  # sql -> params of the first execution
+        self.slow = []      # (ms, sql, params)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.count += 1
+            self.db_ms += elapsed
+            self.by_sql[sql] = self.by_sql.get(sql, 0) + 1
+            self.examples.setdefault(sql, params)
+            if PERF_EXPLAIN_MS and elapsed >= PERF_EXPLAIN_MS and not many and sql.lstrip().upper().startswith('SELECT'):
+                self.slow.append((elapsed, sql, params))
+
+
+def _record_query(execute, sql, params, many, context):
+    """Installed on every connection; hands the query to the current request's recorder, if any"""
+    recorder = _current.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def _install(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+connection_created.connect(_install)
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    return match.view_name or match.route
+
+
+def record(route, wall_ms, recorder):
+    with _lock:
+        stats = _routes.get(route)
+        if stats is None:
+            if len(_routes) >= MAX_ROUTES:
+                return
+            stats = _routes[route] = RouteStats()
+        stats.wall.add(wall_ms)
+        stats.db.add(recorder.db_ms)
+        stats.queries += recorder.count
+        stats.max_queries = max(stats.max_queries, recorder.count)
+        for sql, count in recorder.by_sql.items():
+            if count >= PERF_N_PLUS_ONE_THRESHOLD:
+                previous = stats.suspects.get(sql)
+                if previous is None and len(stats.suspects) >= MAX_SUSPECTS_PER_ROUTE:
+                    continue
+                stats.suspects[sql] = (max(count, previous[0] if previous else 0), recorder.examples.get(sql), time.time())
+
+
+def explain(sql, params):
+    """Query plan text for a SELECT, using the backend's own EXPLAIN syntax"""
+    prefix = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+    with connection.cursor() as cursor:
+        cursor.execute(f'{prefix} {sql}', params)
+        return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+
+def capture_slow_queries(route, recorder):
+    for elapsed, sql, params in recorder.slow:
+        try:
+            plan = explain(sql, params)
+        except Exception as e:  # the plan is a diagnostic; never fail the request over it
+            plan = f'EXPLAIN failed: {e}'
+        with _lock:
+            _slow_queries.appendleft({
+                'route': route,
+                'ms': round(elapsed, 1),
+                'sql': sql,
+                'params': params,
+                'plan': plan,
+                'at': time.time(),
+            })
+
+
+class PerfMiddleware:
+    """
+    Times each request and its queries. Only the view and template rendering
+    are covered; the body of a streaming response is produced after this returns.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not PERF_MONITORING:
+            return self.get_response(request)
+        _install(connection)  # in case this thread connected before we were loaded
+        recorder = QueryRecorder()
+        token = _current.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        route = route_name(request)
+        if route:
+            record(route, (time.perf_counter() - started) * 1000, recorder)
+            if recorder.slow:
+                capture_slow_queries(route, recorder)
+        return response
+
+    async def __acall__(self, request):
+        if not PERF_MONITORING:
+            return await self.get_response(request)
+        recorder = QueryRecorder()
+        token = _current.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        route = route_name(request)
+        if route:
+            record(route, (time.perf_counter() - started) * 1000, recorder)
+            if recorder.slow:
+                await sync_to_async(capture_slow_queries)(route, recorder)
+        return response
+
+
+def snapshot():
+    """Per-route summaries (slowest p95 first), recent slow queries, and how long we've been collecting"""
+    with _lock:
+        routes = [stats.summary(route) for route, stats in _routes.items()]
+        slow = list(_slow_queries)
+    routes.sort(key=lambda summary: (-summary['p95'], summary['route']))
+    return {
+        'routes': routes,
+        'slow_queries': slow,
+        'since': _started_at,
+        'buckets': BUCKETS_MS,
+    }
+
+
+def reset():
+    global _started_at
+    with _lock:
+        _routes.clear()
+        _slow_queries.clear()
+        _started_at = time.time()
@@ -0,0 +1,116 @@
+# ======================================================================
+# core/retention.py
+# DeviceLog retention. Raw logs older than the retention window are
+# rolled up into per-device, per-hour DeviceLogRollup counts (by
+# log_type and sort_result) and then deleted in small chunks, each in
+# its own short transaction, so the table is never locked for long.
+# Old sensor samples and detection event IDs are simply deleted.
+# ======================================================================
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import DetectionEvent, DeviceLog, DeviceLogRollup, DeviceSensorSample
+
+DEVICE_LOG_RETENTION_DAYS = getattr(settings, 'DEVICE_LOG_RETENTION_DAYS', 30)
+SENSOR_SAMPLE_RETENTION_DAYS = getattr(settings, 'SENSOR_SAMPLE_RETENTION_DAYS', 90)
+# Device retries come within minutes; the stored responses only need to outlive them
+DETECTION_EVENT_RETENTION_DAYS = getattr(settings, 'DETECTION_EVENT_RETENTION_DAYS', 7)
+PRUNE_CHUNK_SIZE = getattr(settings, 'DEVICE_LOG_PRUNE_CHUNK_SIZE', 5000)
+
+
+def rollup_chunk(cutoff, chunk_size=PRUNE_CHUNK_SIZE):
+    """
+    Summarize and delete up to chunk_size raw logs older than cutoff in one
+    transaction. Returns the number of raw rows removed (0 when done).
+    """
+    with transaction.atomic():
+        ids = list(
+            DeviceLog.objects.filter(created_at__lt=cutoff)
+            .order_by('created_at', 'id')
+            .values_list('id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return 0
+
+        groups = (
+            DeviceLog.objects.filter(id__in=ids)
+            .annotate(hour=TruncHour('created_at'))
+            .values('device_id', 'hour', 'log_type', 'sort_result')
+            .annotate(total=Count('id'))
+        )
+        for group in groups:
+            key = {
+                'device_id': group['device_id'],
+                'hour': group['hour'],
+                'log_type': group['log_type'],
+                'sort_result': group['sort_result'] or '',
+            }
+            updated = DeviceLogRollup.objects.filter(**key).update(count=F('count') + group['total'])
+            if not updated:
+                DeviceLogRollup.objects.create(count=group['total'], **key)
+
+        DeviceLog.objects.filter(id__in=ids).delete()
+        return len(ids)
+
+
+def prune_device_logs(older_than_days=DEVICE_LOG_RETENTION_DAYS, chunk_size=PRUNE_CHUNK_SIZE, max_chunks=None, progress=None):
+    """Roll up and delete raw logs older than the retention window. Returns rows removed."""
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    removed = 0
+    chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        count = rollup_chunk(cutoff, chunk_size)
+        if not count:
+            break
+        removed += count
+        chunks += 1
+        if progress:
+            progress(removed)
+    return removed
+
+
+def prune_sensor_samples(older_than_days=SENSOR_SAMPLE_RETENTION_DAYS):
+    """Delete down-sampled heartbeat history older than its retention window"""
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    deleted, _ = DeviceSensorSample.objects.filter(bucket_start__lt=cutoff).delete()
+    return deleted
+
+
+def prune_detection_events(older_than_days=DETECTION_EVENT_RETENTION_DAYS, chunk_size=PRUNE_CHUNK_SIZE):
+    """Delete stored detection event IDs older than their retention window, in chunks"""
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    deleted = 0
+    while True:
+        ids = list(
+            DetectionEvent.objects.filter(created_at__lt=cutoff)
+            .values_list('id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return deleted
+        count, _ = DetectionEvent.objects.filter(id__in=ids).delete()
+        deleted += count
+
+
+def device_log_counts(since, **filters):
+    """
+    Return {device pk: number of logs since `since`}, combining hourly rollups
+    with the raw rows that haven't been rolled up yet.
+    """
+    counts = {}
+    rolled = (
+        DeviceLogRollup.objects.filter(hour__gte=since, **filters)
+        .values('device_id').annotate(total=Sum('count'))
+    )
+    raw = (
+        DeviceLog.objects.filter(created_at__gte=since, **filters)
+        .values('device_id').annotate(total=Count('id'))
+    )
+    for row in list(rolled) + list(raw):
+        counts[row['device_id']] = counts.get(row['device_id'], 0) + row['total']
+    return counts
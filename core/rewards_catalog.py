@@ -0,0 +1,90 @@
+# ======================================================================
+# core/rewards_catalog.py
+# The rewards catalog, held in memory per worker. Rewards change rarely
+# but every student browses them, so the list, a token/prefix index over
+# reward names and a points-sorted view are built once per catalog
+# version. The version is a counter (core/sequences.py) bumped after any
+# RewardItem save/delete commits, so every worker notices the change on
+# its next request with one single-row read; it also feeds the ETag.
+# ======================================================================
+
+import bisect
+import re
+import threading
+
+from django.db import transaction
+
+from .models import RewardItem
+from . import sequences
+
+VERSION_COUNTER = 'catalog:rewards'
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+class Catalog:
+    """Rewards ordered by (points_required, pk), with a sorted token list for prefix search"""
+
+    def __init__(self, version, rewards):
+        self.version = version
+        self.rewards = sorted(rewards, key=lambda reward: (reward.points_required, reward.pk))
+        self.points = [reward.points_required for reward in self.rewards]
+        # (token, position) for every word of the name, plus the points as text
+        self.tokens = sorted(
+            (token, position)
+            for position, reward in enumerate(self.rewards)
+            for token in set(tokenize(reward.reward_name)) | {str(reward.points_required)}
+        )
+        self.token_keys = [token for token, _ in self.tokens]
+
+    def __len__(self):
+        return len(self.rewards)
+
+    def _prefix_matches(self, prefix):
+        start = bisect.bisect_left(self.token_keys, prefix)
+        end = bisect.bisect_left(self.token_keys, prefix + '\uffff')
+        return {position for _, position in self.tokens[start:end]}
+
+    def search(self, query='', min_points=None, max_points=None):
+        """
+        Rewards whose name has a word starting with every term of the query
+        (or whose points start with a numeric term), within the points range.
+        """
+        start = bisect.bisect_left(self.points, min_points) if min_points is not None else 0
+        end = bisect.bisect_right(self.points, max_points) if max_points is not None else len(self.points)
+        terms = tokenize(query)
+        if not terms:
+            return self.rewards[start:end]
+        matches = None
+        for term in terms:
+            found = self._prefix_matches(term)
+            matches = found if matches is None else matches & found
+            if not matches:
+                return []
+        return [self.rewards[position] for position in sorted(matches) if start <= position < end]
+
+
+_lock = threading.Lock()
+_catalog = None
+
+
+def get_catalog():
+    """The current catalog, rebuilt (one query) only when the version has moved"""
+    global _catalog
+    # Read the version before the rows, so the cached rows are never older than their version
+    version = sequences.current(VERSION_COUNTER)
+    with _lock:
+        if _catalog is not None and _catalog.version == version:
+            return _catalog
+    catalog = Catalog(version, RewardItem.objects.all())
+    with _lock:
+        _catalog = catalog
+    return catalog
+
+
+def invalidate():
+    """Bump the catalog version once the current transaction commits (called on RewardItem save/delete)"""
+    transaction.on_commit(lambda: sequences.reserve(VERSION_COUNTER))
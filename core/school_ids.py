@@ -0,0 +1,88 @@
+# ======================================================================
+# core/school_ids.py
+# Student/Faculty ID allocation from per-prefix counters (core/sequences.py)
+# instead of sorting existing IDs. Each prefix (C25-, SMCIC) has its own
+# counter, seeded once from the highest existing ID. Allocation reserves
+# numbers with one UPDATE, so concurrent admins and bulk imports never get
+# the same ID; IDs already typed in by hand are skipped.
+#   Students: C25-0001  (C, 2-digit enrollment year, sequence)
+#   Faculty:  SMCIC-001-0001  (department block, sequence 0001-9999)
+# ======================================================================
+
+import re
+from datetime import datetime
+
+from .models import UserProfile
+from . import sequences
+
+FACULTY_PREFIX = 'SMCIC'
+FACULTY_PER_DEPARTMENT = 9999
+_STUDENT_RE = re.compile(r'^C\d{2}-(\d+)$')
+_FACULTY_RE = re.compile(r'^SMCIC-(\d{3})-(\d{4})$')
+
+
+def student_prefix(year=None):
+    if year is None:
+        year = datetime.now().year % 100  # Last 2 digits of year
+    return f'C{year % 100:02d}-'
+
+
+def _format(user_type, prefix, number):
+    if user_type == 'teacher':
+        department, sequence = divmod(number - 1, FACULTY_PER_DEPARTMENT)
+        return f'{FACULTY_PREFIX}-{department + 1:03d}-{sequence + 1:04d}'
+    return f'{prefix}{number:04d}'
+
+
+def _highest_existing(user_type, prefix):
+    """Largest sequence number already used under prefix; only runs when a counter is first created"""
+    highest = 0
+    if user_type == 'teacher':
+        for school_id in UserProfile.objects.filter(school_id__startswith=f'{FACULTY_PREFIX}-').values_list('school_id', flat=True):
+            match = _FACULTY_RE.match(school_id)
+            if match:
+                number = (int(match.group(1)) - 1) * FACULTY_PER_DEPARTMENT + int(match.group(2))
+                highest = max(highest, number)
+    else:
+        for school_id in UserProfile.objects.filter(school_id__startswith=prefix).values_list('school_id', flat=True):
+            match = _STUDENT_RE.match(school_id)
+            if match:
+                highest = max(highest, int(match.group(1)))
+    return highest
+
+
+def _counter(user_type, year):
+    prefix = FACULTY_PREFIX if user_type == 'teacher' else student_prefix(year)
+    return prefix, f'school_id:{prefix}'
+
+
+def allocate(user_type='student', count=1, year=None):
+    """
+    Reserve `count` new IDs for students ('student') or faculty ('teacher') and
+    return them in order. Safe to call concurrently; bulk enrollment should ask
+    for the whole block at once.
+    """
+    prefix, name = _counter(user_type, year)
+    ids = []
+    while len(ids) < count:
+        needed = count - len(ids)
+        start = sequences.reserve(name, needed, initial=lambda: _highest_existing(user_type, prefix))
+        candidates = [_format(user_type, prefix, number) for number in range(start, start + needed)]
+        # Skip anything an admin already entered by hand (one query per block)
+        taken = set(UserProfile.objects.filter(school_id__in=candidates).values_list('school_id', flat=True))
+        ids.extend(school_id for school_id in candidates if school_id not in taken)
+    return ids
+
+
+def allocate_one(user_type='student', year=None):
+    return allocate(user_type, 1, year)[0]
+
+
+def peek(user_type='student', year=None):
+    """The ID allocate() would most likely hand out next, without reserving it (for form hints)"""
+    prefix, name = _counter(user_type, year)
+    last = sequences.current(name) or _highest_existing(user_type, prefix)
+    number = last + 1
+    while UserProfile.objects.filter(school_id=_format(user_type, prefix, number)).exists():
+        number += 1
+    return _format(user_type, prefix, number)
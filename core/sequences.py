@@ -0,0 +1,82 @@
+# ======================================================================
+# core/sequences.py
+# Named counters without existence checks. reserve() claims a range of
+# numbers with one UPDATE (value = value + n) inside a transaction, so
+# concurrent callers always get disjoint ranges. BlockAllocator keeps a
+# reserved block in memory and hands numbers out from it, touching the
+# database only once per block; numbers left in a block when a process
+# exits are skipped, so sequences are unique but may have gaps.
+# ======================================================================
+
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import F
+
+from .models import SequenceCounter
+
+RECEIPT_BLOCK_SIZE = getattr(settings, 'RECEIPT_BLOCK_SIZE', 50)
+
+
+def reserve(name, count=1, initial=None):
+    """
+    Reserve `count` consecutive numbers from counter `name` and return the first.
+    `initial` is a callable giving the starting value (the last number already
+    used) if the counter doesn't exist yet.
+    """
+    for attempt in range(2):
+        with transaction.atomic():
+            # The UPDATE takes the row lock before we read, so the value read back is ours
+            if SequenceCounter.objects.filter(name=name).update(value=F('value') + count):
+                value = SequenceCounter.objects.filter(name=name).values_list('value', flat=True).get()
+                return value - count + 1
+        try:
+            with transaction.atomic():
+                start = initial() if initial else 0
+                SequenceCounter.objects.create(name=name, value=start + count)
+                return start + 1
+        except IntegrityError:
+            # Another process created it first; take the UPDATE path
+            if attempt:
+                raise
+
+
+def current(name):
+    """Last number reserved from counter `name` (0 if it doesn't exist yet)"""
+    return SequenceCounter.objects.filter(name=name).values_list('value', flat=True).first() or 0
+
+
+class BlockAllocator:
+    """Per-process allocator handing out numbers from blocks reserved with reserve()"""
+
+    def __init__(self, name, block_size):
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._blocks = deque()  # (next, end) ranges ready to hand out, end exclusive
+
+    def _add_block(self, start, end):
+        if start < end:
+            with self._lock:
+                self._blocks.append((start, end))
+
+    def next(self):
+        with self._lock:
+            while self._blocks:
+                start, end = self._blocks[0]
+                if start < end:
+                    self._blocks[0] = (start + 1, end)
+                    return start
+                self._blocks.popleft()
+
+        start = reserve(self.name, self.block_size)
+        # Keep the rest of the block only once the reservation commits. If the
+        # caller's transaction rolls back, the counter goes back too, and reusing
+        # the remainder would hand out numbers another process will get again.
+        transaction.on_commit(lambda: self._add_block(start + 1, start + self.block_size))
+        return start
+
+
+receipt_numbers = BlockAllocator('receipt_number', RECEIPT_BLOCK_SIZE)
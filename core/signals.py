@@ -1,7 +1,8 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile
+from .models import UserProfile, Device, RewardItem, Entry, RedeemedPoints
+from . import device_cache, id_suggestions, leaderboard, rewards_catalog, stats
 import uuid
 
 @receiver(post_save, sender=User)
@@ -17,6 +18,84 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
-    """Save the UserProfile when the User is saved"""
+    """Save the UserProfile when the User is saved (balance is left to core.ledger)"""
     if hasattr(instance, 'profile'):
-        instance.profile.save()
+        instance.profile.save_details()
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+def invalidate_device_cache(sender, instance, **kwargs):
+    """Drop the cached API key whenever a device is saved (e.g. key rotation) or deleted"""
+    device_cache.invalidate_device(instance)
+
+@receiver(post_save, sender=RewardItem)
+@receiver(post_delete, sender=RewardItem)
+def invalidate_rewards_catalog(sender, instance, **kwargs):
+    """Every worker rebuilds its cached catalog after a reward is added, edited or removed"""
+    rewards_catalog.invalidate()
+
+@receiver(post_delete, sender=UserProfile)
+def invalidate_id_suggestions(sender, instance, **kwargs):
+    """A deleted profile's school ID should no longer be suggested"""
+    id_suggestions.invalidate()
+
+@receiver(pre_save, sender=Device)
+def remember_device_status(sender, instance, **kwargs):
+    """Remember the stored status so post_save can adjust the per-status device counts"""
+    instance._previous_status = None
+    if instance.pk and not instance._state.adding:
+        instance._previous_status = Device.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+@receiver(post_save, sender=Device)
+def update_device_stats(sender, instance, created, **kwargs):
+    if created:
+        stats.record_device_status(None, instance.status, created=True)
+    elif instance._previous_status != instance.status:
+        stats.record_device_status(instance._previous_status, instance.status)
+
+@receiver(post_delete, sender=Device)
+def remove_device_stats(sender, instance, **kwargs):
+    stats.record_device_status(instance.status, None, deleted=True)
+
+# Deletes (by hand, from the console, or cascading from a user or reward)
+# take their rows out of the dashboard totals
+@receiver(post_delete, sender=Entry)
+def remove_entry_stats(sender, instance, **kwargs):
+    stats.record_entry_deleted(instance)
+
+@receiver(post_delete, sender=RedeemedPoints)
+def remove_redemption_stats(sender, instance, **kwargs):
+    stats.record_redemption_deleted(instance)
+
+@receiver(post_delete, sender=UserProfile)
+def remove_profile_stats(sender, instance, **kwargs):
+    stats.record_profile_deleted(instance)
+
+# Which leaderboards a profile is on depends on User.is_staff and
+# UserProfile.user_type, so a change to either (or a delete) rebuilds them.
+# Saves that name their fields (e.g. last_login on every login) skip the query.
+@receiver(pre_save, sender=User)
+def remember_staff_flag(sender, instance, update_fields=None, **kwargs):
+    instance._previous_is_staff = None
+    if instance.pk and not instance._state.adding and (update_fields is None or 'is_staff' in update_fields):
+        instance._previous_is_staff = User.objects.filter(pk=instance.pk).values_list('is_staff', flat=True).first()
+
+@receiver(post_save, sender=User)
+def update_leaderboard_for_staff(sender, instance, created, **kwargs):
+    if not created and instance._previous_is_staff not in (None, instance.is_staff):
+        leaderboard.invalidate()
+
+@receiver(pre_save, sender=UserProfile)
+def remember_user_type(sender, instance, update_fields=None, **kwargs):
+    instance._previous_user_type = None
+    if instance.pk and not instance._state.adding and (update_fields is None or 'user_type' in update_fields):
+        instance._previous_user_type = UserProfile.objects.filter(pk=instance.pk).values_list('user_type', flat=True).first()
+
+@receiver(post_save, sender=UserProfile)
+def update_leaderboard_for_type(sender, instance, created, **kwargs):
+    if not created and instance._previous_user_type not in (None, instance.user_type):
+        leaderboard.invalidate()
+
+@receiver(post_delete, sender=UserProfile)
+def remove_from_leaderboard(sender, instance, **kwargs):
+    leaderboard.invalidate()
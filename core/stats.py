@@ -0,0 +1,152 @@
+# ======================================================================
+# core/stats.py
+# Incrementally maintained dashboard totals (SiteStats, single row).
+# Write paths call the record_* helpers inside their own transaction;
+# the UPDATE of the shared row is deferred until that transaction
+# commits (an on_commit callback, dropped on rollback), so concurrent
+# deposits don't queue on its row lock while they hold their own.
+# Deletes are counted through signals (core/signals.py).
+# rebuild() recomputes everything from the source tables.
+# ======================================================================
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import SiteStats, Entry, RedeemedPoints, RewardItem, UserProfile, Device
+
+SITE_STATS_PK = 1
+
+# Device.status value -> SiteStats counter
+DEVICE_STATUS_FIELDS = {
+    'online': 'devices_online',
+    'offline': 'devices_offline',
+    'maintenance': 'devices_maintenance',
+    'error': 'devices_error',
+}
+
+
+def get_stats():
+    """Return the stats row, building it from scratch the first time"""
+    stats = SiteStats.objects.filter(pk=SITE_STATS_PK).first()
+    if stats is None:
+        stats = rebuild()
+    return stats
+
+
+def _apply(deltas):
+    updated = SiteStats.objects.filter(pk=SITE_STATS_PK).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+    if not updated:
+        # No row yet: build it from the tables (which already include this change)
+        rebuild()
+
+
+def _increment(**deltas):
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if deltas:
+        # Runs straight away outside a transaction
+        transaction.on_commit(lambda: _apply(deltas))
+
+
+def record_deposits(entries, bottles, points):
+    _increment(total_entries=entries, total_bottles=bottles, total_points_earned=points, points_outstanding=points)
+
+
+def record_redemption(points):
+    _increment(total_redemptions=1, total_points_redeemed=points, points_outstanding=-points)
+
+
+def record_balance_adjustment(delta):
+    """Manual admin change to a user's balance"""
+    _increment(points_outstanding=delta)
+
+
+def record_entry_deleted(entry):
+    _increment(total_entries=-1, total_bottles=-entry.no_bottle, total_points_earned=-entry.points)
+
+
+def record_redemption_deleted(redemption):
+    _increment(total_redemptions=-1, total_points_redeemed=-redemption.redeemed_points)
+    # Gone already when the reward itself is being deleted; then this updates nothing
+    RewardItem.objects.filter(pk=redemption.reward_item_id).update(
+        times_redeemed=Greatest(F('times_redeemed') - 1, 0),
+        points_redeemed=Greatest(F('points_redeemed') - redemption.redeemed_points, 0)
+    )
+
+
+def record_profile_deleted(profile):
+    """A deleted user's balance no longer counts as outstanding"""
+    _increment(points_outstanding=-profile.total_points)
+
+
+def record_device_status(old_status, new_status, created=False, deleted=False):
+    deltas = {}
+    if created:
+        deltas['devices_total'] = 1
+    if deleted:
+        deltas['devices_total'] = -1
+    if old_status != new_status or created or deleted:
+        if old_status in DEVICE_STATUS_FIELDS and not created:
+            deltas[DEVICE_STATUS_FIELDS[old_status]] = -1
+        if new_status in DEVICE_STATUS_FIELDS and not deleted:
+            field = DEVICE_STATUS_FIELDS[new_status]
+            deltas[field] = deltas.get(field, 0) + 1
+    _increment(**deltas)
+
+
+def set_device_status(device_pk, status, **fields):
+    """
+    Update a device's status (plus any other columns) and keep the per-status
+    counters right. The common case - status unchanged - is a single UPDATE.
+    """
+    if Device.objects.filter(pk=device_pk, status=status).update(status=status, **fields):
+        return
+    with transaction.atomic():
+        old_status = Device.objects.select_for_update().filter(pk=device_pk).values_list('status', flat=True).first()
+        if old_status is None:
+            return
+        Device.objects.filter(pk=device_pk).update(status=status, **fields)
+        record_device_status(old_status, status)
+
+
+def rebuild():
+    """Recompute SiteStats and the per-reward redemption counters from the source tables"""
+    with transaction.atomic():
+        entries = Entry.objects.aggregate(count=Count('id'), bottles=Sum('no_bottle'), points=Sum('points'))
+        redemptions = RedeemedPoints.objects.aggregate(count=Count('id'), points=Sum('redeemed_points'))
+        outstanding = UserProfile.objects.aggregate(total=Sum('total_points'))['total'] or 0
+        device_counts = dict(Device.objects.values_list('status').annotate(total=Count('id')))
+
+        values = {
+            'total_entries': entries['count'] or 0,
+            'total_bottles': entries['bottles'] or 0,
+            'total_points_earned': entries['points'] or 0,
+            'total_redemptions': redemptions['count'] or 0,
+            'total_points_redeemed': redemptions['points'] or 0,
+            'points_outstanding': outstanding,
+            'devices_total': sum(device_counts.values()),
+        }
+        for status, field in DEVICE_STATUS_FIELDS.items():
+            values[field] = device_counts.get(status, 0)
+        values['updated_at'] = timezone.now()
+        if not SiteStats.objects.filter(pk=SITE_STATS_PK).update(**values):
+            try:
+                with transaction.atomic():
+                    SiteStats.objects.create(pk=SITE_STATS_PK, **values)
+            except IntegrityError:
+                # Another worker created the row at the same moment
+                SiteStats.objects.filter(pk=SITE_STATS_PK).update(**values)
+        stats = SiteStats.objects.get(pk=SITE_STATS_PK)
+
+        per_reward = RedeemedPoints.objects.values('reward_item_id').annotate(
+            count=Count('id'), points=Sum('redeemed_points')
+        )
+        RewardItem.objects.update(times_redeemed=0, points_redeemed=0)
+        for row in per_reward:
+            RewardItem.objects.filter(pk=row['reward_item_id']).update(
+                times_redeemed=row['count'], points_redeemed=row['points'] or 0
+            )
+    return stats
@@ -0,0 +1,92 @@
+# ======================================================================
+# core/telemetry.py
+# Heartbeat handling. Instead of one DeviceLog row per heartbeat, the
+# device row holds the latest status/sensor snapshot (updated in place)
+# and sensor history is kept as one min/max/last row per time bucket.
+# ======================================================================
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+
+from .models import DeviceSensorSample
+from . import log_queue, stats
+
+# Width of each sensor history bucket, in minutes
+HEARTBEAT_SAMPLE_MINUTES = getattr(settings, 'HEARTBEAT_SAMPLE_MINUTES', 15)
+
+
+def bucket_start(when, minutes=HEARTBEAT_SAMPLE_MINUTES):
+    """Round a timestamp down to the start of its sample bucket"""
+    when = when.replace(second=0, microsecond=0)
+    minute_of_day = when.hour * 60 + when.minute
+    return when - timedelta(minutes=minute_of_day % minutes)
+
+
+def record_heartbeat(device, status, sensor_data):
+    """Update the device's live status in place and fold sensor data into its history"""
+    now = timezone.now()
+    stats.set_device_status(
+        device.pk,
+        status,
+        last_heartbeat=now,
+        last_sensor_data=sensor_data,
+        updated_at=now
+    )
+    device.status = status
+    device.last_heartbeat = now
+    device.last_sensor_data = sensor_data
+
+    if isinstance(sensor_data, dict) and sensor_data:
+        record_sensor_sample(device, sensor_data, now)
+
+    # Optional per-device debug mode keeps the old one-row-per-heartbeat log
+    if device.log_heartbeats:
+        log_queue.log(
+            device=device,
+            log_type='heartbeat',
+            sensor_data=sensor_data,
+            message=f"Device {device.device_name} heartbeat"
+        )
+    return now
+
+
+def record_sensor_sample(device, sensor_data, when):
+    """Merge one sensor snapshot into the device's current bucket (min/max/last)"""
+    start = bucket_start(when)
+    numeric = {
+        key: value for key, value in sensor_data.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                sample = DeviceSensorSample.objects.select_for_update().filter(
+                    device=device, bucket_start=start
+                ).first()
+                if sample is None:
+                    DeviceSensorSample.objects.create(
+                        device=device,
+                        bucket_start=start,
+                        sample_count=1,
+                        min_values=numeric,
+                        max_values=dict(numeric),
+                        last_values=sensor_data
+                    )
+                    return
+                for key, value in numeric.items():
+                    if key not in sample.min_values or value < sample.min_values[key]:
+                        sample.min_values[key] = value
+                    if key not in sample.max_values or value > sample.max_values[key]:
+                        sample.max_values[key] = value
+                sample.sample_count += 1
+                sample.last_values = sensor_data
+                sample.save(update_fields=['sample_count', 'min_values', 'max_values', 'last_values', 'updated_at'])
+                return
+        except IntegrityError:
+            # Another worker created the bucket first; retry as an update
+            if attempt:
+                raise
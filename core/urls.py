@@ -4,9 +4,12 @@
 # You will need to create this file inside your 'core' app folder.
 # ======================================================================
 
+from django.conf import settings
 from django.urls import path
 from . import views
 
+DEVICE_API_ASYNC = getattr(settings, 'DEVICE_API_ASYNC', False)
+
 urlpatterns = [
     path('', views.home_view, name='home'),  # Landing page
     path('register/', views.register_view, name='register'),
@@ -19,6 +22,7 @@ urlpatterns = [
     path('rewards/', views.rewards_view, name='rewards'),
     path('rewards/history/', views.redemption_history_view, name='redemption_history'),
     path('redeem/<int:reward_id>/', views.redeem_reward_view, name='redeem_reward'),
+    path('leaderboard/', views.leaderboard_view, name='leaderboard'),
     
     # URL for the admin dashboard (can be expanded later)
     path('admin_dashboard/', views.admin_dashboard_view, name='admin_dashboard'),
@@ -27,6 +31,7 @@ urlpatterns = [
     # Custom admin management pages (quick actions) - use 'console/' to avoid conflict with Django admin
     path('console/manage-users/', views.admin_manage_users_view, name='admin_users'),
     path('console/manage-users/add/', views.admin_user_add_view, name='admin_user_add'),
+    path('console/manage-users/import/', views.admin_user_import_view, name='admin_user_import'),
     path('console/manage-users/<int:user_id>/', views.admin_user_edit_view, name='admin_user_edit'),
     path('console/manage-rewards/', views.admin_manage_rewards_view, name='admin_rewards'),
     path('console/manage-rewards/add/', views.admin_reward_add_view, name='admin_reward_add'),
@@ -38,15 +43,20 @@ urlpatterns = [
     path('console/manage-devices/add/', views.admin_device_add_view, name='admin_device_add'),
     path('console/transactions/', views.admin_transactions_view, name='admin_transactions'),
     path('console/device-logs/', views.admin_device_logs_view, name='admin_device_logs'),
+    path('console/export/<str:kind>/', views.admin_export_view, name='admin_export'),
     path('console/settings/', views.admin_settings_view, name='admin_settings'),
+    path('console/perf/', views.admin_perf_view, name='admin_perf'),
     path('console/debug-qr-codes/', views.debug_qr_codes_view, name='debug_qr_codes'),
     path('generate-qr-code/', views.generate_qr_code_view, name='generate_qr_code'),
     path('download-id-card/<int:user_id>/', views.download_id_card_view, name='download_id_card'),
+    path('console/id-cards/', views.admin_id_cards_view, name='admin_id_cards'),
     
     # API Endpoints for IoT device integration
+    # (async variants when DEVICE_API_ASYNC is on - serve through ecodrop_project.asgi)
     path('api/deposit/', views.api_deposit_view, name='api_deposit'),  # Legacy endpoint
-    path('api/device/heartbeat/', views.api_device_heartbeat, name='api_device_heartbeat'),
-    path('api/device/detection/', views.api_bottle_detection, name='api_bottle_detection'),
-    path('api/device/error/', views.api_device_error, name='api_device_error'),
-    path('api/user/verify/', views.api_user_verify, name='api_user_verify'),
+    path('api/device/heartbeat/', views.api_device_heartbeat_async if DEVICE_API_ASYNC else views.api_device_heartbeat, name='api_device_heartbeat'),
+    path('api/device/detection/', views.api_bottle_detection_async if DEVICE_API_ASYNC else views.api_bottle_detection, name='api_bottle_detection'),
+    path('api/device/detection/batch/', views.api_bottle_detection_batch, name='api_bottle_detection_batch'),
+    path('api/device/error/', views.api_device_error_async if DEVICE_API_ASYNC else views.api_device_error, name='api_device_error'),
+    path('api/user/verify/', views.api_user_verify_async if DEVICE_API_ASYNC else views.api_user_verify, name='api_user_verify'),
 ]
@@ -9,17 +9,22 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.models import User
-from django.db import models
-from .models import UserProfile, Entry, RewardItem, RedeemedPoints, Device, DeviceLog
+from django.db import models, transaction
+from .models import UserProfile, Entry, RewardItem, RedeemedPoints, Device, DeviceLog, ScanKey
 from .forms import LoginForm, RegisterForm
+from . import barcodes, detection_events, device_cache, enrollment, exports, id_cards, id_suggestions, leaderboard, ledger, listing, log_queue, perf, retention, rewards_catalog, school_ids, stats, telemetry
 
 # For the API view
+from asgiref.sync import sync_to_async
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404, StreamingHttpResponse
 from django.utils import timezone
 import json
+import logging
 import uuid
 
+logger = logging.getLogger(__name__)
+
 def home_view(request):
     """Landing page for all users"""
     if request.user.is_authenticated:
@@ -27,7 +32,7 @@ def home_view(request):
     
     # Get some stats for the landing page
     total_users = UserProfile.objects.count()
-    total_bottles = Entry.objects.aggregate(total=models.Sum('no_bottle'))['total'] or 0
+    total_bottles = stats.get_stats().total_bottles
     available_rewards = RewardItem.objects.count()
     context = {
         'total_users': total_users,
@@ -122,12 +127,15 @@ def dashboard_view(request):
     # Regular student dashboard
     user_profile = request.user.profile
     recent_entries = Entry.objects.filter(user_profile=user_profile).order_by('-created_at')[:10]
-    total_bottles = Entry.objects.filter(user_profile=user_profile).aggregate(total=models.Sum('no_bottle'))['total'] or 0
+    total_bottles = user_profile.total_bottles
+    rank, ranked_users = leaderboard.rank(user_profile, 'student')
     
     return render(request, 'core/dashboard.html', {
         'user_profile': user_profile,
         'recent_entries': recent_entries,
         'total_bottles': total_bottles,
+        'rank': rank,
+        'ranked_users': ranked_users,
     })
 
 @login_required
@@ -142,20 +150,21 @@ def teacher_dashboard_view(request):
     
     # Teacher's own stats
     user_profile = request.user.profile
-    teacher_bottles = Entry.objects.filter(user_profile=user_profile).aggregate(total=models.Sum('no_bottle'))['total'] or 0
+    teacher_bottles = user_profile.total_bottles
     teacher_points = user_profile.total_points
     
     # School-wide statistics
     total_students = User.objects.filter(is_staff=False).count()
-    total_bottles_all = Entry.objects.aggregate(total=models.Sum('no_bottle'))['total'] or 0
-    total_points_all = UserProfile.objects.aggregate(total=models.Sum('total_points'))['total'] or 0
+    site_stats = stats.get_stats()
+    total_bottles_all = site_stats.total_bottles
+    total_points_all = site_stats.points_outstanding
     
     # Recent activity (last 7 days)
     week_ago = timezone.now() - timedelta(days=7)
     recent_deposits = Entry.objects.filter(created_at__gte=week_ago).count()
     
     # Top students
-    top_students = UserProfile.objects.filter(user__is_staff=False).order_by('-total_points')[:10]
+    top_students = leaderboard.top('student', 10)
     
     # Recent transactions
     recent_transactions = Entry.objects.select_related('user_profile__user').order_by('-created_at')[:20]
@@ -183,7 +192,7 @@ def teacher_profile_view(request):
         return redirect('dashboard')
     
     user_profile = request.user.profile
-    teacher_bottles = Entry.objects.filter(user_profile=user_profile).aggregate(total=models.Sum('no_bottle'))['total'] or 0
+    teacher_bottles = user_profile.total_bottles
     recent_entries = Entry.objects.filter(user_profile=user_profile).order_by('-created_at')[:10]
     
     return render(request, 'core/teacher_profile.html', {
@@ -202,7 +211,7 @@ def student_profile_view(request):
     from datetime import timedelta
     
     user_profile = request.user.profile
-    total_bottles = Entry.objects.filter(user_profile=user_profile).aggregate(total=models.Sum('no_bottle'))['total'] or 0
+    total_bottles = user_profile.total_bottles
     recent_entries = Entry.objects.filter(user_profile=user_profile).order_by('-created_at')[:10]
     
     # Only show valid redemptions (within 3 days)
@@ -219,24 +228,59 @@ def student_profile_view(request):
         'redemptions': redemptions,
     })
 
+@login_required
+def leaderboard_view(request):
+    """Top recyclers on the student, teacher or all-user board, plus the viewer's own rank"""
+    board = request.GET.get('board', 'all' if request.user.is_staff else 'student')
+    if board not in leaderboard.BOARDS:
+        board = 'student'
+    user_profile = request.user.profile
+    rank, ranked_users = leaderboard.rank(user_profile, board)
+    
+    return render(request, 'core/leaderboard.html', {
+        'board': board,
+        'boards': [('student', 'Students'), ('teacher', 'Teachers'), ('all', 'Everyone')],
+        'leaders': leaderboard.top(board, 50),
+        'user_profile': user_profile,
+        'rank': rank,
+        'ranked_users': ranked_users,
+    })
+
 @login_required
 def rewards_view(request):
-    """Display available rewards for redemption with search and pagination"""
+    """Display available rewards for redemption with search, points filters and pagination (served from the cached catalog)"""
+    import hashlib
     from django.core.paginator import Paginator
-    from django.db.models import Q
+    from django.utils.cache import get_conditional_response
+    from django.utils.http import urlencode
     
     user_profile = request.user.profile
+    catalog = rewards_catalog.get_catalog()
     
-    # Get search query
-    search_query = request.GET.get('search', '')
-    
-    # Filter rewards based on search
-    rewards = RewardItem.objects.all().order_by('points_required')
-    if search_query:
-        rewards = rewards.filter(
-            Q(reward_name__icontains=search_query) |
-            Q(points_required__icontains=search_query)
-        )
+    # Get search query and points filters
+    search_query = request.GET.get('search', '').strip()
+    affordable = request.GET.get('affordable') == '1'
+    try:
+        max_points = int(request.GET['max_points']) if request.GET.get('max_points') else None
+    except ValueError:
+        max_points = None
+    if affordable:
+        max_points = user_profile.total_points if max_points is None else min(max_points, user_profile.total_points)
+    
+    # The page only changes with the catalog, the user's balance and the query, so a
+    # browser holding the same version gets a 304. Not while a receipt or message is
+    # waiting to be shown, since those are consumed by rendering the page.
+    etag = None
+    if 'last_redemption' not in request.session and not len(messages.get_messages(request)):
+        fingerprint = f"{catalog.version}:{request.user.pk}:{user_profile.total_points}:{request.META.get('CSRF_COOKIE', '')}:{request.GET.urlencode()}"
+        etag = f'"{hashlib.sha256(fingerprint.encode()).hexdigest()[:32]}"'
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            not_modified['Cache-Control'] = 'private, no-cache'
+            return not_modified
+    
+    rewards = catalog.search(search_query, max_points=max_points)
     
     # Paginate results (9 per page for 3x3 grid)
     paginator = Paginator(rewards, 9)
@@ -246,31 +290,32 @@ def rewards_view(request):
     # Get last redemption from session and clear it
     last_redemption = request.session.pop('last_redemption', None)
     
-    return render(request, 'core/rewards.html', {
+    filters = {'search': search_query, 'max_points': request.GET.get('max_points', ''), 'affordable': '1' if affordable else ''}
+    response = render(request, 'core/rewards.html', {
         'rewards': page_obj,
         'user_profile': user_profile,
         'search_query': search_query,
+        'affordable': affordable,
+        'max_points': request.GET.get('max_points', ''),
+        'point_limits': [50, 100, 250, 500, 1000],
+        'filter_query': urlencode({key: value for key, value in filters.items() if value}),
         'page_obj': page_obj,
         'last_redemption': last_redemption,
     })
+    if etag:
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+    return response
 
 @login_required
 def redeem_reward_view(request, reward_id):
     reward = RewardItem.objects.get(id=reward_id)
     profile = request.user.profile
 
-    if profile.total_points >= reward.points_required:
-        # Subtract points
-        profile.total_points -= reward.points_required
-        profile.save()
-
-        # Create a redemption record
-        redemption = RedeemedPoints.objects.create(
-            user_profile=profile,
-            reward_item=reward,
-            redeemed_points=reward.points_required
-        )
-        
+    # Deducts only if the balance still covers the cost, and creates the
+    # redemption record in the same transaction
+    redemption = ledger.redeem_reward(profile, reward)
+    if redemption:
         # Calculate valid until date (3 days from now)
         from datetime import timedelta
         valid_until = redemption.created_at + timedelta(days=3)
@@ -323,7 +368,6 @@ def admin_dashboard_view(request):
         return redirect('dashboard')
     
     # Comprehensive admin dashboard data
-    from django.db.models import Sum, Count, Avg
     from django.utils import timezone
     from datetime import timedelta
     
@@ -332,10 +376,13 @@ def admin_dashboard_view(request):
     student_users = UserProfile.objects.filter(user__is_staff=False).count()
     faculty_users = UserProfile.objects.filter(user__is_staff=True).count()
     
+    # Running totals maintained as entries/redemptions/status changes are written
+    site_stats = stats.get_stats()
+    
     # Recycling statistics
-    total_bottles = Entry.objects.aggregate(total=Sum('no_bottle'))['total'] or 0
-    total_points_earned = Entry.objects.aggregate(total=Sum('points'))['total'] or 0
-    total_points_redeemed = RedeemedPoints.objects.aggregate(total=Sum('redeemed_points'))['total'] or 0
+    total_bottles = site_stats.total_bottles
+    total_points_earned = site_stats.total_points_earned
+    total_points_redeemed = site_stats.total_points_redeemed
     
     # Recent activity (last 7 days)
     week_ago = timezone.now() - timedelta(days=7)
@@ -343,34 +390,35 @@ def admin_dashboard_view(request):
     recent_redemptions = RedeemedPoints.objects.filter(created_at__gte=week_ago).count()
     
     # Top recyclers
-    top_recyclers = UserProfile.objects.order_by('-total_points')[:5]
+    top_recyclers = leaderboard.top('all', 5)
     
     # Recent transactions
     recent_transactions = Entry.objects.select_related('user_profile__user').order_by('-created_at')[:10]
     
-    # Reward statistics
-    reward_stats = RedeemedPoints.objects.values('reward_item__reward_name').annotate(
-        count=Count('id'),
-        total_points=Sum('redeemed_points')
-    ).order_by('-count')[:5]
+    # Reward statistics (per-reward counters kept by core.ledger)
+    reward_stats = [
+        {'reward_item__reward_name': reward.reward_name, 'count': reward.times_redeemed, 'total_points': reward.points_redeemed}
+        for reward in RewardItem.objects.filter(times_redeemed__gt=0).order_by('-times_redeemed')[:5]
+    ]
     
     # Average points per user
-    avg_points_per_user = UserProfile.objects.aggregate(avg=Avg('total_points'))['avg'] or 0
+    avg_points_per_user = site_stats.points_outstanding / total_users if total_users else 0
     
     # Device statistics
-    total_devices = Device.objects.count()
-    online_devices = Device.objects.filter(status='online').count()
-    offline_devices = Device.objects.filter(status='offline').count()
-    error_devices = Device.objects.filter(status='error').count()
-    maintenance_devices = Device.objects.filter(status='maintenance').count()
+    total_devices = site_stats.devices_total
+    online_devices = site_stats.devices_online
+    offline_devices = site_stats.devices_offline
+    error_devices = site_stats.devices_error
+    maintenance_devices = site_stats.devices_maintenance
     
     # Recent device activity
     recent_device_logs = DeviceLog.objects.select_related('device').order_by('-created_at')[:10]
     
-    # Device performance data
-    device_performance = Device.objects.annotate(
-        recent_bottles=Count('devicelog', filter=models.Q(devicelog__log_type='bottle_sorted', devicelog__created_at__gte=week_ago))
-    ).order_by('-total_bottles_processed')[:5]
+    # Device performance data (recent counts come from hourly rollups + not-yet-rolled raw logs)
+    device_performance = list(Device.objects.order_by('-total_bottles_processed')[:5])
+    recent_sorted = retention.device_log_counts(week_ago, log_type='bottle_sorted')
+    for device in device_performance:
+        device.recent_bottles = recent_sorted.get(device.pk, 0)
     
     # Basic user list for Manage Users section (no backend actions here)
     user_list = User.objects.select_related('profile').order_by('username')[:100]
@@ -509,9 +557,13 @@ def admin_reward_delete_view(request, reward_id):
 def admin_redemptions_view(request):
     if not request.user.is_staff:
         return redirect('dashboard')
-    redemptions = RedeemedPoints.objects.select_related('user_profile__user', 'reward_item').order_by('-created_at')[:100]
+    page, filters = listing.paginate_request(
+        request, RedeemedPoints.objects.select_related('user_profile__user', 'reward_item'), listing.REDEMPTION_FILTERS
+    )
     return render(request, 'core/admin_redemptions.html', {
-        'redemptions': redemptions,
+        'redemptions': page.items,
+        'page': page,
+        'filters': filters,
     })
 
 
@@ -541,18 +593,20 @@ def admin_user_edit_view(request, user_id: int):
         user_obj.last_name = request.POST.get('last_name', user_obj.last_name)
         user_obj.email = request.POST.get('email', user_obj.email)
         user_obj.is_staff = True if request.POST.get('is_staff') == 'on' else False
-        # Profile points
-        try:
-            new_points = int(request.POST.get('total_points', user_obj.profile.total_points))
-            user_obj.profile.total_points = max(0, new_points)
-        except Exception:
-            pass
         # Student/Faculty ID - EDITABLE
         school_id = request.POST.get('school_id', '').strip()
         if school_id:
             user_obj.profile.school_id = school_id
+        # Saving the user also saves the profile details (not the balance)
         user_obj.save()
-        user_obj.profile.save()
+        # Profile points - only applied if the balance hasn't changed since the form was loaded
+        try:
+            new_points = int(request.POST.get('total_points', user_obj.profile.total_points))
+            original_points = int(request.POST.get('original_total_points', user_obj.profile.total_points))
+            if new_points != original_points and not ledger.set_points(user_obj.profile, original_points, new_points):
+                messages.warning(request, f'Points for {user_obj.username} changed while you were editing; balance was not updated.')
+        except Exception:
+            pass
         return redirect('admin_users')
 
     return render(request, 'core/admin_user_edit.html', {
@@ -578,11 +632,13 @@ def admin_device_edit_view(request, device_id: int):
             device.total_bottles_processed = int(request.POST.get('total_bottles_processed', device.total_bottles_processed))
         except Exception:
             pass
+        device.log_heartbeats = request.POST.get('log_heartbeats') == 'on'
         device.save()
         return redirect('admin_devices')
 
     return render(request, 'core/admin_device_edit.html', {
         'device': device,
+        'heartbeat_sample_minutes': telemetry.HEARTBEAT_SAMPLE_MINUTES,
     })
 
 
@@ -600,42 +656,9 @@ def admin_user_add_view(request):
     if not request.user.is_staff:
         return redirect('dashboard')
     
-    # Generate next available IDs for display
-    from datetime import datetime
-    current_year = str(datetime.now().year)[2:]  # Get last 2 digits of year (e.g., "25" for 2025)
-    
-    # Get next student ID
-    last_student = UserProfile.objects.filter(
-        school_id__startswith=f'C{current_year}-'
-    ).order_by('-school_id').first()
-    
-    if last_student and last_student.school_id:
-        try:
-            last_num = int(last_student.school_id.split('-')[1])
-            next_school_id = f'C{current_year}-{str(last_num + 1).zfill(4)}'
-        except:
-            next_school_id = f'C{current_year}-0001'
-    else:
-        next_school_id = f'C{current_year}-0001'
-    
-    # Get next faculty ID (SMCIC-XXX-YYYY format)
-    current_year = str(datetime.now().year)  # Full year (e.g., "2025")
-    last_faculty = UserProfile.objects.filter(
-        school_id__startswith='SMCIC-'
-    ).order_by('-school_id').first()
-    
-    if last_faculty and last_faculty.school_id:
-        try:
-            parts = last_faculty.school_id.split('-')
-            if len(parts) == 3:
-                last_num = int(parts[1])
-                next_faculty_id = f'SMCIC-{str(last_num + 1).zfill(3)}-{current_year}'
-            else:
-                next_faculty_id = f'SMCIC-001-{current_year}'
-        except:
-            next_faculty_id = f'SMCIC-001-{current_year}'
-    else:
-        next_faculty_id = f'SMCIC-001-{current_year}'
+    # Next IDs, shown as hints only; the real ID is allocated when the form is saved
+    next_school_id = school_ids.peek('student')
+    next_faculty_id = school_ids.peek('teacher')
     
     if request.method == 'POST':
         username = request.POST.get('username', '').strip()
@@ -649,49 +672,12 @@ def admin_user_add_view(request):
         manual_school_id = request.POST.get('school_id', '').strip()
         manual_faculty_id = request.POST.get('faculty_id', '').strip()
         
-        # Use manual ID if provided, otherwise auto-generate
+        # Use manual ID if provided, otherwise allocate the next one
+        # (allocation is atomic, so two admins adding users at once get different IDs)
         if user_type == 'student':
-            if manual_school_id:
-                # Use the manually entered ID
-                generated_id = manual_school_id
-            else:
-                # Auto-generate only if not provided
-                last_student = UserProfile.objects.filter(
-                    school_id__startswith=f'C{current_year}-'
-                ).order_by('-school_id').first()
-                
-                if last_student and last_student.school_id:
-                    try:
-                        last_num = int(last_student.school_id.split('-')[1])
-                        generated_id = f'C{current_year}-{str(last_num + 1).zfill(4)}'
-                    except:
-                        generated_id = f'C{current_year}-0001'
-                else:
-                    generated_id = f'C{current_year}-0001'
+            generated_id = manual_school_id or (school_ids.allocate_one('student') if username and password else None)
         elif user_type == 'teacher':
-            if manual_faculty_id:
-                # Use the manually entered ID
-                generated_id = manual_faculty_id
-            else:
-                # Auto-generate only if not provided
-                from datetime import datetime
-                current_year_full = str(datetime.now().year)
-                last_faculty = UserProfile.objects.filter(
-                    school_id__startswith='SMCIC-'
-                ).order_by('-school_id').first()
-                
-                if last_faculty and last_faculty.school_id:
-                    try:
-                        parts = last_faculty.school_id.split('-')
-                        if len(parts) == 3:
-                            last_num = int(parts[1])
-                            generated_id = f'SMCIC-{str(last_num + 1).zfill(3)}-{current_year_full}'
-                        else:
-                            generated_id = f'SMCIC-001-{current_year_full}'
-                    except:
-                        generated_id = f'SMCIC-001-{current_year_full}'
-                else:
-                    generated_id = f'SMCIC-001-{current_year_full}'
+            generated_id = manual_faculty_id or (school_ids.allocate_one('teacher') if username and password else None)
         else:
             generated_id = None
         
@@ -757,9 +743,13 @@ def admin_transactions_view(request):
     """View all transactions"""
     if not request.user.is_staff:
         return redirect('dashboard')
-    transactions = Entry.objects.select_related('user_profile__user').order_by('-created_at')[:200]
+    page, filters = listing.paginate_request(
+        request, Entry.objects.select_related('user_profile__user'), listing.ENTRY_FILTERS
+    )
     return render(request, 'core/admin_transactions.html', {
-        'transactions': transactions,
+        'transactions': page.items,
+        'page': page,
+        'filters': filters,
     })
 
 
@@ -768,12 +758,40 @@ def admin_device_logs_view(request):
     """View device activity logs"""
     if not request.user.is_staff:
         return redirect('dashboard')
-    logs = DeviceLog.objects.select_related('device').order_by('-created_at')[:200]
+    page, filters = listing.paginate_request(
+        request, DeviceLog.objects.select_related('device'), listing.DEVICE_LOG_FILTERS
+    )
     return render(request, 'core/admin_device_logs.html', {
-        'logs': logs,
+        'logs': page.items,
+        'page': page,
+        'filters': filters,
+        'devices': Device.objects.order_by('device_name').only('device_id', 'device_name'),
+        'log_types': DeviceLog.LOG_TYPE_CHOICES,
+        'sort_results': DeviceLog.SORT_RESULT_CHOICES,
     })
 
 
+@login_required
+def admin_export_view(request, kind):
+    """Stream entries, redemptions or device logs as CSV/NDJSON, with the list page's filters"""
+    if not request.user.is_staff:
+        return redirect('dashboard')
+    if kind not in exports.EXPORTS:
+        raise Http404
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        fmt = 'csv'
+    compress = request.GET.get('gzip') == '1'
+    filters = listing.parse_filters(request.GET, exports.EXPORTS[kind][1])
+
+    response = StreamingHttpResponse(
+        exports.iter_export(kind, filters, fmt, compress),
+        content_type='application/gzip' if compress else exports.FORMATS[fmt]
+    )
+    response['Content-Disposition'] = f'attachment; filename="{exports.filename(kind, fmt, compress)}"'
+    return response
+
+
 @login_required
 def admin_settings_view(request):
     """System settings page"""
@@ -782,11 +800,39 @@ def admin_settings_view(request):
     import django
     return render(request, 'core/admin_settings.html', {
         'django_version': django.get_version(),
+        'device_cache_stats': device_cache.stats(),
+        'barcode_cache_stats': barcodes.stats(),
     })
 
 
+
+@login_required
+def admin_perf_view(request):
+    """Per-route latency percentiles, query counts and N+1 suspects collected by core.perf (this worker)"""
+    from datetime import datetime, timezone as dt_timezone
+    
+    if not request.user.is_staff:
+        return redirect('dashboard')
+    
+    if request.method == 'POST' and request.POST.get('action') == 'reset':
+        perf.reset()
+        messages.success(request, 'Performance statistics cleared for this worker.')
+        return redirect('admin_perf')
+    
+    snapshot = perf.snapshot()
+    return render(request, 'core/admin_perf.html', {
+        'routes': snapshot['routes'],
+        'slow_queries': snapshot['slow_queries'],
+        'since': datetime.fromtimestamp(snapshot['since'], tz=dt_timezone.utc),
+        'monitoring': perf.PERF_MONITORING,
+        'n_plus_one_threshold': perf.PERF_N_PLUS_ONE_THRESHOLD,
+        'explain_ms': perf.PERF_EXPLAIN_MS,
+    })
+
 # --- API Views for IoT Device Integration ---
 
+POINTS_PER_BOTTLE = 10  # Points awarded for each valid plastic bottle
+
 def authenticate_device(request):
     """Helper function to authenticate device API requests"""
     auth_header = request.headers.get('Authorization')
@@ -794,10 +840,15 @@ def authenticate_device(request):
         return None
     
     api_key = auth_header.split(' ')[1]
-    try:
-        return Device.objects.get(api_key=api_key)
-    except Device.DoesNotExist:
-        return None
+    # Served from the per-worker key cache; see core/device_cache.py
+    return device_cache.get_device(api_key)
+
+def heartbeat_response():
+    return JsonResponse({
+        'status': 'success', 
+        'message': 'Heartbeat received',
+        'server_time': timezone.now().isoformat()
+    })
 
 @csrf_exempt
 def api_device_heartbeat(request):
@@ -810,33 +861,128 @@ def api_device_heartbeat(request):
         try:
             data = json.loads(request.body)
             
-            # Update device status and heartbeat
-            device.status = data.get('status', 'online')
-            device.last_heartbeat = timezone.now()
-            device.save()
+            # Update the device's live status in place and fold the sensor snapshot
+            # into its down-sampled history (a DeviceLog row is only written when
+            # the device has heartbeat logging switched on)
+            telemetry.record_heartbeat(device, data.get('status', 'online'), data.get('sensor_data'))
             
-            # Log heartbeat
-            DeviceLog.objects.create(
-                device=device,
-                log_type='heartbeat',
-                sensor_data=data.get('sensor_data'),
-                message=f"Device {device.device_name} heartbeat"
+            return heartbeat_response()
+            
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    return JsonResponse({'status': 'error', 'message': 'Invalid request method.'}, status=405)
+
+def process_detection(device, data):
+    """Log one detection and credit the user for a plastic bottle. Returns (response dict, status)."""
+    sort_result = data.get('sort_result')  # 'plastic', 'invalid', 'error'
+    sensor_data = data.get('sensor_data', {})
+    user_id = data.get('user_id')  # QR code data if bottle is valid plastic
+    
+    # The detection event (and the sort, if points are awarded) are logged
+    # together at the end: one queue write instead of one per row
+    logs = [DeviceLog(
+        device=device,
+        log_type='bottle_detected',
+        sort_result=sort_result,
+        sensor_data=sensor_data,
+        message=f"Bottle detected: {sort_result}"
+    )]
+    
+    # For invalid bottles or no user ID
+    response = {
+        'status': 'success',
+        'message': f'Bottle processed: {sort_result}'
+    }
+    
+    # If plastic bottle and user identified, award points
+    if sort_result == 'plastic' and user_id:
+        profile, _ = ScanKey.resolve(user_id)
+        if profile is None:
+            response = {
+                'status': 'warning',
+                'message': 'Plastic bottle detected but user not found'
+            }
+        else:
+            points_earned = POINTS_PER_BOTTLE
+            
+            # Create entry record and credit the user's points atomically
+            ledger.award_points(profile, bottles=1, points=points_earned)
+            
+            # Update device bottle count
+            Device.objects.filter(pk=device.pk).update(
+                total_bottles_processed=models.F('total_bottles_processed') + 1
             )
             
-            return JsonResponse({
-                'status': 'success', 
-                'message': 'Heartbeat received',
-                'server_time': timezone.now().isoformat()
-            })
+            # Log successful sorting
+            logs.append(DeviceLog(
+                device=device,
+                log_type='bottle_sorted',
+                sort_result='plastic',
+                sensor_data=sensor_data,
+                message=f"Points awarded to {profile.user.username}"
+            ))
+            
+            response = {
+                'status': 'success',
+                'message': f'{points_earned} points awarded to {profile.user.username}',
+                'user_total_points': profile.total_points
+            }
+    
+    log_queue.log_many(logs)
+    return response, 200
+
+def detection_response(payload, status, replayed=False):
+    response = JsonResponse(payload, status=status)
+    if replayed:
+        # Same body as the first time; the header tells the device it was a repeat
+        response['X-Event-Replayed'] = 'true'
+    return response
+
+@csrf_exempt
+def api_bottle_detection(request):
+    """Endpoint for device to report bottle detection and sorting results.
+
+    An optional "event_id" (unique per device) makes the report safe to retry:
+    a repeat gets the original response back and is not credited again.
+    """
+    if request.method == 'POST':
+        device = authenticate_device(request)
+        if not device:
+            return JsonResponse({'status': 'error', 'message': 'Invalid API key.'}, status=401)
+        
+        try:
+            data = json.loads(request.body)
+            event_id = detection_events.clean_event_id(data.get('event_id'))
+            if event_id is None:
+                return detection_response(*process_detection(device, data))
+            return detection_response(*detection_events.run_once(
+                device, event_id, lambda: process_detection(device, data)
+            ))
             
         except Exception as e:
+            # Log error
+            if device:
+                log_queue.log(
+                    device=device,
+                    log_type='error',
+                    message=f"API Error: {str(e)}"
+                )
             return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
     
     return JsonResponse({'status': 'error', 'message': 'Invalid request method.'}, status=405)
 
+# Upper bound on events accepted by one batch POST (keeps a single transaction short)
+MAX_DETECTION_BATCH = 100
+
 @csrf_exempt
-def api_bottle_detection(request):
-    """Endpoint for device to report bottle detection and sorting results"""
+def api_bottle_detection_batch(request):
+    """Batch variant of api_bottle_detection for devices that queue up detections.
+
+    Accepts {"events": [{"sort_result": ..., "user_id": ..., "sensor_data": {...}}, ...]}
+    (or a bare list of events) and processes them with one auth lookup, one profile
+    query, bulk inserts for DeviceLog/Entry and one points increment per user.
+    """
     if request.method == 'POST':
         device = authenticate_device(request)
         if not device:
@@ -844,79 +990,127 @@ def api_bottle_detection(request):
         
         try:
             data = json.loads(request.body)
-            sort_result = data.get('sort_result')  # 'plastic', 'invalid', 'error'
-            sensor_data = data.get('sensor_data', {})
-            user_id = data.get('user_id')  # QR code data if bottle is valid plastic
+            events = data.get('events') if isinstance(data, dict) else data
+            if not isinstance(events, list) or not events:
+                return JsonResponse({'status': 'error', 'message': 'No events provided.'}, status=400)
+            if len(events) > MAX_DETECTION_BATCH:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': f'Too many events in one batch (max {MAX_DETECTION_BATCH}).'
+                }, status=400)
             
-            # Log the detection event
-            DeviceLog.objects.create(
-                device=device,
-                log_type='bottle_detected',
-                sort_result=sort_result,
-                sensor_data=sensor_data,
-                message=f"Bottle detected: {sort_result}"
-            )
+            # Resolve every user referenced by the batch in a single query
+            user_codes = {
+                event.get('user_id') for event in events
+                if isinstance(event, dict) and event.get('sort_result') == 'plastic' and event.get('user_id')
+            }
+            profiles = ScanKey.resolve_many(user_codes)
             
-            # If plastic bottle and user identified, award points
-            if sort_result == 'plastic' and user_id:
-                try:
-                    profile = UserProfile.objects.get(qr_code_data=user_id)
-                    points_earned = 10  # 10 points per plastic bottle
-                    
-                    # Update user's total points
-                    profile.total_points += points_earned
-                    profile.save()
+            logs = []
+            entries = []
+            usernames = {}
+            results = []
+            
+            for index, event in enumerate(events):
+                if not isinstance(event, dict):
+                    results.append({'index': index, 'status': 'error', 'message': 'Event must be an object'})
+                    continue
+                
+                sort_result = event.get('sort_result')
+                sensor_data = event.get('sensor_data', {})
+                user_id = event.get('user_id')
+                
+                logs.append(DeviceLog(
+                    device=device,
+                    log_type='bottle_detected',
+                    sort_result=sort_result,
+                    sensor_data=sensor_data,
+                    message=f"Bottle detected: {sort_result}"
+                ))
+                
+                if sort_result == 'plastic' and user_id:
+                    profile = profiles.get(user_id)
+                    if profile is None:
+                        results.append({
+                            'index': index,
+                            'status': 'warning',
+                            'message': 'Plastic bottle detected but user not found'
+                        })
+                        continue
                     
-                    # Create entry record
-                    Entry.objects.create(
+                    entries.append(Entry(
                         user_profile=profile,
                         no_bottle=1,
-                        points=points_earned
-                    )
-                    
-                    # Update device bottle count
-                    device.total_bottles_processed += 1
-                    device.save()
-                    
-                    # Log successful sorting
-                    DeviceLog.objects.create(
+                        points=POINTS_PER_BOTTLE
+                    ))
+                    usernames[profile.pk] = profile.user.username
+                    logs.append(DeviceLog(
                         device=device,
                         log_type='bottle_sorted',
                         sort_result='plastic',
                         sensor_data=sensor_data,
                         message=f"Points awarded to {profile.user.username}"
-                    )
-                    
-                    return JsonResponse({
+                    ))
+                    results.append({
+                        'index': index,
                         'status': 'success',
-                        'message': f'{points_earned} points awarded to {profile.user.username}',
-                        'user_total_points': profile.total_points
+                        'message': f'{POINTS_PER_BOTTLE} points awarded to {profile.user.username}',
+                        'username': profile.user.username
                     })
-                    
-                except UserProfile.DoesNotExist:
-                    return JsonResponse({
-                        'status': 'warning',
-                        'message': 'Plastic bottle detected but user not found'
+                else:
+                    results.append({
+                        'index': index,
+                        'status': 'success',
+                        'message': f'Bottle processed: {sort_result}'
                     })
             
-            # For invalid bottles or no user ID
+            with transaction.atomic():
+                # One points increment per profile; returns the new balances
+                balances = ledger.record_deposits(entries)
+                if entries:
+                    Device.objects.filter(pk=device.pk).update(
+                        total_bottles_processed=models.F('total_bottles_processed') + len(entries)
+                    )
+            # Logs go through the write-behind queue once the points are committed
+            log_queue.log_many(logs)
+            
+            # Report the post-increment balances back to the device
+            user_totals = {username: balances[pk] for pk, username in usernames.items()}
+            
             return JsonResponse({
                 'status': 'success',
-                'message': f'Bottle processed: {sort_result}'
+                'message': f'{len(events)} event(s) processed, {len(entries)} bottle(s) credited',
+                'results': results,
+                'user_total_points': user_totals
             })
             
         except Exception as e:
-            # Log error
-            if device:
-                DeviceLog.objects.create(
-                    device=device,
-                    log_type='error',
-                    message=f"API Error: {str(e)}"
-                )
+            log_queue.log(
+                device=device,
+                log_type='error',
+                message=f"Batch API Error: {str(e)}"
+            )
             return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
     
     return JsonResponse({'status': 'error', 'message': 'Invalid request method.'}, status=405)
 
+def record_device_error(device, data):
+    """Mark the device as in error and log what it reported"""
+    error_message = data.get('error_message', 'Unknown error')
+    error_code = data.get('error_code')
+    
+    # Update device status to error
+    device.status = 'error'
+    stats.set_device_status(device.pk, 'error', updated_at=timezone.now())
+    
+    # Log the error
+    log_queue.log(
+        device=device,
+        log_type='error',
+        sensor_data=data.get('sensor_data'),
+        message=f"Error {error_code}: {error_message}"
+    )
+
 @csrf_exempt
 def api_device_error(request):
     """Endpoint for device to report errors"""
@@ -927,21 +1121,7 @@ def api_device_error(request):
         
         try:
             data = json.loads(request.body)
-            error_message = data.get('error_message', 'Unknown error')
-            error_code = data.get('error_code')
-            
-            # Update device status to error
-            device.status = 'error'
-            device.save()
-            
-            # Log the error
-            DeviceLog.objects.create(
-                device=device,
-                log_type='error',
-                sensor_data=data.get('sensor_data'),
-                message=f"Error {error_code}: {error_message}"
-            )
-            
+            record_device_error(device, data)
             return JsonResponse({'status': 'success', 'message': 'Error logged'})
             
         except Exception as e:
@@ -949,6 +1129,72 @@ def api_device_error(request):
     
     return JsonResponse({'status': 'error', 'message': 'Invalid request method.'}, status=405)
 
+def verify_code(device, code, debug=False):
+    """Look up a scanned ID for a device and log the outcome. Returns the response dict."""
+    # Clean the student ID - handle format like "C22-0369" or "C220369" (without hyphen)
+    clean_code = code.strip().upper()  # Convert to uppercase for consistency
+    
+    logger.debug("Received student ID %r -> cleaned %r", code, clean_code)
+    
+    # Resolve every accepted spelling (C22-0369 / C220369 / c22-0369, faculty
+    # IDs with or without hyphens, username, legacy qr_code_data) with one
+    # indexed query against the normalized ScanKey table.
+    profile, lookup_method = ScanKey.resolve(clean_code)
+    
+    # Found by username: set the school_id if it's missing
+    if profile and lookup_method == 'username' and not profile.school_id:
+        profile.school_id = clean_code
+        profile.save_details()
+        logger.debug("Auto-set school_id for %s", profile.user.username)
+    
+    if profile:
+        # Log successful verification
+        log_queue.log(
+            device=device,
+            log_type='bottle_detected',  # Using existing log type
+            message=f"User {profile.user.username} verified with student ID '{clean_code}' via {lookup_method}"
+        )
+        
+        return {
+            'status': 'success',
+            'message': f'User {profile.user.username} verified',
+            'ok': True,
+            'user': {
+                'username': profile.user.username,
+                'full_name': f"{profile.user.first_name} {profile.user.last_name}".strip(),
+                'total_points': profile.total_points,
+                'school_id': profile.school_id or clean_code
+            },
+            'lookup_method': lookup_method
+        }
+    
+    # No user found - offer a few nearby IDs from the cached suggestion index
+    suggestions = id_suggestions.suggest(clean_code)
+    
+    # Log failed verification
+    log_queue.log(
+        device=device,
+        log_type='error',
+        message=f"Failed verification: student ID '{clean_code}' not found. Did you mean: {suggestions}"
+    )
+    
+    response = {
+        'status': 'error',
+        'message': f'Student ID not found: {clean_code}',
+        'ok': False,
+        'suggestions': suggestions,
+    }
+    
+    # Extra diagnostics only when the device/technician asks for them (?debug=1)
+    if debug:
+        response['debug'] = {
+            'received_school_id': clean_code,
+            'original_input': code,
+            'normalized': ScanKey.normalize(clean_code),
+            'indexed_school_ids': len(id_suggestions.get_index()),
+        }
+    return response
+
 @csrf_exempt
 def api_user_verify(request):
     """Endpoint for device to verify user QR code"""
@@ -962,152 +1208,112 @@ def api_user_verify(request):
             if not code:
                 return JsonResponse({'status': 'error', 'message': 'No code provided.', 'ok': False}, status=400)
             
-                       # Clean the student ID - handle format like "C22-0369" or "C220369" (without hyphen)
-            clean_code = code.strip().upper()  # Convert to uppercase for consistency
-            
-            # Debug: Log the incoming student ID
-            print(f"DEBUG: Received student ID: '{code}' -> cleaned: '{clean_code}'")
-            
-            # Try to find user by student ID first, then fallback to other methods
-            profile = None
-            lookup_method = None
-            
-            # Method 1: Look up by school_id field (exact match with hyphen)
-            if not profile:
-                try:
-                    profile = UserProfile.objects.get(school_id=clean_code)
-                    lookup_method = "school_id"
-                    print(f"DEBUG: User found by school_id - {profile.user.username}")
-                except UserProfile.DoesNotExist:
-                    pass
-            
-            # Method 1b: If not found, try adding hyphen for student IDs (C250001 -> C25-0001)
-            if not profile and len(clean_code) >= 7 and clean_code[0] == 'C' and '-' not in clean_code:
-                try:
-                    # Format: C + 2-digit year + 4-digit number (e.g., C250001 -> C25-0001)
-                    formatted_code = f"{clean_code[:3]}-{clean_code[3:]}"
-                    profile = UserProfile.objects.get(school_id=formatted_code)
-                    lookup_method = "school_id_formatted"
-                    print(f"DEBUG: User found by formatted school_id ({formatted_code}) - {profile.user.username}")
-                except (UserProfile.DoesNotExist, IndexError):
-                    pass
-            
-                        # Method 1c: Try adding hyphen for faculty IDs (SMCIC1232025 -> SMCIC-123-2025)
-            if not profile and clean_code.startswith('SMCIC') and '-' not in clean_code:
-                try:
-                    # Format: SMCIC + 3-digit number + 4-digit year (e.g., SMCIC1232025 -> SMCIC-123-2025)
-                    if len(clean_code) == 12:  # SMCIC + 3 digits + 4 digits
-                        formatted_code = f"SMCIC-{clean_code[5:8]}-{clean_code[8:]}"
-                        profile = UserProfile.objects.get(school_id=formatted_code)
-                        lookup_method = "faculty_id_formatted"
-                        print(f"DEBUG: User found by formatted faculty_id ({formatted_code}) - {profile.user.username}")
-                except (UserProfile.DoesNotExist, IndexError):
-                    pass
-            
-            # Method 2: Look up by school_id case-insensitive
-            if not profile:
-                try:
-                    profile = UserProfile.objects.get(school_id__iexact=clean_code)
-                    lookup_method = "school_id_case_insensitive"
-                    print(f"DEBUG: User found by school_id (case-insensitive) - {profile.user.username}")
-                except UserProfile.DoesNotExist:
-                    pass
-            
-            # Method 3: Look up by username (if student ID matches username)
-            if not profile:
-                try:
-                    from django.contrib.auth.models import User
-                    user = User.objects.get(username=clean_code)
-                    profile = user.profile
-                    lookup_method = "username"
-                    # Set the school_id if it's missing
-                    if not profile.school_id:
-                        profile.school_id = clean_code
-                        profile.save()
-                        print(f"DEBUG: Auto-set school_id for {user.username}")
-                    print(f"DEBUG: User found by username - {profile.user.username}")
-                except (User.DoesNotExist, UserProfile.DoesNotExist):
-                    pass
-            
-            # Method 4: Look up by old qr_code_data field (backward compatibility)
-            if not profile:
-                try:
-                    profile = UserProfile.objects.get(qr_code_data=clean_code)
-                    lookup_method = "qr_code_data"
-                    print(f"DEBUG: User found by qr_code_data - {profile.user.username}")
-                except UserProfile.DoesNotExist:
-                    pass
-            
-            if profile:
-                # Log successful verification
-                DeviceLog.objects.create(
-                    device=device,
-                    log_type='bottle_detected',  # Using existing log type
-                    message=f"User {profile.user.username} verified with student ID '{clean_code}' via {lookup_method}"
-                )
-                
-                return JsonResponse({
-                    'status': 'success',
-                    'message': f'User {profile.user.username} verified',
-                    'ok': True,
-                    'user': {
-                        'username': profile.user.username,
-                        'full_name': f"{profile.user.first_name} {profile.user.last_name}".strip(),
-                        'total_points': profile.total_points,
-                        'school_id': profile.school_id or clean_code
-                    },
-                    'lookup_method': lookup_method
-                })
-            
-            # No user found - provide comprehensive debugging info
-            print(f"DEBUG: No user found for student ID '{clean_code}'")
-            
-            # Get all existing student IDs and usernames for debugging
-            all_school_ids = list(UserProfile.objects.exclude(
-                school_id__isnull=True
-            ).exclude(
-                school_id=''
-            ).values_list('school_id', 'user__username'))
-            
-            all_usernames = list(User.objects.values_list('username', flat=True)[:20])  # Limit to 20
-            
-            print(f"DEBUG: All student IDs in database: {all_school_ids}")
-            print(f"DEBUG: Sample usernames: {all_usernames}")
-            
-            # Log failed verification with detailed info
-            DeviceLog.objects.create(
-                device=device,
-                log_type='error',
-                message=f"Failed verification: student ID '{clean_code}' not found. Available: {[sid for sid, _ in all_school_ids[:10]]}"
-            )
-            
-            return JsonResponse({
-                'status': 'error',
-                'message': f'Student ID not found: {clean_code}',
-                'ok': False,
-                'debug': {
-                    'received_school_id': clean_code,
-                    'original_input': code,
-                    'available_school_ids': [sid for sid, username in all_school_ids],
-                    'available_usernames': all_usernames,
-                    'total_users': UserProfile.objects.count(),
-                    'users_with_school_id': UserProfile.objects.exclude(school_id__isnull=True).exclude(school_id='').count()
-                }
-            })
+            return JsonResponse(verify_code(device, code, debug=request.GET.get('debug') in ('1', 'true', 'yes')))
                 
         except Exception as e:
             # Log error
             if device:
-                DeviceLog.objects.create(
+                log_queue.log(
                     device=device,
                     log_type='error',
                     message=f"User verification API Error: {str(e)}"
                 )
-            print(f"ERROR in api_user_verify: {str(e)}")
+            logger.exception("api_user_verify failed")
             return JsonResponse({'status': 'error', 'message': str(e), 'ok': False}, status=400)
     
     return JsonResponse({'status': 'error', 'message': 'Invalid request method.', 'ok': False}, status=405)
 
+
+# --- Async variants of the device API ---
+# Same protocol and responses as the views above, for ASGI deployments
+# (DEVICE_API_ASYNC routes the device URLs here). Only the device lookup
+# and replay-cache hits stay on the event loop; the work itself is the
+# same sync helpers the views above use, run through sync_to_async, so
+# the two variants can't drift apart and the loop never blocks on the
+# database or the log queue's fsync.
+
+async def authenticate_device_async(request):
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None
+    return await device_cache.aget_device(auth_header.split(' ')[1])
+
+@csrf_exempt
+async def api_device_heartbeat_async(request):
+    """Async api_device_heartbeat"""
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method.'}, status=405)
+    device = await authenticate_device_async(request)
+    if not device:
+        return JsonResponse({'status': 'error', 'message': 'Invalid API key.'}, status=401)
+    
+    try:
+        data = json.loads(request.body)
+        await sync_to_async(telemetry.record_heartbeat)(device, data.get('status', 'online'), data.get('sensor_data'))
+        return heartbeat_response()
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+@csrf_exempt
+async def api_bottle_detection_async(request):
+    """Async api_bottle_detection"""
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method.'}, status=405)
+    device = await authenticate_device_async(request)
+    if not device:
+        return JsonResponse({'status': 'error', 'message': 'Invalid API key.'}, status=401)
+    
+    try:
+        data = json.loads(request.body)
+        event_id = detection_events.clean_event_id(data.get('event_id'))
+        if event_id is None:
+            return detection_response(*await sync_to_async(process_detection)(device, data))
+        # A retry answered from this worker's replay cache never leaves the loop
+        hit = detection_events.cached(device.pk, event_id)
+        if hit is not None:
+            return detection_response(hit[1], hit[0], replayed=True)
+        return detection_response(*await sync_to_async(detection_events.run_once)(
+            device, event_id, lambda: process_detection(device, data)
+        ))
+    except Exception as e:
+        await log_queue.alog(device=device, log_type='error', message=f"API Error: {str(e)}")
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+@csrf_exempt
+async def api_device_error_async(request):
+    """Async api_device_error"""
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method.'}, status=405)
+    device = await authenticate_device_async(request)
+    if not device:
+        return JsonResponse({'status': 'error', 'message': 'Invalid API key.'}, status=401)
+    
+    try:
+        data = json.loads(request.body)
+        await sync_to_async(record_device_error)(device, data)
+        return JsonResponse({'status': 'success', 'message': 'Error logged'})
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+@csrf_exempt
+async def api_user_verify_async(request):
+    """Async api_user_verify"""
+    if request.method != 'GET':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method.', 'ok': False}, status=405)
+    device = await authenticate_device_async(request)
+    if not device:
+        return JsonResponse({'status': 'error', 'message': 'Invalid API key.', 'ok': False}, status=401)
+    
+    try:
+        code = request.GET.get('code')
+        if not code:
+            return JsonResponse({'status': 'error', 'message': 'No code provided.', 'ok': False}, status=400)
+        debug = request.GET.get('debug') in ('1', 'true', 'yes')
+        return JsonResponse(await sync_to_async(verify_code)(device, code, debug))
+    except Exception as e:
+        await log_queue.alog(device=device, log_type='error', message=f"User verification API Error: {str(e)}")
+        return JsonResponse({'status': 'error', 'message': str(e), 'ok': False}, status=400)
+
 @login_required
 def debug_qr_codes_view(request):
     """Debug view to see all user QR codes"""
@@ -1122,11 +1328,10 @@ def debug_qr_codes_view(request):
 
 @login_required
 def generate_qr_code_view(request):
-    """Generate barcode for the logged-in user's student ID"""
-    import barcode
-    from barcode.writer import ImageWriter
-    from io import BytesIO
+    """Generate barcode for the logged-in user's student ID (PNG, or SVG with ?format=svg)"""
     from django.http import HttpResponse
+    from django.utils.cache import get_conditional_response
+    from django.utils.http import http_date
     
     user_profile = request.user.profile
     school_id = user_profile.school_id
@@ -1134,32 +1339,31 @@ def generate_qr_code_view(request):
     if not school_id:
         return HttpResponse("No Student ID found", status=404)
     
-    # Remove hyphens for barcode (barcodes work better with alphanumeric without special chars)
-    barcode_data = school_id.replace('-', '')
+    fmt = 'svg' if request.GET.get('format') == 'svg' else 'png'
+    data = barcodes.barcode_data(school_id)
+    
+    # The ETag is a hash of the ID and render options, so a browser that already
+    # has this barcode gets a 304 without anything being rendered
+    etag = f'"{barcodes.cache_key(data, fmt, barcodes.DISPLAY_OPTIONS)}"'
+    cache_control = f'private, max-age={barcodes.BARCODE_MAX_AGE}'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        not_modified['Cache-Control'] = cache_control
+        return not_modified
     
-    # Generate Code128 barcode (supports alphanumeric)
+    # Generate Code128 barcode (supports alphanumeric), served from cache when possible
     try:
-        code128 = barcode.get_barcode_class('code128')
-        barcode_instance = code128(barcode_data, writer=ImageWriter())
-        
-        # Save to bytes
-        buffer = BytesIO()
-        barcode_instance.write(buffer, options={
-            'module_width': 0.3,
-            'module_height': 15.0,
-            'quiet_zone': 6.5,
-            'font_size': 12,
-            'text_distance': 5.0,
-            'write_text': True,
-        })
-        buffer.seek(0)
-        
-        # Return as image
-        response = HttpResponse(buffer, content_type='image/png')
-        response['Content-Disposition'] = f'inline; filename="{school_id}_barcode.png"'
-        return response
+        _, content, rendered_at = barcodes.get_barcode(data, fmt, barcodes.DISPLAY_OPTIONS)
     except Exception as e:
         return HttpResponse(f"Error generating barcode: {str(e)}", status=500)
+    
+    response = HttpResponse(content, content_type=barcodes.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'inline; filename="{school_id}_barcode.{fmt}"'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(rendered_at)
+    response['Cache-Control'] = cache_control
+    return response
 
 
 @login_required
@@ -1168,78 +1372,116 @@ def download_id_card_view(request, user_id):
     if not request.user.is_staff:
         return redirect('dashboard')
     
-    from PIL import Image, ImageDraw, ImageFont
-    import barcode
-    from barcode.writer import ImageWriter
-    from io import BytesIO
     from django.http import HttpResponse
     
     try:
-        user = User.objects.get(id=user_id)
-        profile = user.profile
-        school_id = profile.school_id or "NO-ID"
-        
-        # Create ID card image (1012 x 638 pixels)
-        width, height = 1012, 638
-        card = Image.new('RGB', (width, height), 'white')
-        draw = ImageDraw.Draw(card)
-        
-        # Draw blue header
-        draw.rectangle([(0, 0), (width, 150)], fill='#1e40af')
-        
-        # Add text
-        try:
-            title_font = ImageFont.truetype("arial.ttf", 40)
-            name_font = ImageFont.truetype("arial.ttf", 50)
-            info_font = ImageFont.truetype("arial.ttf", 30)
-        except:
-            title_font = ImageFont.load_default()
-            name_font = ImageFont.load_default()
-            info_font = ImageFont.load_default()
-        
-        # School name
-        draw.text((width//2, 50), "St. Michael's College", fill='white', font=title_font, anchor='mm')
-        draw.text((width//2, 100), "Iligan City", fill='white', font=info_font, anchor='mm')
-        
-        # Student name
-        full_name = f"{user.first_name} {user.last_name}".upper() or user.username.upper()
-        draw.text((width//2, 250), full_name, fill='#1e40af', font=name_font, anchor='mm')
-        
-        # Student ID
-        draw.text((width//2, 320), f"ID: {school_id}", fill='black', font=info_font, anchor='mm')
-        
-        # Generate barcode
-        barcode_data = school_id.replace('-', '')
-        code128 = barcode.get_barcode_class('code128')
-        barcode_instance = code128(barcode_data, writer=ImageWriter())
-        
-        barcode_buffer = BytesIO()
-        barcode_instance.write(barcode_buffer, options={
-            'module_width': 0.3,
-            'module_height': 10.0,
-            'quiet_zone': 3.0,
-            'font_size': 0,
-            'write_text': False,
-        })
-        barcode_buffer.seek(0)
-        
-        # Paste barcode
-        barcode_img = Image.open(barcode_buffer)
-        barcode_img = barcode_img.resize((600, 120))
-        card.paste(barcode_img, ((width - 600) // 2, 400))
-        
-        # Save to response
-        response_buffer = BytesIO()
-        card.save(response_buffer, format='PNG')
-        response_buffer.seek(0)
+        user = User.objects.select_related('profile').get(id=user_id)
+        full_name, school_id = id_cards.card_fields(
+            user.first_name, user.last_name, user.username, user.profile.school_id
+        )
+        card_png = id_cards.render_card(full_name, school_id)
         
-        response = HttpResponse(response_buffer, content_type='image/png')
+        response = HttpResponse(card_png, content_type='image/png')
         response['Content-Disposition'] = f'attachment; filename="{school_id}_ID_Card.png"'
         return response
         
     except Exception as e:
         return HttpResponse(f"Error: {str(e)}", status=500)
 
+
+@login_required
+def admin_user_import_view(request):
+    """Bulk enrollment from an uploaded CSV (validate first, then import)"""
+    import io
+    from django.http import HttpResponse
+    
+    if not request.user.is_staff:
+        return redirect('dashboard')
+    
+    result = None
+    dry_run = True
+    if request.method == 'POST' and request.FILES.get('csv_file'):
+        dry_run = request.POST.get('dry_run') == 'on'
+        try:
+            csv_text = io.TextIOWrapper(request.FILES['csv_file'].file, encoding='utf-8-sig', newline='')
+            result = enrollment.import_csv(
+                csv_text,
+                dry_run=dry_run,
+                default_password=request.POST.get('default_password', ''),
+                # Hashed in this process: no process pool inside a web request
+                workers=1,
+            )
+        except UnicodeDecodeError:
+            messages.error(request, 'The file is not UTF-8 encoded CSV.')
+        else:
+            if result.errors:
+                if request.POST.get('report') == '1':
+                    response = HttpResponse(result.error_report(), content_type='text/csv')
+                    response['Content-Disposition'] = 'attachment; filename="import-errors.csv"'
+                    return response
+                messages.error(request, f'{len(result.errors)} problem(s) found; nothing was imported.')
+            elif dry_run:
+                messages.success(request, f'{len(result.rows)} row(s) are valid. Untick "Only validate" to import them.')
+            else:
+                messages.success(request, f'Imported {result.created} user(s); {result.allocated_ids} ID(s) allocated automatically.')
+    
+    return render(request, 'core/admin_user_import.html', {
+        'result': result,
+        'dry_run': dry_run,
+        'errors': result.errors[:200] if result else [],
+        'columns': enrollment.COLUMNS,
+    })
+
+
+@login_required
+def admin_id_cards_view(request):
+    """Bulk ID cards for a filtered set of users, streamed as a ZIP"""
+    if not request.user.is_staff:
+        return redirect('dashboard')
+    
+    role = request.GET.get('role', 'student')
+    search = request.GET.get('q', '').strip()
+    missing_id = request.GET.get('missing_id') == 'on'
+    sheets = request.GET.get('sheets') == 'on'
+    
+    users = User.objects.filter(profile__isnull=False)
+    if role in dict(UserProfile.USER_TYPE_CHOICES):
+        users = users.filter(profile__user_type=role)
+    if search:
+        users = users.filter(
+            models.Q(username__icontains=search) |
+            models.Q(first_name__icontains=search) |
+            models.Q(last_name__icontains=search) |
+            models.Q(profile__school_id__istartswith=search)
+        )
+    if not missing_id:
+        users = users.exclude(profile__school_id__isnull=True).exclude(profile__school_id='')
+    
+    user_count = users.count()
+    too_many = user_count > id_cards.ID_CARD_WEB_MAX
+    if request.GET.get('download') == '1' and not too_many:
+        cards = id_cards.cards_for(users)
+        # Rendered in this process: a spawned pool per request costs more than it
+        # saves at this size, and would outlive a client that gave up
+        response = StreamingHttpResponse(
+            id_cards.iter_zip(cards, workers=1, sheets=sheets),
+            content_type='application/zip'
+        )
+        response['Content-Disposition'] = 'attachment; filename="ecodrop-id-cards.zip"'
+        return response
+    
+    return render(request, 'core/admin_id_cards.html', {
+        'role': role,
+        'search': search,
+        'missing_id': missing_id,
+        'sheets': sheets,
+        'roles': UserProfile.USER_TYPE_CHOICES,
+        'user_count': user_count,
+        'too_many': too_many,
+        'web_max': id_cards.ID_CARD_WEB_MAX,
+        'preview': users.select_related('profile').order_by('profile__school_id', 'id')[:20],
+    })
+
 # Legacy API endpoint (kept for backward compatibility)
 @csrf_exempt
 def api_deposit_view(request):
@@ -1250,16 +1492,9 @@ def api_deposit_view(request):
             bottles = data.get('bottles', 1)
             
             profile = UserProfile.objects.get(qr_code_data=user_id)
-            points_earned = bottles * 10
-            
-            profile.total_points += points_earned
-            profile.save()
+            points_earned = bottles * POINTS_PER_BOTTLE
             
-            Entry.objects.create(
-                user_profile=profile,
-                no_bottle=bottles,
-                points=points_earned
-            )
+            ledger.award_points(profile, bottles=bottles, points=points_earned)
             
             return JsonResponse({'status': 'success', 'message': f'{points_earned} points added.'}, status=201)
 
@@ -59,6 +59,75 @@ CSRF_EXEMPT_URLS = [
     '/api/user/verify/',
 ]
 
+# Per-worker device API key cache (seconds). Saves/deletes invalidate immediately
+# in the worker that made them; other workers pick changes up within the TTL.
+DEVICE_KEY_CACHE_TTL = int(os.environ.get('DEVICE_KEY_CACHE_TTL', '60'))
+DEVICE_KEY_NEGATIVE_TTL = int(os.environ.get('DEVICE_KEY_NEGATIVE_TTL', '10'))
+
+# Max age (seconds) of the per-worker "did you mean" index used when a scan doesn't match
+SUGGESTION_INDEX_TTL = int(os.environ.get('SUGGESTION_INDEX_TTL', '300'))
+
+# Heartbeat sensor history is down-sampled into buckets of this many minutes
+HEARTBEAT_SAMPLE_MINUTES = int(os.environ.get('HEARTBEAT_SAMPLE_MINUTES', '15'))
+
+# Device log retention (python manage.py prune_device_logs): raw logs older than
+# this are rolled up into hourly summaries and deleted in chunks
+DEVICE_LOG_RETENTION_DAYS = int(os.environ.get('DEVICE_LOG_RETENTION_DAYS', '30'))
+SENSOR_SAMPLE_RETENTION_DAYS = int(os.environ.get('SENSOR_SAMPLE_RETENTION_DAYS', '90'))
+DEVICE_LOG_PRUNE_CHUNK_SIZE = int(os.environ.get('DEVICE_LOG_PRUNE_CHUNK_SIZE', '5000'))
+
+# Detections sent with an event_id are deduplicated: the response is stored for
+# DETECTION_EVENT_RETENTION_DAYS (pruned by prune_device_logs) and kept in a
+# per-worker replay cache for DETECTION_REPLAY_TTL seconds
+DETECTION_EVENT_RETENTION_DAYS = int(os.environ.get('DETECTION_EVENT_RETENTION_DAYS', '7'))
+DETECTION_REPLAY_TTL = int(os.environ.get('DETECTION_REPLAY_TTL', '600'))
+DETECTION_REPLAY_CACHE_SIZE = int(os.environ.get('DETECTION_REPLAY_CACHE_SIZE', '10000'))
+
+# Device API log rows can be appended to a local durable queue file and bulk-inserted
+# in the background (core/log_queue.py). The file has to be on a persistent disk -
+# Render and Railway containers lose their filesystem on every deploy - so the queue
+# is only on by default when DEVICE_LOG_QUEUE_PATH points at one; otherwise the rows
+# are inserted directly. DEVICE_LOG_QUEUE=True without a path uses BASE_DIR (development).
+# DEVICE_LOG_QUEUE_THREAD=False leaves draining to `python manage.py drain_device_logs`
+DEVICE_LOG_QUEUE = os.environ.get('DEVICE_LOG_QUEUE', str('DEVICE_LOG_QUEUE_PATH' in os.environ)) == 'True'
+DEVICE_LOG_QUEUE_PATH = os.environ.get('DEVICE_LOG_QUEUE_PATH') or str(BASE_DIR / 'device_log_queue.sqlite3')
+DEVICE_LOG_QUEUE_THREAD = os.environ.get('DEVICE_LOG_QUEUE_THREAD', 'True') == 'True'
+DEVICE_LOG_QUEUE_BATCH = int(os.environ.get('DEVICE_LOG_QUEUE_BATCH', '500'))
+DEVICE_LOG_QUEUE_INTERVAL = float(os.environ.get('DEVICE_LOG_QUEUE_INTERVAL', '1'))
+
+# Rendered barcode images: per-worker LRU size, optional shared disk tier, and
+# browser cache lifetime in seconds (after that the browser revalidates and gets a 304)
+BARCODE_CACHE_SIZE = int(os.environ.get('BARCODE_CACHE_SIZE', '512'))
+BARCODE_CACHE_DIR = os.environ.get('BARCODE_CACHE_DIR', '')
+BARCODE_MAX_AGE = int(os.environ.get('BARCODE_MAX_AGE', '3600'))
+
+# Worker processes for bulk ID card rendering (0 = one per CPU core)
+ID_CARD_WORKERS = int(os.environ.get('ID_CARD_WORKERS', '0'))
+# Most cards the admin console renders per download (larger sets: manage.py generate_id_cards)
+ID_CARD_WEB_MAX = int(os.environ.get('ID_CARD_WEB_MAX', '300'))
+
+# Receipt sequence numbers each worker reserves from the database at a time
+RECEIPT_BLOCK_SIZE = int(os.environ.get('RECEIPT_BLOCK_SIZE', '50'))
+
+# Worker processes for password hashing in bulk CSV imports (0 = one per CPU core)
+IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', '0'))
+
+# Seconds before each worker rebuilds its leaderboards from the database
+# (its own point changes are applied immediately)
+LEADERBOARD_TTL = int(os.environ.get('LEADERBOARD_TTL', '60'))
+
+# Request timing shown on /console/perf/ (per worker). Repeated SQL in one request
+# is flagged as N+1 from PERF_N_PLUS_ONE_THRESHOLD runs; PERF_EXPLAIN_MS > 0 stores
+# query plans for SELECTs slower than that many milliseconds
+PERF_MONITORING = os.environ.get('PERF_MONITORING', 'True') == 'True'
+PERF_N_PLUS_ONE_THRESHOLD = int(os.environ.get('PERF_N_PLUS_ONE_THRESHOLD', '5'))
+PERF_EXPLAIN_MS = int(os.environ.get('PERF_EXPLAIN_MS', '0'))
+
+# Serve the device API (heartbeat, detection, error, verify) with the async views.
+# Turn on when running under an ASGI server, e.g.
+#   gunicorn ecodrop_project.asgi:application -k uvicorn.workers.UvicornWorker
+DEVICE_API_ASYNC = os.environ.get('DEVICE_API_ASYNC', 'False') == 'True'
+
 
 # Application definition
 
@@ -78,8 +147,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Add WhiteNoise for static files
+    'core.middleware.WhiteNoiseMiddleware',  # WhiteNoise for static files (async-capable wrapper)
     'corsheaders.middleware.CorsMiddleware',  # CORS for device API - must be before CommonMiddleware
+    'core.perf.PerfMiddleware',  # Per-route latency/query stats for /console/perf/
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',